@@ -0,0 +1,275 @@
+"""
+Streaming swap-volume and sender aggregates over sliding time windows.
+
+Every match is folded into a WindowedAggregates as it's found: the coin
+amounts in its watched-token events are decoded once, and each window
+keeps a ring of time buckets plus running totals. A match is added to its
+bucket and to the totals; a bucket's counts are subtracted again when it
+slides out, so memory only depends on what happened inside the window.
+Windows slide on block time. Snapshots (matches, volume
+per token, top senders and top functions per window) are published as
+AggregateSnapshot events for the sinks and exposed as metrics.
+"""
+
+import heapq
+from collections import Counter, deque
+from datetime import datetime
+
+from metrics import WINDOW_MATCHES, WINDOW_VOLUME
+from watchlist import address_key
+
+# Window lengths in seconds, each kept in WINDOW_BUCKETS buckets
+AGGREGATE_WINDOWS = {"1m": 60, "15m": 900, "1h": 3600}
+WINDOW_BUCKETS = 60
+TOP_N = 5  # Senders and functions listed per window
+
+# Event type fragments that move coins out of / into an account
+WITHDRAW_MARKER = "Withdraw"
+DEPOSIT_MARKER = "Deposit"
+
+# Resources whose writes tell which coin a withdraw/deposit event moved
+COIN_STORE_PREFIX = "0x1::coin::CoinStore<"
+FUNGIBLE_STORE = "0x1::fungible_asset::FungibleStore"
+COIN_STORE_HANDLES = ("withdraw_events", "deposit_events")
+
+
+def _subtract(totals, part):
+    """totals -= part, dropping keys that reach zero"""
+    for key, value in part.items():
+        remaining = totals[key] - value
+        if remaining:
+            totals[key] = remaining
+        else:
+            del totals[key]
+
+
+def _handle_key(address, creation_number):
+    address = address_key(address)
+    try:
+        return f"{address}/{int(creation_number)}" if address is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _store_resource(change):
+    """(resource type, fields) of a CoinStore or FungibleStore write, else None"""
+    resource = change.get('data') if isinstance(change, dict) else None
+    if not isinstance(resource, dict) or not isinstance(resource.get('data'), dict):
+        return None
+    resource_type = resource.get('type') or ''
+    if resource_type == FUNGIBLE_STORE or (resource_type.startswith(COIN_STORE_PREFIX) and resource_type.endswith(">")):
+        return resource_type, resource['data']
+    return None
+
+
+def coin_store_changes(txn):
+    """The CoinStore and FungibleStore writes in a transaction's changes"""
+    return [change for change in txn.get('changes') or () if _store_resource(change) is not None]
+
+
+def coin_stores(txn):
+    """{key: coin} for the coin stores a transaction wrote
+
+    The withdraw/deposit event handles of a CoinStore<T> ("0xaddress/creation
+    number") map to the coin type T, and a FungibleStore's address to its
+    metadata address. Mainnet's coin and fungible asset events don't name
+    their coin, so this is what tells token_volumes which one moved.
+    """
+    stores = {}
+    for change in coin_store_changes(txn):
+        resource_type, fields = _store_resource(change)
+        if resource_type != FUNGIBLE_STORE:
+            for handle in COIN_STORE_HANDLES:
+                guid = ((fields.get(handle) or {}).get('guid') or {}).get('id') or {}
+                key = _handle_key(guid.get('addr'), guid.get('creation_num'))
+                if key is not None:
+                    stores[key] = resource_type[len(COIN_STORE_PREFIX):-1]
+        else:
+            key = address_key(change.get('address'))
+            metadata = (fields.get('metadata') or {}).get('inner')
+            if key is not None and metadata:
+                stores[key] = metadata
+    return stores
+
+
+def event_coin(event, stores):
+    """The coin type (or fungible asset metadata address) a withdraw/deposit event moved, or None"""
+    data = event.get('data')
+    if isinstance(data, dict):
+        if isinstance(data.get('coin_type'), str):
+            # 0x1::coin::CoinWithdraw / CoinDeposit name it
+            return data['coin_type']
+        if data.get('store'):
+            # 0x1::fungible_asset::Withdraw / Deposit only name the store
+            return stores.get(address_key(data['store']))
+    # Legacy 0x1::coin::WithdrawEvent / DepositEvent come from a CoinStore<T> handle
+    guid = event.get('guid') or {}
+    return stores.get(_handle_key(guid.get('account_address'), guid.get('creation_number')))
+
+
+def token_volumes(cash_txn_info, watchlist):
+    """{label: raw amount} moved by a match, from its watched-token withdraw/deposit events
+
+    An event's token comes from its type when that names one, else from
+    event_coin and the match's `coin_stores`. A transfer or swap withdraws
+    and deposits the same coins, so a token's volume is the larger of the
+    two sides rather than their sum.
+    """
+    stores = cash_txn_info.get('coin_stores') or {}
+    withdrawn = Counter()
+    deposited = Counter()
+    for event in cash_txn_info.get('events', ()):
+        event_type = event.get('type', '')
+        side = withdrawn if WITHDRAW_MARKER in event_type else deposited if DEPOSIT_MARKER in event_type else None
+        if side is None:
+            continue
+        data = event.get('data')
+        try:
+            amount = int(data['amount'])
+        except (KeyError, TypeError, ValueError):
+            continue
+        labels = watchlist.tokens_in(event_type)
+        if not labels:
+            coin = event_coin(event, stores)
+            labels = watchlist.coin_labels(coin) if coin else ()
+        for label in labels:
+            side[label] += amount
+    return {label: max(withdrawn[label], deposited[label]) for label in withdrawn.keys() | deposited.keys()}
+
+
+class Bucket:
+    """Aggregates of the matches in one slice of a window"""
+
+    __slots__ = ("start", "matches", "volume", "sender_matches", "sender_volume", "functions")
+
+    def __init__(self, start):
+        self.start = start
+        self.matches = 0
+        self.volume = Counter()  # label -> amount
+        self.sender_matches = Counter()  # sender -> matches
+        self.sender_volume = Counter()  # (sender, label) -> amount
+        self.functions = Counter()  # entry function -> matches
+
+
+class SlidingWindow:
+    """Running totals over the last `length` seconds, kept as a ring of buckets"""
+
+    def __init__(self, name, length, buckets=WINDOW_BUCKETS):
+        self.name = name
+        self.length = length
+        self.bucket_seconds = length / buckets
+        self.buckets = deque()
+        self.end = None  # Newest time the window has slid to (seconds)
+        self.late = 0  # Matches older than the window when they arrived
+        self.totals = Bucket(None)
+
+    def advance(self, now):
+        """Slide the window's end to `now` (seconds), dropping buckets that fall out"""
+        self.end = now if self.end is None else max(self.end, now)
+        horizon = self.end - self.length
+        while self.buckets and self.buckets[0].start + self.bucket_seconds <= horizon:
+            expired = self.buckets.popleft()
+            totals = self.totals
+            totals.matches -= expired.matches
+            _subtract(totals.volume, expired.volume)
+            _subtract(totals.sender_matches, expired.sender_matches)
+            _subtract(totals.sender_volume, expired.sender_volume)
+            _subtract(totals.functions, expired.functions)
+
+    def _bucket(self, start):
+        if not self.buckets or self.buckets[-1].start < start:
+            self.buckets.append(Bucket(start))
+            return self.buckets[-1]
+        # Matches arrive nearly in order; a retried version can land a few buckets back
+        index = len(self.buckets)
+        while index > 0 and self.buckets[index - 1].start >= start:
+            index -= 1
+            if self.buckets[index].start == start:
+                return self.buckets[index]
+        bucket = Bucket(start)
+        self.buckets.insert(index, bucket)
+        return bucket
+
+    def add(self, at, sender, volumes, function):
+        start = at - at % self.bucket_seconds
+        if self.end is not None and start + self.bucket_seconds <= self.end - self.length:
+            # Already slid out of the window
+            self.late += 1
+            return
+        bucket = self._bucket(start)
+        for part in (bucket, self.totals):
+            part.matches += 1
+            part.sender_matches[sender] += 1
+            if function:
+                part.functions[function] += 1
+            for label, amount in volumes.items():
+                part.volume[label] += amount
+                part.sender_volume[sender, label] += amount
+
+    def summary(self):
+        end = self.end
+        totals = self.totals
+        top_senders = heapq.nlargest(TOP_N, totals.sender_matches.items(), key=lambda item: item[1])
+        return {
+            "window": self.name,
+            "start": datetime.fromtimestamp(end - self.length).isoformat(timespec="seconds"),
+            "end": datetime.fromtimestamp(end).isoformat(timespec="seconds"),
+            "matches": totals.matches,
+            "volume": dict(totals.volume),
+            "top_senders": [{"sender": sender, "matches": matches,
+                             "volume": {label: totals.sender_volume[sender, label] for label in totals.volume
+                                        if (sender, label) in totals.sender_volume}}
+                            for sender, matches in top_senders],
+            "top_functions": heapq.nlargest(TOP_N, totals.functions.items(), key=lambda item: item[1]),
+        }
+
+
+class WindowedAggregates:
+    """Per-window and per-sender aggregates of one scanner's matches"""
+
+    def __init__(self, watchlist, source, windows=AGGREGATE_WINDOWS):
+        self.watchlist = watchlist
+        self.source = source
+        self.windows = [SlidingWindow(name, length) for name, length in windows.items()]
+        self.latest = None  # Newest transaction time seen (seconds)
+        self._window_matches = {window.name: WINDOW_MATCHES.labels(source, window.name) for window in self.windows}
+
+    def add(self, cash_txn_info):
+        """Fold one match into every window"""
+        at = cash_txn_info['timestamp'].timestamp()
+        if self.latest is None or at > self.latest:
+            self.latest = at
+            for window in self.windows:
+                window.advance(at)
+        volumes = token_volumes(cash_txn_info, self.watchlist)
+        function = (cash_txn_info.get('payload') or {}).get('function')
+        for window in self.windows:
+            window.add(at, cash_txn_info.get('sender', 'unknown'), volumes, function)
+
+    def snapshot(self, now=None):
+        """One summary per window, ending at `now` (default: the newest match seen); updates the metrics"""
+        end = now if now is not None else self.latest
+        if end is None:
+            return []
+        summaries = []
+        for window in self.windows:
+            window.advance(end)
+            summary = window.summary()
+            self._window_matches[window.name].set(summary["matches"])
+            for label in self.watchlist.labels:
+                WINDOW_VOLUME.labels(self.source, window.name, label).set(summary["volume"].get(label, 0))
+            summaries.append(summary)
+        return summaries
+
+
+def describe_window(summary):
+    """One console line for a window summary"""
+    volume = ", ".join(f"{label} {amount:,}" for label, amount in summary["volume"].items()) or "no volume"
+    line = f"last {summary['window']}: {summary['matches']:,} matches, {volume}"
+    if summary["top_senders"]:
+        top = summary["top_senders"][0]
+        line += f", top sender {top['sender'][:12]}... ({top['matches']:,})"
+    if summary["top_functions"]:
+        function, count = summary["top_functions"][0]
+        line += f", top function {function} ({count:,})"
+    return line
@@ -0,0 +1,582 @@
+"""
+Decoder for BCS-encoded /v1/transactions pages (Accept: application/x-bcs).
+
+A BCS page is a Vec<TransactionOnChainData>: each transaction with its
+info, events and write set, in the node's binary canonical serialization.
+Scanning only needs to know which transactions mention a watched type tag,
+so transactions are decoded into light records holding just what the
+watchlist looks at: the transaction type, sender, event types and the
+payload's function and type arguments. Everything else is walked over
+without being built.
+
+Anything the decoder doesn't recognise raises BcsError, and the caller
+falls back to JSON for that page.
+"""
+
+import re
+
+BCS_CONTENT_TYPE = "application/x-bcs"
+
+ADDRESS_LENGTH = 32
+
+# Transaction enum variants, named like the JSON API's "type"
+TRANSACTION_TYPES = {
+    0: "user_transaction",
+    1: "genesis_transaction",
+    2: "block_metadata_transaction",
+    3: "state_checkpoint_transaction",
+    4: "validator_transaction",
+    5: "block_metadata_transaction",
+    6: "block_epilogue_transaction",
+}
+
+# TypeTag variants without fields
+_PRIMITIVE_TYPES = {0: "bool", 1: "u8", 2: "u64", 3: "u128", 4: "address", 5: "signer", 8: "u16", 9: "u32",
+                    10: "u256"}
+_PRIMITIVE_CODES = {name: code for code, name in _PRIMITIVE_TYPES.items()}
+
+
+class BcsError(ValueError):
+    """Bytes that aren't a BCS value of the expected shape"""
+
+
+def format_address(raw):
+    """32 address bytes written the way the node API does: special addresses short"""
+    value = int.from_bytes(raw, "big")
+    return f"0x{value:x}" if value < 16 else f"0x{value:064x}"
+
+
+class BcsReader:
+    """Reads BCS values from the front of a bytes buffer"""
+
+    __slots__ = ("buf", "pos")
+
+    def __init__(self, buf, pos=0):
+        self.buf = buf
+        self.pos = pos
+
+    def remaining(self):
+        return len(self.buf) - self.pos
+
+    def fixed(self, length):
+        end = self.pos + length
+        if end > len(self.buf):
+            raise BcsError(f"Truncated at byte {self.pos} (wanted {length} more)")
+        value = self.buf[self.pos:end]
+        self.pos = end
+        return value
+
+    def skip(self, length):
+        end = self.pos + length
+        if end > len(self.buf):
+            raise BcsError(f"Truncated at byte {self.pos} (wanted {length} more)")
+        self.pos = end
+
+    def uleb128(self):
+        buf = self.buf
+        pos = self.pos
+        if pos < len(buf) and buf[pos] < 0x80:
+            # Nearly every length and variant index fits in one byte
+            self.pos = pos + 1
+            return buf[pos]
+        value = shift = 0
+        while True:
+            if self.pos >= len(buf):
+                raise BcsError("Truncated ULEB128")
+            byte = buf[self.pos]
+            self.pos += 1
+            value |= (byte & 0x7F) << shift
+            if not byte & 0x80:
+                return value
+            shift += 7
+            if shift > 28:
+                # Lengths and variant indexes are u32
+                raise BcsError("ULEB128 overflows u32")
+
+    def u8(self):
+        if self.pos >= len(self.buf):
+            raise BcsError("Truncated u8")
+        self.pos += 1
+        return self.buf[self.pos - 1]
+
+    def uint(self, size):
+        return int.from_bytes(self.fixed(size), "little")
+
+    def u64(self):
+        return self.uint(8)
+
+    def bool(self):
+        value = self.u8()
+        if value > 1:
+            raise BcsError(f"Invalid bool {value}")
+        return value == 1
+
+    def bytes(self):
+        return self.fixed(self.uleb128())
+
+    def skip_bytes(self):
+        end = self.uleb128() + self.pos
+        if end > len(self.buf):
+            raise BcsError(f"Truncated at byte {self.pos} (wanted {end - self.pos} more)")
+        self.pos = end
+
+    def str(self):
+        try:
+            return self.bytes().decode()
+        except UnicodeDecodeError:
+            raise BcsError("Invalid UTF-8 string")
+
+    def address(self):
+        return format_address(self.fixed(ADDRESS_LENGTH))
+
+    def option(self, read):
+        flag = self.u8()
+        if flag == 0:
+            return None
+        if flag != 1:
+            raise BcsError(f"Invalid option tag {flag}")
+        return read()
+
+    def vec(self, read):
+        return [read() for _ in range(self.uleb128())]
+
+    def skip_vec(self, skip):
+        for _ in range(self.uleb128()):
+            skip()
+
+    def variant(self, known, what):
+        index = self.uleb128()
+        if index not in known:
+            raise BcsError(f"Unknown {what} variant {index}")
+        return index
+
+
+# --- Type tags -------------------------------------------------------------
+
+def read_type_tag(reader):
+    """A TypeTag as the node API writes it, e.g. 0x1::coin::CoinStore<0x1::aptos_coin::AptosCoin>"""
+    code = reader.uleb128()
+    name = _PRIMITIVE_TYPES.get(code)
+    if name is not None:
+        return name
+    if code == 6:
+        return f"vector<{read_type_tag(reader)}>"
+    if code == 7:
+        return read_struct_tag(reader)
+    if code == 11:
+        # Function type: |args| results has abilities
+        args = reader.vec(lambda: read_type_tag(reader))
+        results = reader.vec(lambda: read_type_tag(reader))
+        reader.u8()
+        return f"|{', '.join(args)}|{', '.join(results)}"
+    raise BcsError(f"Unknown type tag variant {code}")
+
+
+def read_struct_tag(reader):
+    address = reader.address()
+    module = reader.str()
+    name = reader.str()
+    type_args = reader.vec(lambda: read_type_tag(reader))
+    tag = f"{address}::{module}::{name}"
+    return f"{tag}<{', '.join(type_args)}>" if type_args else tag
+
+
+def _split_type_args(text):
+    """Top-level comma-separated type arguments"""
+    args, depth, start = [], 0, 0
+    for i, char in enumerate(text):
+        if char == "<":
+            depth += 1
+        elif char == ">":
+            depth -= 1
+        elif char == "," and depth == 0:
+            args.append(text[start:i].strip())
+            start = i + 1
+    args.append(text[start:].strip())
+    return [arg for arg in args if arg]
+
+
+def uleb128(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def encode_str(text):
+    raw = text.encode()
+    return uleb128(len(raw)) + raw
+
+
+def encode_address(text):
+    return int(text, 16).to_bytes(ADDRESS_LENGTH, "big")
+
+
+def encode_type_tag(text):
+    """BCS bytes of a type tag written as text (the inverse of read_type_tag)"""
+    text = text.strip()
+    code = _PRIMITIVE_CODES.get(text)
+    if code is not None:
+        return uleb128(code)
+    if text.startswith("vector<") and text.endswith(">"):
+        return uleb128(6) + encode_type_tag(text[len("vector<"):-1])
+    base, _, rest = text.partition("<")
+    parts = base.split("::")
+    if len(parts) != 3:
+        raise ValueError(f"Invalid type tag {text!r}")
+    type_args = _split_type_args(rest[:-1]) if rest else []
+    return (uleb128(7) + encode_address(parts[0]) + encode_str(parts[1]) + encode_str(parts[2])
+            + uleb128(len(type_args)) + b"".join(encode_type_tag(arg) for arg in type_args))
+
+
+def module_prefixes(tag):
+    """BCS bytes every encoding of `tag` contains: address + module name of each struct in it
+
+    Every struct inside a type tag must be present for the tag to match, so
+    any one of these is a necessary condition; they're listed most specific
+    (non-special address) first.
+    """
+    prefixes = []
+    for match in re.finditer(r"(0x[0-9a-fA-F]+)::(\w+)::", tag):
+        prefix = encode_address(match.group(1)) + encode_str(match.group(2))
+        if prefix not in prefixes:
+            prefixes.append(prefix)
+    return sorted(prefixes, key=lambda prefix: int.from_bytes(prefix[:ADDRESS_LENGTH], "big") < 16)
+
+
+# --- Skipping the parts nobody looks at ------------------------------------
+
+def _skip_u64(reader):
+    reader.skip(8)
+
+
+def _skip_address(reader):
+    reader.skip(ADDRESS_LENGTH)
+
+
+def _skip_type_tag(reader):
+    read_type_tag(reader)
+
+
+def _skip_module_id(reader):
+    reader.skip(ADDRESS_LENGTH)
+    reader.skip_bytes()
+
+
+def _skip_any_public_key(reader):
+    variant = reader.variant((0, 1, 2, 3, 4, 5), "AnyPublicKey")
+    if variant == 3:
+        _skip_keyless_public_key(reader)
+    elif variant == 4:
+        reader.skip(ADDRESS_LENGTH)  # JWK address
+        _skip_keyless_public_key(reader)
+    else:
+        reader.skip_bytes()
+
+
+def _skip_keyless_public_key(reader):
+    reader.skip_bytes()  # iss
+    reader.skip_bytes()  # identity commitment
+
+
+def _skip_webauthn(reader):
+    reader.variant((0,), "AssertionSignature")
+    reader.skip_bytes()  # signature
+    reader.skip_bytes()  # authenticator data
+    reader.skip_bytes()  # client data JSON
+
+
+def _skip_ephemeral_signature(reader):
+    if reader.variant((0, 1), "EphemeralSignature") == 0:
+        reader.skip_bytes()
+    else:
+        _skip_webauthn(reader)
+
+
+def _skip_keyless_signature(reader):
+    if reader.variant((0, 1), "EphemeralCertificate") == 0:
+        reader.variant((0,), "ZKP")
+        reader.skip(32 + 64 + 32)  # Groth16 proof: G1, G2, G1 points
+        reader.skip(8)  # expiry horizon
+        reader.option(reader.skip_bytes)  # extra field
+        reader.option(reader.skip_bytes)  # override aud
+        reader.option(lambda: _skip_ephemeral_signature(reader))  # training wheels signature
+    else:
+        reader.skip_bytes()  # JWT signature
+        reader.skip_bytes()  # JWT payload
+        reader.skip_bytes()  # uid key
+        reader.skip_bytes()  # blinder
+        reader.skip(31)  # pepper
+        reader.option(reader.skip_bytes)  # idc aud
+    reader.skip_bytes()  # JWT header
+    reader.skip(8)  # expiry
+    reader.variant((0, 1), "EphemeralPublicKey")
+    reader.skip_bytes()
+    _skip_ephemeral_signature(reader)
+
+
+def _skip_any_signature(reader):
+    variant = reader.variant((0, 1, 2, 3, 4), "AnySignature")
+    if variant == 2:
+        _skip_webauthn(reader)
+    elif variant == 3:
+        _skip_keyless_signature(reader)
+    else:
+        reader.skip_bytes()
+
+
+def _skip_account_authenticator(reader):
+    variant = reader.variant((0, 1, 2, 3, 4, 5), "AccountAuthenticator")
+    if variant in (0, 1):
+        reader.skip_bytes()  # public key
+        reader.skip_bytes()  # signature
+    elif variant == 2:
+        _skip_any_public_key(reader)
+        _skip_any_signature(reader)
+    elif variant == 3:
+        reader.skip_vec(lambda: _skip_any_public_key(reader))
+        reader.u8()  # signatures required
+        reader.skip_vec(lambda: _skip_any_signature(reader))
+        reader.skip_bytes()  # bitmap
+    elif variant == 5:
+        _skip_address(reader)  # function info
+        reader.skip_bytes()
+        reader.skip_bytes()
+        if reader.variant((0, 1), "AbstractionAuthData") == 0:
+            reader.skip_bytes()
+            reader.skip_bytes()
+        else:
+            reader.skip_bytes()
+            reader.skip_bytes()
+            reader.skip_bytes()
+
+
+def _skip_transaction_authenticator(reader):
+    variant = reader.variant((0, 1, 2, 3, 4), "TransactionAuthenticator")
+    if variant in (0, 1):
+        reader.skip_bytes()
+        reader.skip_bytes()
+    elif variant in (2, 3):
+        _skip_account_authenticator(reader)
+        reader.skip_vec(lambda: _skip_address(reader))
+        reader.skip_vec(lambda: _skip_account_authenticator(reader))
+        if variant == 3:
+            _skip_address(reader)  # fee payer
+            _skip_account_authenticator(reader)
+    else:
+        _skip_account_authenticator(reader)
+
+
+def _skip_transaction_argument(reader):
+    variant = reader.variant(range(10), "TransactionArgument")
+    if variant in (4, 9):
+        reader.skip_bytes()
+    else:
+        reader.skip({0: 1, 1: 8, 2: 16, 3: ADDRESS_LENGTH, 5: 1, 6: 2, 7: 4, 8: 32}[variant])
+
+
+def _skip_execution_status(reader):
+    variant = reader.variant((0, 1, 2, 3, 4), "ExecutionStatus")
+    if variant in (2, 3):
+        if reader.variant((0, 1), "AbortLocation") == 0:
+            _skip_module_id(reader)
+        if variant == 2:
+            reader.skip(8)  # code
+            if reader.option(lambda: True):
+                reader.skip_bytes()  # reason
+                reader.skip_bytes()  # description
+        else:
+            reader.skip(4)  # function, code offset
+    elif variant == 4:
+        reader.option(lambda: reader.skip(8))
+
+
+def _skip_transaction_info(reader):
+    reader.variant((0,), "TransactionInfo")
+    reader.skip(8)  # gas used
+    _skip_execution_status(reader)
+    reader.skip_bytes()  # transaction hash
+    reader.skip_bytes()  # event root hash
+    reader.skip_bytes()  # state change hash
+    reader.option(reader.skip_bytes)  # state checkpoint hash
+    reader.option(reader.skip_bytes)  # auxiliary info hash
+
+
+def _skip_write_op(reader):
+    variant = reader.variant((0, 1, 2, 3, 4, 5), "WriteOp")
+    if variant in (0, 1, 3, 4):
+        reader.skip_bytes()
+    if variant >= 3:
+        if reader.variant((0, 1), "StateValueMetadata") == 0:
+            reader.skip(16)
+        else:
+            reader.skip(24)
+
+
+def _skip_state_key(reader):
+    variant = reader.variant((0, 1, 2), "StateKey")
+    if variant in (0, 1):
+        reader.skip(ADDRESS_LENGTH)
+    reader.skip_bytes()
+
+
+def _skip_write_set(reader):
+    reader.variant((0,), "WriteSet")
+    for _ in range(reader.uleb128()):
+        _skip_state_key(reader)
+        _skip_write_op(reader)
+
+
+def _skip_block_metadata(reader, randomness=False):
+    reader.skip_bytes()  # id
+    reader.skip(16)  # epoch, round
+    reader.skip(ADDRESS_LENGTH)  # proposer
+    reader.skip_bytes()  # previous block votes
+    reader.skip_vec(lambda: reader.skip(4))  # failed proposer indices
+    reader.skip(8)  # timestamp
+    if randomness:
+        # Option<Randomness>: RandMetadata (epoch, round), then the seed
+        reader.option(lambda: (reader.skip(16), reader.skip_bytes()))
+
+
+def _skip_validator_transaction(reader):
+    if reader.variant((0, 1), "ValidatorTransaction") == 0:
+        reader.skip(8 + ADDRESS_LENGTH)  # DKG epoch, author
+        reader.skip_bytes()  # transcript
+    else:
+        reader.skip_bytes()  # issuer
+        reader.skip(8)  # version
+        for _ in range(reader.uleb128()):
+            reader.skip_bytes()  # JWK type name
+            reader.skip_bytes()  # JWK data
+        reader.skip_bytes()  # validator bitmask
+        reader.option(reader.skip_bytes)  # aggregate signature
+
+
+def _skip_block_epilogue(reader):
+    variant = reader.variant((0, 1), "BlockEpiloguePayload")
+    reader.skip_bytes()  # block id
+    reader.variant((0,), "BlockEndInfo")
+    reader.skip(1 + 1 + 8 + 8)
+    if variant == 1:
+        reader.variant((0,), "FeeDistribution")
+        reader.skip(reader.uleb128() * 16)
+
+
+# --- The parts the watchlist looks at --------------------------------------
+
+def _read_entry_function(reader, payload):
+    address = reader.address()
+    module = reader.str()
+    function = reader.str()
+    payload["function"] = f"{address}::{module}::{function}"
+    payload["type_arguments"] = reader.vec(lambda: read_type_tag(reader))
+    reader.skip_vec(reader.skip_bytes)
+
+
+def _read_script(reader, payload):
+    reader.skip_bytes()  # code
+    payload["type_arguments"] = reader.vec(lambda: read_type_tag(reader))
+    reader.skip_vec(lambda: _skip_transaction_argument(reader))
+
+
+def _read_payload(reader):
+    """A payload's function and type arguments, like the API's payload object"""
+    payload = {}
+    variant = reader.variant((0, 1, 2, 3, 4), "TransactionPayload")
+    if variant == 0:
+        payload["type"] = "script_payload"
+        _read_script(reader, payload)
+    elif variant == 1:
+        payload["type"] = "module_bundle_payload"
+        reader.skip(8)
+    elif variant == 2:
+        payload["type"] = "entry_function_payload"
+        _read_entry_function(reader, payload)
+    elif variant == 3:
+        # The inner entry function is lifted to the top, so it's checked like any other
+        payload["type"] = "multisig_payload"
+        reader.skip(ADDRESS_LENGTH)
+        if reader.option(lambda: reader.variant((0,), "MultisigTransactionPayload") is not None):
+            _read_entry_function(reader, payload)
+    else:
+        reader.variant((0,), "TransactionPayloadInner")
+        executable = reader.variant((0, 1, 2), "TransactionExecutable")
+        if executable == 0:
+            payload["type"] = "script_payload"
+            _read_script(reader, payload)
+        elif executable == 1:
+            payload["type"] = "entry_function_payload"
+            _read_entry_function(reader, payload)
+        reader.variant((0,), "TransactionExtraConfig")
+        reader.option(lambda: reader.skip(ADDRESS_LENGTH))
+        reader.option(lambda: reader.skip(8))
+    return payload
+
+
+def _read_event(reader):
+    if reader.variant((0, 1), "ContractEvent") == 0:
+        reader.skip(8 + ADDRESS_LENGTH + 8)  # key, sequence number
+    event = {"type": read_type_tag(reader)}
+    reader.skip_bytes()  # data
+    return event
+
+
+def read_transaction(reader):
+    """One TransactionOnChainData as a light record: version, type, sender, event types and payload"""
+    version = reader.u64()
+    variant = reader.variant(TRANSACTION_TYPES, "Transaction")
+    txn = {"version": str(version), "type": TRANSACTION_TYPES[variant]}
+    if variant == 0:
+        txn["sender"] = reader.address()
+        reader.skip(8)  # sequence number
+        txn["payload"] = _read_payload(reader)
+        reader.skip(8 + 8 + 8 + 1)  # max gas, gas price, expiration, chain id
+        _skip_transaction_authenticator(reader)
+    elif variant == 1:
+        if reader.variant((0, 1), "WriteSetPayload") == 0:
+            _skip_write_set(reader)
+            reader.skip_vec(lambda: _read_event(reader))
+        else:
+            reader.skip(ADDRESS_LENGTH)
+            _read_script(reader, {})
+    elif variant == 2:
+        _skip_block_metadata(reader)
+    elif variant == 3:
+        reader.skip_bytes()
+    elif variant == 4:
+        _skip_validator_transaction(reader)
+    elif variant == 5:
+        _skip_block_metadata(reader, randomness=reader.variant((0, 1), "BlockMetadataExt") == 1)
+    else:
+        _skip_block_epilogue(reader)
+    _skip_transaction_info(reader)
+    txn["events"] = reader.vec(lambda: _read_event(reader))
+    reader.skip_bytes()  # accumulator root hash
+    _skip_write_set(reader)
+    return txn
+
+
+def page_length(raw):
+    """How many transactions a BCS page holds, read from its length prefix alone"""
+    return BcsReader(raw).uleb128()
+
+
+def decode_page(raw, start_version):
+    """Every transaction in a BCS page as a light record, checking they run consecutively from `start_version`"""
+    reader = BcsReader(raw)
+    txns = []
+    for expected_version in range(start_version, start_version + reader.uleb128()):
+        start = reader.pos
+        txn = read_transaction(reader)
+        if txn["version"] != str(expected_version):
+            raise BcsError(f"Expected version {expected_version} at byte {start}, got {txn['version']}")
+        txns.append(txn)
+    if reader.remaining():
+        raise BcsError(f"{reader.remaining()} trailing bytes after {len(txns)} transactions")
+    return txns
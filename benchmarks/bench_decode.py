@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: decode + classification CPU per 100k transactions, before
+and after the raw-bytes prefilter.
+
+"Before" decodes every page the way the scanners used to (bytes -> str ->
+json.loads) and walks every transaction with is_cash_related_transaction.
+"After" splits pages on raw bytes and only decodes candidates. With
+--watchlist-sizes, "after" is repeated with CASH plus made-up tokens, to
+check that a long watchlist costs about the same as CASH alone. With
+--workers, pages are also pushed through a ClassifierPool of each size and
+timed by the wall clock, to see how far classification scales with cores.
+
+    python benchmarks/bench_decode.py --transactions 100000 --density 0.001
+    python benchmarks/bench_decode.py --watchlist-sizes 1,10,50,200
+    python benchmarks/bench_decode.py --workers 1,2,4,8
+"""
+
+import argparse
+import asyncio
+import functools
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import prefilter
+from classifier_pool import ClassifierPool
+from historical_cash_scanner import CASH_TOKEN_TYPE, WATCHLIST, is_cash_related_transaction
+from prefilter import Prefilter, split_page
+from watchlist import Watchlist
+
+PAGE_SIZE = 100
+
+
+def synthetic_transaction(version, is_cash, rng):
+    """A user transaction shaped like a mainnet response (version first, compact)"""
+    coin = CASH_TOKEN_TYPE if is_cash else "0x1::aptos_coin::AptosCoin"
+    address = "0x%064x" % rng.getrandbits(256)
+    return {
+        "version": str(version),
+        "hash": "0x%064x" % rng.getrandbits(256),
+        "state_change_hash": "0x%064x" % rng.getrandbits(256),
+        "event_root_hash": "0x%064x" % rng.getrandbits(256),
+        "state_checkpoint_hash": None,
+        "gas_used": str(rng.randint(5, 2000)),
+        "success": True,
+        "vm_status": "Executed successfully",
+        "accumulator_root_hash": "0x%064x" % rng.getrandbits(256),
+        "changes": [
+            {
+                "address": address,
+                "state_key_hash": "0x%064x" % rng.getrandbits(256),
+                "data": {"type": "0x1::coin::CoinStore<0x1::aptos_coin::AptosCoin>",
+                         "data": {"coin": {"value": str(rng.getrandbits(40))}, "frozen": False}},
+                "type": "write_resource",
+            }
+            for _ in range(rng.randint(2, 8))
+        ],
+        "sender": address,
+        "sequence_number": str(rng.randint(0, 10 ** 6)),
+        "max_gas_amount": "200000",
+        "gas_unit_price": "100",
+        "expiration_timestamp_secs": str(1700000000 + version),
+        "payload": {
+            "function": "0x1::aptos_account::transfer_coins",
+            "type_arguments": [coin],
+            "arguments": [address, str(rng.getrandbits(32))],
+            "type": "entry_function_payload",
+        },
+        "signature": {"public_key": "0x%064x" % rng.getrandbits(256),
+                      "signature": "0x%0128x" % rng.getrandbits(512), "type": "ed25519_signature"},
+        "events": [
+            {"guid": {"creation_number": "3", "account_address": address}, "sequence_number": "7",
+             "type": f"0x1::coin::WithdrawEvent<{coin}>" if is_cash else "0x1::coin::WithdrawEvent",
+             "data": {"amount": str(rng.getrandbits(32))}},
+            {"guid": {"creation_number": "2", "account_address": address}, "sequence_number": "9",
+             "type": "0x1::coin::DepositEvent", "data": {"amount": str(rng.getrandbits(32))}},
+        ],
+        "timestamp": str(1700000000000000 + version * 1000),
+        "type": "user_transaction",
+    }
+
+
+def build_pages(transactions, density, seed):
+    """Raw compact JSON pages, the way a node serves /v1/transactions"""
+    rng = random.Random(seed)
+    pages = []
+    for start in range(0, transactions, PAGE_SIZE):
+        page = [synthetic_transaction(v, rng.random() < density, rng)
+                for v in range(start, min(start + PAGE_SIZE, transactions))]
+        pages.append((start, json.dumps(page, separators=(",", ":")).encode()))
+    return pages
+
+
+def run_before(pages):
+    matches = 0
+    for start, raw in pages:
+        for txn in json.loads(raw.decode("utf-8")):
+            if is_cash_related_transaction(txn):
+                matches += 1
+    return matches
+
+
+def synthetic_watchlist(size, seed):
+    """CASH plus size - 1 made-up coin types that never appear in the pages"""
+    rng = random.Random(seed)
+    tokens = {"CASH": CASH_TOKEN_TYPE}
+    while len(tokens) < size:
+        tokens[f"TOKEN{len(tokens)}"] = "0x%064x::coin::T%d" % (rng.getrandbits(256), len(tokens))
+    return Watchlist(tokens)
+
+
+def run_after(pages, watchlist=WATCHLIST):
+    matches = 0
+    page_filter = Prefilter(watchlist.tags)
+    for start, raw in pages:
+        for txn in page_filter.decode_page(raw, split_page(raw, start)).values():
+            if watchlist.match(txn):
+                matches += 1
+    return matches
+
+
+def run_pool(pages, workers, in_flight_per_worker=4):
+    """(wall-clock seconds, main-process CPU seconds, matches) to classify every page through `workers` processes"""
+    async def run(pool):
+        # Spawning the workers and their imports aren't part of the steady state
+        await asyncio.gather(*(pool.decode_page(raw, start, start + PAGE_SIZE - 1) for start, raw in pages[:workers]))
+        slots = asyncio.Semaphore(workers * in_flight_per_worker)
+
+        async def classify(start, raw):
+            async with slots:
+                page = await pool.decode_page(raw, start, start + PAGE_SIZE - 1)
+            return sum(1 for txn in page.values() if WATCHLIST.match(txn))
+
+        started = time.perf_counter()
+        cpu_started = time.process_time()
+        matches = sum(await asyncio.gather(*(classify(start, raw) for start, raw in pages)))
+        return time.perf_counter() - started, time.process_time() - cpu_started, matches
+
+    pool = ClassifierPool(WATCHLIST, workers)
+    try:
+        return asyncio.run(run(pool))
+    finally:
+        pool.close()
+
+
+def measure(fn, pages, repeat):
+    """Best-of-`repeat` CPU seconds for one pass"""
+    best = None
+    for _ in range(repeat):
+        started = time.process_time()
+        matches = fn(pages)
+        elapsed = time.process_time() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, matches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Decode CPU per 100k transactions, before/after the prefilter")
+    parser.add_argument("--transactions", type=int, default=100000)
+    parser.add_argument("--density", type=float, default=0.001, help="Fraction of transactions touching CASH")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--watchlist-sizes", metavar="N,N,...",
+                        help="Also time the prefilter path with watchlists of these sizes")
+    parser.add_argument("--workers", metavar="N,N,...",
+                        help="Also time classification through process pools of these sizes (wall clock)")
+    args = parser.parse_args()
+
+    print(f"🔧 Building {args.transactions:,} synthetic transactions (CASH density {args.density:.3%})...")
+    pages = build_pages(args.transactions, args.density, args.seed)
+    total_mb = sum(len(raw) for _, raw in pages) / 1024 ** 2
+    print(f"📦 {len(pages):,} pages, {total_mb:.1f} MB of JSON")
+
+    before, before_matches = measure(run_before, pages, args.repeat)
+    after, after_matches = measure(run_after, pages, args.repeat)
+    assert before_matches == after_matches, "prefilter changed the classification result"
+
+    scale = 100000 / args.transactions
+    parser_name = "orjson" if prefilter.orjson is not None else "json"
+    print("=" * 60)
+    print(f"📊 Before (json.loads every page):       {before * scale:.3f} CPU s / 100k txns")
+    print(f"⚡ After (prefilter + {parser_name} candidates): {after * scale:.3f} CPU s / 100k txns")
+    print(f"🚀 Speedup: {before / after:.1f}x  ({before_matches} CASH matches in both)")
+
+    if args.watchlist_sizes:
+        print("=" * 60)
+        for size in (int(n) for n in args.watchlist_sizes.split(",")):
+            watchlist = synthetic_watchlist(size, args.seed)
+            elapsed, matches = measure(functools.partial(run_after, watchlist=watchlist), pages, args.repeat)
+            assert matches == after_matches, "the watchlist changed the classification result"
+            print(f"👀 {size:>4} watched tokens: {elapsed * scale:.3f} CPU s / 100k txns "
+                  f"({elapsed / after:.2f}x CASH alone)")
+
+    if args.workers:
+        print("=" * 60)
+        inline = after * scale
+        for workers in (int(n) for n in args.workers.split(",")):
+            elapsed, cpu, matches = run_pool(pages, workers)
+            assert matches == after_matches, "the classifier pool changed the classification result"
+            print(f"🧵 {workers:>3} worker processes: {elapsed * scale:.3f} wall s / 100k txns "
+                  f"({inline / (elapsed * scale):.2f}x the main thread alone), "
+                  f"{cpu * scale:.3f} CPU s / 100k txns left on the main thread")
+
+
+if __name__ == "__main__":
+    main()
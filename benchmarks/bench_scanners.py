@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+End-to-end scanner benchmarks against the fake Aptos node, fully offline.
+
+Each scenario starts benchmarks/fake_aptos_node.py in its own process (or
+several, one per node) with the scenario's ledger density, response
+latency, transaction size, 429 and stall behaviour, then drives the real
+scan_historical_cash_transactions or the realtime monitor loop against it
+from a fresh worker process (so peak RSS is per scenario). Results are written as a JSON report:
+
+  versions_per_s       versions classified per wall-clock second
+  request_p50/p99_s    node request latency (from the metrics histogram)
+  bytes_transferred    response bytes the node served (compressed, if it was)
+  peak_rss_mb          the scanner process's peak resident set
+  detection_p50/p99_s  block timestamp to alert (realtime scenarios)
+
+    python benchmarks/bench_scanners.py
+    python benchmarks/bench_scanners.py --scenario historical --compare benchmarks/results/scan-old.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+from datetime import datetime
+from multiprocessing import get_context
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import aiohttp
+
+import metrics
+import prefilter
+from historical_cash_scanner import scan_historical_cash_transactions
+from node_client import NodeClient
+from realtime_cash_monitor import monitor_realtime_cash_transactions
+from scan_events import CashTransactionFound, EventStream
+
+FAKE_NODE = os.path.join(ROOT, "benchmarks", "fake_aptos_node.py")
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+REGRESSION_THRESHOLD = 0.10  # Relative change flagged by --compare
+
+# Fake node options per scenario: head/density/payload_bytes shape the ledger,
+# latency_ms/throttle_rate/rate_limit/error_rate/stall_rate/stall_ms/compress/bcs
+# the node's behaviour and nodes how many of them run (default: 1). encoding is the
+# page encoding the scanner asks for (default: json); realtime scenarios hedge slow
+# pages and lookups to the other nodes unless hedge is False
+SCENARIOS = {
+    "historical": {"mode": "historical", "head": 20000, "density": 0.001},
+    "historical_dense": {"mode": "historical", "head": 20000, "density": 0.05},
+    "historical_slow_node": {"mode": "historical", "head": 20000, "density": 0.001, "latency_ms": 50,
+                             "payload_bytes": 2000},
+    "historical_throttled": {"mode": "historical", "head": 20000, "density": 0.001, "rate_limit": 20,
+                             "throttle_rate": 0.02},
+    "historical_flaky": {"mode": "historical", "head": 20000, "density": 0.001, "error_rate": 0.02},
+    "historical_gzip": {"mode": "historical", "head": 20000, "density": 0.001, "payload_bytes": 2000,
+                        "compress": True, "encoding": "json"},
+    "historical_bcs": {"mode": "historical", "head": 20000, "density": 0.001, "payload_bytes": 2000,
+                       "compress": True, "bcs": True, "encoding": "bcs"},
+    "realtime": {"mode": "realtime", "head": 100000, "density": 0.01, "duration": 15},
+    "realtime_stalls": {"mode": "realtime", "head": 100000, "density": 0.01, "duration": 15, "nodes": 2,
+                        "bcs": True, "encoding": "bcs", "stall_rate": 0.02, "stall_ms": 5000},
+    "realtime_stalls_unhedged": {"mode": "realtime", "head": 100000, "density": 0.01, "duration": 15, "nodes": 2,
+                                 "bcs": True, "encoding": "bcs", "stall_rate": 0.02, "stall_ms": 5000,
+                                 "hedge": False},
+}
+
+# Report fields compared by --compare, and whether bigger is better
+COMPARED_FIELDS = {"versions_per_s": True, "request_p99_s": False, "peak_rss_mb": False,
+                   "detection_p99_s": False}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_node(config):
+    """Launch the fake node for a scenario; returns (process, node_url)"""
+    port = free_port()
+    command = [sys.executable, FAKE_NODE, "--port", str(port), "--head", str(config["head"]),
+               "--density", str(config["density"]), "--latency", str(config.get("latency_ms", 0)),
+               "--payload-bytes", str(config.get("payload_bytes", 0)),
+               "--throttle-rate", str(config.get("throttle_rate", 0)),
+               "--error-rate", str(config.get("error_rate", 0)),
+               "--stall-rate", str(config.get("stall_rate", 0)), "--stall-ms", str(config.get("stall_ms", 0))]
+    if config.get("rate_limit"):
+        command += ["--rate-limit", str(config["rate_limit"])]
+    if config.get("compress"):
+        command.append("--compress")
+    if config.get("bcs"):
+        command.append("--bcs")
+    if config["mode"] == "realtime":
+        command.append("--live")
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+    return process, f"http://127.0.0.1:{port}"
+
+
+async def node_stats(node_url, wait=10.0):
+    """The fake node's /_stats, waiting for it to come up"""
+    deadline = time.monotonic() + wait
+    async with aiohttp.ClientSession() as session:
+        while True:
+            try:
+                async with session.get(f"{node_url}/_stats") as response:
+                    return await response.json()
+            except aiohttp.ClientError:
+                if time.monotonic() > deadline:
+                    raise
+                await asyncio.sleep(0.1)
+
+
+class DetectionCollector:
+    """Event sink that keeps every alert's detection latency"""
+
+    def __init__(self):
+        self.latencies = []
+
+    def emit(self, event):
+        if isinstance(event, CashTransactionFound) and event.latency is not None:
+            self.latencies.append(event.latency)
+
+    async def flush(self):
+        pass
+
+    async def close(self):
+        pass
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(fraction * len(values)))], 4)
+
+
+def rounded(seconds):
+    return None if seconds is None else round(seconds, 4)
+
+
+def sum_counter(metric):
+    return sum(child.value for child in metric.children.values())
+
+
+def merged_request_histogram():
+    """All nodes' request latencies as one histogram"""
+    merged = metrics._HistogramValue(metrics.NODE_REQUEST_SECONDS.buckets)
+    for child in metrics.NODE_REQUEST_SECONDS.children.values():
+        merged.counts = [a + b for a, b in zip(merged.counts, child.counts)]
+        merged.count += child.count
+        merged.sum += child.sum
+    return merged
+
+
+async def drive(name, config, workdir):
+    metrics.REGISTRY.reset()
+    collector = DetectionCollector()
+    events = EventStream([collector])
+    nodes = [start_node(config) for _ in range(config.get("nodes", 1))]
+    node_urls = [node_url for _, node_url in nodes]
+    try:
+        for node_url in node_urls:
+            await node_stats(node_url)
+        started = time.perf_counter()
+        cpu_started = time.process_time()
+        async with NodeClient(events=events, encoding=config.get("encoding", "json")) as client:
+            with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+                if config["mode"] == "historical":
+                    await scan_historical_cash_transactions(
+                        client, checkpoint_path=os.path.join(workdir, f"{name}.checkpoint"), store_path=None,
+                        healthy_nodes=node_urls, events=events, index_path=None)
+                else:
+                    monitor = asyncio.create_task(monitor_realtime_cash_transactions(
+                        client, store_path=None, working_node=node_urls[0], events=events, index_path=None,
+                        hedge_nodes=node_urls[1:] if config.get("hedge", True) else []))
+                    await asyncio.sleep(config["duration"])
+                    monitor.cancel()
+                    await asyncio.gather(monitor, return_exceptions=True)
+        elapsed = time.perf_counter() - started
+        cpu = time.process_time() - cpu_started
+        served = [await node_stats(node_url) for node_url in node_urls]
+    finally:
+        for process, _ in nodes:
+            process.terminate()
+            process.wait()
+
+    classified = sum_counter(metrics.VERSIONS_CLASSIFIED)
+    requests = merged_request_histogram()
+    report = {
+        "scenario": name,
+        "config": config,
+        "versions": classified,
+        "unfetched": sum_counter(metrics.VERSIONS_UNFETCHED),
+        "matches": sum_counter(metrics.MATCHES),
+        "elapsed_s": round(elapsed, 3),
+        "cpu_s": round(cpu, 3),
+        "versions_per_s": round(classified / elapsed, 1),
+        "requests": requests.count,
+        "request_p50_s": rounded(requests.quantile(0.5)),
+        "request_p99_s": rounded(requests.quantile(0.99)),
+        "throttled": sum(stats["throttled"] for stats in served),
+        "bytes_transferred": sum(stats["bytes"] for stats in served),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+    if config["mode"] == "realtime":
+        report["detection_p50_s"] = percentile(collector.latencies, 0.5)
+        report["detection_p99_s"] = percentile(collector.latencies, 0.99)
+    return report
+
+
+def run_scenario(name, config):
+    """Worker-process entry point: one scenario, one fresh process"""
+    with tempfile.TemporaryDirectory() as workdir:
+        return asyncio.run(drive(name, config, workdir))
+
+
+def compare(report, baseline_path):
+    """Print each compared field's change against a previous report"""
+    with open(baseline_path) as f:
+        baseline = {entry["scenario"]: entry for entry in json.load(f)["scenarios"]}
+    print(f"\n📐 Compared with {baseline_path}:")
+    regressions = 0
+    for entry in report["scenarios"]:
+        old = baseline.get(entry["scenario"])
+        if old is None:
+            continue
+        for field, higher_is_better in COMPARED_FIELDS.items():
+            before, after = old.get(field), entry.get(field)
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            worse = change < -REGRESSION_THRESHOLD if higher_is_better else change > REGRESSION_THRESHOLD
+            regressions += worse
+            print(f"  {'⚠️ ' if worse else '  '} {entry['scenario']:<22} {field:<16} "
+                  f"{before:>10.4g} → {after:<10.4g} ({change:+.1%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end scanner benchmarks against the fake node")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS),
+                        help="Scenario to run (repeatable; default: all)")
+    parser.add_argument("--out", help=f"Report path (default: {RESULTS_DIR}/scan-<timestamp>.json)")
+    parser.add_argument("--compare", metavar="REPORT", help="Previous report to compare against")
+    args = parser.parse_args()
+
+    report = {
+        "generated_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "json_parser": "orjson" if prefilter.orjson is not None else "json",
+        "scenarios": [],
+    }
+    for name in args.scenario or list(SCENARIOS):
+        print(f"🏁 {name}: {SCENARIOS[name]}")
+        with ProcessPoolExecutor(1, mp_context=get_context("spawn")) as pool:
+            result = pool.submit(run_scenario, name, SCENARIOS[name]).result()
+        report["scenarios"].append(result)
+        line = (f"   {result['versions_per_s']:,.0f} versions/s, request p50 {result['request_p50_s'] or 0:.3f}s / "
+                f"p99 {result['request_p99_s'] or 0:.3f}s, {result['bytes_transferred'] / 1024 ** 2:.1f} MB, "
+                f"{result['throttled']:,} × 429, peak RSS {result['peak_rss_mb']:.0f} MB")
+        if "detection_p99_s" in result and result["detection_p99_s"] is not None:
+            line += f", detection p99 {result['detection_p99_s']:.2f}s"
+        print(line)
+
+    out = args.out or os.path.join(RESULTS_DIR, f"scan-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"💾 Report written to {out}")
+
+    if args.compare and compare(report, args.compare):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,456 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for an Aptos fullnode REST API, serving a deterministic
+synthetic ledger with a configurable share of CASH transactions.
+
+Serves the endpoints the scanners use:
+  /v1
+  /v1/transactions?start=&limit=
+  /v1/transactions/by_version/{version}
+  /v1/blocks/by_height/{height}
+  /v1/blocks/by_version/{version}
+  /v1/accounts/{address}/transactions?start=&limit=
+  /v1/accounts/{address}/events/{event_handle}/{field_name}?start=&limit=
+
+Like on mainnet, only some CASH transactions touch the CASH publisher's
+account. Those are sent by the publisher and emit a withdraw event on its
+CoinStore, so the account-scoped endpoints see them. The rest
+(`third_party_share`) are DEX swaps and transfers between other accounts,
+which only a walk of the ledger finds.
+
+For benchmarks the node can add response latency, pad transactions to a
+given size, answer with HTTP 429 (at random or above a request rate),
+fail a share of requests with HTTP 500 and stall a share of transaction
+pages and single-version lookups for seconds before answering. It can also gzip responses and
+serve transaction pages as BCS (Accept: application/x-bcs), like a real
+fullnode. /_stats reports requests, bytes (as sent), 429s and 500s served.
+
+    python benchmarks/fake_aptos_node.py --port 8080 --head 200000
+    python benchmarks/fake_aptos_node.py --latency 40 --payload-bytes 2000 --rate-limit 200
+    python benchmarks/fake_aptos_node.py --compress --bcs
+    python benchmarks/fake_aptos_node.py --live --stall-rate 0.01 --stall-ms 5000
+"""
+
+import argparse
+import asyncio
+import bisect
+import gzip
+import json
+import os
+import random
+import sys
+import time
+
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bcs import BCS_CONTENT_TYPE, encode_address, encode_str, encode_type_tag, uleb128
+from historical_cash_scanner import CASH_TOKEN_TYPE
+from watchlist import paired_metadata_address
+
+CASH_PUBLISHER = CASH_TOKEN_TYPE.split("::")[0]
+CASH_COIN_STORE = f"0x1::coin::CoinStore<{CASH_TOKEN_TYPE}>"
+APTOS_COIN = "0x1::aptos_coin::AptosCoin"
+DEX_ADDRESS = "0x%064x" % 0xd3c5  # Publisher of the fake DEX the third-party swaps go through
+CASH_METADATA = "0x%064x" % int(paired_metadata_address(CASH_TOKEN_TYPE), 16)  # CASH as a fungible asset
+MODULE_EVENT_GUID = {"creation_number": "0", "account_address": "0x0"}  # How the API writes module events' guid
+THIRD_PARTY_SHARE = 0.5  # CASH transactions that never touch the publisher's account
+MAX_PAGE_SIZE = 100
+DEFAULT_PAGE_SIZE = 25
+TIMESTAMP_BASE = 1700000000000000  # Microseconds at version 0
+MICROS_PER_VERSION = 1000
+VERSIONS_PER_BLOCK = 10
+
+
+def compact_dumps(obj):
+    return json.dumps(obj, separators=(",", ":"))
+
+
+def _u64(value):
+    return int(value).to_bytes(8, "little")
+
+
+def _bcs_bytes(raw):
+    return uleb128(len(raw)) + raw
+
+
+def bcs_transaction(txn):
+    """A synthetic user transaction as BCS TransactionOnChainData"""
+    payload = txn["payload"]
+    address, module, function = payload["function"].split("::")
+    out = [_u64(txn["version"]), uleb128(0), encode_address(txn["sender"]), _u64(txn["sequence_number"]),
+           # Entry function payload
+           uleb128(2), encode_address(address), encode_str(module), encode_str(function),
+           uleb128(len(payload["type_arguments"])), *(encode_type_tag(arg) for arg in payload["type_arguments"]),
+           uleb128(2), _bcs_bytes(encode_address(txn["sender"])), _bcs_bytes(_u64(100)),
+           _u64(2000), _u64(100), _u64(int(txn["timestamp"]) // 1000000 + 600), bytes([1]),
+           # Ed25519 authenticator
+           uleb128(0), _bcs_bytes(bytes(32)), _bcs_bytes(bytes.fromhex(txn.get("signature", {}).get(
+               "signature", "0x" + "00" * 64)[2:])),
+           # TransactionInfo V0, executed successfully
+           uleb128(0), _u64(txn["gas_used"]), uleb128(0), _bcs_bytes(encode_address(txn["hash"])),
+           _bcs_bytes(bytes(32)), _bcs_bytes(encode_address(txn["state_change_hash"])), bytes([0, 0]),
+           uleb128(len(txn["events"]))]
+    for event in txn["events"]:
+        if event["guid"] == MODULE_EVENT_GUID:
+            out += [uleb128(1), encode_type_tag(event["type"]), _bcs_bytes(_u64(event["data"]["amount"]))]
+            continue
+        out += [uleb128(0), _u64(event["guid"]["creation_number"]), encode_address(event["guid"]["account_address"]),
+                _u64(event["sequence_number"]), encode_type_tag(event["type"]),
+                _bcs_bytes(_u64(event["data"]["amount"]))]
+    # Accumulator root hash, then a write set touching the sender's account
+    out += [_bcs_bytes(bytes(32)), uleb128(0), uleb128(1), uleb128(0), encode_address(txn["sender"]),
+            _bcs_bytes(b"\x01" + encode_type_tag("0x1::account::Account")), uleb128(1), _bcs_bytes(bytes(88))]
+    return b"".join(out)
+
+
+def coin_store_change(address, withdraw_number, deposit_number, coin_type=CASH_TOKEN_TYPE):
+    """A write to an account's CoinStore, whose event handles name the coin its events move"""
+    def handle(creation_number):
+        return {"counter": "1", "guid": {"id": {"addr": address, "creation_num": creation_number}}}
+
+    return {"address": address, "type": "write_resource",
+            "data": {"type": f"0x1::coin::CoinStore<{coin_type}>",
+                     "data": {"coin": {"value": "0"}, "frozen": False, "withdraw_events": handle(withdraw_number),
+                              "deposit_events": handle(deposit_number)}}}
+
+
+class FakeLedger:
+    """Deterministic synthetic ledger: the same seed always yields the same transactions"""
+
+    def __init__(self, head=100000, cash_density=0.001, seed=7, timestamp_base=TIMESTAMP_BASE, payload_bytes=0,
+                 third_party_share=THIRD_PARTY_SHARE):
+        self.head = head
+        self.cash_density = cash_density
+        self.seed = seed
+        self.timestamp_base = timestamp_base
+        self.padding = "0x" + "ab" * (payload_bytes // 2) if payload_bytes else None
+        self.third_party_share = third_party_share
+        self._cash_versions = []
+        self._publisher_versions = []
+        self._indexed_to = -1
+
+    def is_cash(self, version):
+        return random.Random(self.seed * 1000003 + version).random() < self.cash_density
+
+    def cash_kind(self, version):
+        """None for non-CASH versions, else the kind of CASH transaction: publisher, swap or transfer"""
+        if not self.is_cash(version):
+            return None
+        draw = random.Random(self.seed * 31337 + version).random()
+        if draw >= self.third_party_share:
+            return "publisher"
+        return "swap" if draw < self.third_party_share / 2 else "transfer"
+
+    def _index(self):
+        if self._indexed_to < self.head:
+            # Extend incrementally so a growing head only indexes the new versions
+            for version in range(self._indexed_to + 1, self.head + 1):
+                kind = self.cash_kind(version)
+                if kind is not None:
+                    self._cash_versions.append(version)
+                    if kind == "publisher":
+                        self._publisher_versions.append(version)
+            self._indexed_to = self.head
+
+    def cash_versions(self):
+        """Every CASH version up to the current head, in order"""
+        self._index()
+        return self._cash_versions
+
+    def publisher_versions(self):
+        """The CASH versions sent by the publisher (the ones its account indexes list), in order"""
+        self._index()
+        return self._publisher_versions
+
+    def timestamp(self, version):
+        """Block timestamp of a version, in microseconds"""
+        return self.timestamp_base + version * MICROS_PER_VERSION
+
+    def block(self, height):
+        """Block metadata, or None past the head; every block holds VERSIONS_PER_BLOCK versions"""
+        first_version = height * VERSIONS_PER_BLOCK
+        if height < 0 or first_version > self.head:
+            return None
+        return {"block_height": str(height), "block_hash": "0x%064x" % (self.seed * 999983 + height),
+                "block_timestamp": str(self.timestamp(first_version)), "first_version": str(first_version),
+                "last_version": str(min(first_version + VERSIONS_PER_BLOCK - 1, self.head)), "transactions": None}
+
+    def transaction(self, version):
+        """The transaction at a version, shaped like a mainnet response"""
+        rng = random.Random(self.seed * 7919 + version)
+        kind = self.cash_kind(version)
+        sender = CASH_PUBLISHER if kind == "publisher" else "0x%064x" % rng.getrandbits(256)
+        if kind == "publisher":
+            # The publisher's sequence number is its position among the versions it sent
+            sequence_number = bisect.bisect_left(self.publisher_versions(), version)
+        else:
+            sequence_number = rng.randint(0, 10 ** 6)
+        function = "0x1::aptos_account::transfer_coins"
+        type_arguments = [APTOS_COIN if kind is None else CASH_TOKEN_TYPE]
+        events = [{"guid": {"creation_number": "2", "account_address": sender}, "sequence_number": "0",
+                   "type": "0x1::coin::DepositEvent", "data": {"amount": str(rng.getrandbits(32))}}]
+        changes = []
+        # Like mainnet's, the coin and fungible asset events aren't generic: the CoinStore<T> behind an
+        # event handle, a coin_type field or the FungibleStore's metadata says which coin moved
+        if kind == "publisher":
+            events.append({"guid": {"creation_number": "3", "account_address": CASH_PUBLISHER},
+                           "sequence_number": str(sequence_number), "type": "0x1::coin::WithdrawEvent",
+                           "data": {"amount": str(rng.getrandbits(32))}})
+            changes.append(coin_store_change(CASH_PUBLISHER, withdraw_number="3", deposit_number="4"))
+        elif kind == "swap":
+            # A swap through the DEX from a migrated account: CASH moves as a fungible asset, and only
+            # shows up by name in the router call and the pool's event
+            function = f"{DEX_ADDRESS}::router::swap_exact_input"
+            type_arguments = [CASH_TOKEN_TYPE, APTOS_COIN]
+            store = "0x%064x" % rng.getrandbits(256)
+            events.append({"guid": MODULE_EVENT_GUID, "sequence_number": "0", "type": "0x1::fungible_asset::Withdraw",
+                           "data": {"store": store, "amount": str(rng.getrandbits(32))}})
+            events.append({"guid": {"creation_number": "4", "account_address": DEX_ADDRESS},
+                           "sequence_number": str(rng.randint(0, 10 ** 6)),
+                           "type": f"{DEX_ADDRESS}::swap::SwapEvent<{CASH_TOKEN_TYPE}, {APTOS_COIN}>",
+                           "data": {"amount": str(rng.getrandbits(32))}})
+            changes.append({"address": store, "type": "write_resource",
+                            "data": {"type": "0x1::fungible_asset::FungibleStore",
+                                     "data": {"balance": "0", "frozen": False, "metadata": {"inner": CASH_METADATA}}}})
+        elif kind == "transfer":
+            events.append({"guid": MODULE_EVENT_GUID, "sequence_number": "0", "type": "0x1::coin::CoinWithdraw",
+                           "data": {"coin_type": CASH_TOKEN_TYPE, "account": sender,
+                                    "amount": str(rng.getrandbits(32))}})
+        txn = {
+            "version": str(version),
+            "hash": "0x%064x" % (self.seed * 1000003 + version),
+            "state_change_hash": "0x%064x" % rng.getrandbits(256),
+            "gas_used": str(rng.randint(5, 2000)),
+            "success": True,
+            "vm_status": "Executed successfully",
+            "changes": changes,
+            "sender": sender,
+            "sequence_number": str(sequence_number),
+            "payload": {"function": function, "type_arguments": type_arguments,
+                        "arguments": [sender, "100"], "type": "entry_function_payload"},
+            "events": events,
+            "timestamp": str(self.timestamp(version)),
+            "type": "user_transaction",
+        }
+        if self.padding is not None:
+            # Stands in for signatures and write-set changes that make real transactions heavier
+            txn["signature"] = {"type": "ed25519_signature", "signature": self.padding}
+        return txn
+
+
+def _page_args(request):
+    start = request.query.get("start")
+    limit = min(int(request.query.get("limit", DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE)
+    return (int(start) if start is not None else None), limit
+
+
+def _latest_page(items, start, limit):
+    """Aptos semantics for sequence-numbered lists: no start means the latest page"""
+    if start is None:
+        start = max(0, len(items) - limit)
+    return items[start:start + limit]
+
+
+def make_app(ledger, latency=0.0, throttle_rate=0.0, rate_limit=None, error_rate=0.0, seed=7, compress=False,
+             bcs=False, stall_rate=0.0, stall=0.0):
+    """Build the aiohttp application serving `ledger`
+
+    `latency` (seconds, ±50% jitter) delays every response. A
+    `throttle_rate` share of requests get HTTP 429 at random, and with a
+    `rate_limit` (req/s) requests above that rate get 429 + Retry-After.
+    An `error_rate` share of requests fail with HTTP 500, and a
+    `stall_rate` share of transaction pages and by_version lookups hang
+    for `stall` seconds first. `compress` gzips responses for clients
+    that accept it, and `bcs` serves transaction pages as BCS to clients
+    that ask for it.
+    """
+    app = web.Application()
+    app["ledger"] = ledger
+    app["stats"] = stats = {"requests": 0, "bytes": 0, "throttled": 0, "errors": 0}
+    rng = random.Random(seed)
+    bucket = {"tokens": rate_limit or 0, "updated": time.monotonic()}
+
+    def respond(data, status=200):
+        return web.json_response(data, status=status, dumps=compact_dumps)
+
+    def over_rate_limit():
+        now = time.monotonic()
+        bucket["tokens"] = min(rate_limit, bucket["tokens"] + (now - bucket["updated"]) * rate_limit)
+        bucket["updated"] = now
+        if bucket["tokens"] < 1:
+            return True
+        bucket["tokens"] -= 1
+        return False
+
+    @web.middleware
+    async def count_requests(request, handler):
+        stats["requests"] += 1
+        if request.path == "/_stats":
+            return await handler(request)
+        if latency:
+            await asyncio.sleep(latency * (0.5 + rng.random()))
+        if stall_rate and request.path.startswith("/v1/transactions") and rng.random() < stall_rate:
+            await asyncio.sleep(stall)
+        if rate_limit and over_rate_limit():
+            stats["throttled"] += 1
+            return web.json_response({"error_code": "rate_limited"}, status=429, headers={"Retry-After": "1"})
+        if throttle_rate and rng.random() < throttle_rate:
+            stats["throttled"] += 1
+            return web.json_response({"error_code": "rate_limited"}, status=429)
+        if error_rate and rng.random() < error_rate:
+            stats["errors"] += 1
+            return web.json_response({"error_code": "internal_error"}, status=500)
+        response = await handler(request)
+        if compress and "gzip" in request.headers.get("Accept-Encoding", "") and response.body:
+            response = web.Response(body=gzip.compress(response.body, 6), status=response.status,
+                                    content_type=response.content_type, headers={"Content-Encoding": "gzip"})
+        stats["bytes"] += len(response.body or b"")
+        return response
+
+    app.middlewares.append(count_requests)
+
+    async def node_stats(request):
+        return respond(stats)
+
+    async def ledger_info(request):
+        return respond({"chain_id": 1, "epoch": "1", "ledger_version": str(ledger.head), "oldest_ledger_version": "0",
+                        "ledger_timestamp": str(ledger.timestamp(ledger.head)),
+                        "block_height": str(ledger.head // VERSIONS_PER_BLOCK), "oldest_block_height": "0"})
+
+    def block_response(height):
+        block = ledger.block(height)
+        if block is None:
+            return respond({"error_code": "block_not_found"}, status=404)
+        return respond(block)
+
+    async def block_by_height(request):
+        return block_response(int(request.match_info["height"]))
+
+    async def block_by_version(request):
+        return block_response(int(request.match_info["version"]) // VERSIONS_PER_BLOCK)
+
+    async def transactions(request):
+        start, limit = _page_args(request)
+        start = ledger.head - limit + 1 if start is None else start
+        txns = [ledger.transaction(v) for v in range(max(0, start), min(start + limit, ledger.head + 1))]
+        if bcs and BCS_CONTENT_TYPE in request.headers.get("Accept", ""):
+            return web.Response(body=uleb128(len(txns)) + b"".join(bcs_transaction(txn) for txn in txns),
+                                content_type=BCS_CONTENT_TYPE)
+        return respond(txns)
+
+    async def transaction_by_version(request):
+        version = int(request.match_info["version"])
+        if version > ledger.head:
+            return respond({"error_code": "transaction_not_found"}, status=404)
+        return respond(ledger.transaction(version))
+
+    async def account_transactions(request):
+        start, limit = _page_args(request)
+        address = request.match_info["address"]
+        versions = ledger.publisher_versions() if address == CASH_PUBLISHER else []
+        return respond([ledger.transaction(v) for v in _latest_page(versions, start, limit)])
+
+    async def account_events(request):
+        start, limit = _page_args(request)
+        address = request.match_info["address"]
+        handle = request.match_info["event_handle"]
+        field = request.match_info["field_name"]
+        if address != CASH_PUBLISHER or handle != CASH_COIN_STORE or field != "withdraw_events":
+            return respond([])
+        versions = ledger.publisher_versions()
+        first = start if start is not None else max(0, len(versions) - limit)
+        return respond([
+            {"version": str(v), "guid": {"creation_number": "3", "account_address": CASH_PUBLISHER},
+             "sequence_number": str(first + i), "type": "0x1::coin::WithdrawEvent",
+             "data": {"amount": "100"}}
+            for i, v in enumerate(_latest_page(versions, start, limit))
+        ])
+
+    app.router.add_get("/_stats", node_stats)
+    app.router.add_get("/v1", ledger_info)
+    app.router.add_get("/", ledger_info)
+    app.router.add_get("/v1/transactions", transactions)
+    app.router.add_get("/v1/transactions/by_version/{version}", transaction_by_version)
+    app.router.add_get("/v1/blocks/by_height/{height}", block_by_height)
+    app.router.add_get("/v1/blocks/by_version/{version}", block_by_version)
+    app.router.add_get("/v1/accounts/{address}/transactions", account_transactions)
+    app.router.add_get("/v1/accounts/{address}/events/{event_handle}/{field_name}", account_events)
+    return app
+
+
+def live_ledger(head=100000, cash_density=0.001, seed=7, payload_bytes=0, third_party_share=THIRD_PARTY_SHARE):
+    """A ledger whose head version is committed right now, for growing with advance_head"""
+    return FakeLedger(head, cash_density, seed, int(time.time() * 1000000) - head * MICROS_PER_VERSION,
+                      payload_bytes, third_party_share)
+
+
+async def advance_head(ledger, tick=0.1):
+    """Commit new versions in real time (one per MICROS_PER_VERSION), like a live chain"""
+    while True:
+        await asyncio.sleep(tick)
+        ledger.head = max(ledger.head, (int(time.time() * 1000000) - ledger.timestamp_base) // MICROS_PER_VERSION)
+
+
+async def start_fake_node(ledger, host="127.0.0.1", port=0, **faults):
+    """Start serving `ledger`; returns (runner, node_url). Call runner.cleanup() to stop
+
+    runner.app["stats"] counts the requests, bytes and 429s served.
+    `faults` are make_app's latency/throttle_rate/rate_limit/error_rate/compress/bcs/stall options.
+    """
+    runner = web.AppRunner(make_app(ledger, **faults))
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    port = runner.addresses[0][1]
+    return runner, f"http://{host}:{port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a synthetic Aptos ledger for offline scanner runs")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--head", type=int, default=100000, help="Latest ledger version")
+    parser.add_argument("--density", type=float, default=0.001, help="Fraction of CASH transactions")
+    parser.add_argument("--third-party-share", type=float, default=THIRD_PARTY_SHARE,
+                        help="Fraction of CASH transactions that don't touch the publisher's account")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--live", action="store_true",
+                        help=f"Keep committing versions in real time ({1000000 // MICROS_PER_VERSION:,}/s)")
+    parser.add_argument("--latency", type=float, default=0, help="Mean response latency in milliseconds")
+    parser.add_argument("--payload-bytes", type=int, default=0, help="Extra bytes of padding per transaction")
+    parser.add_argument("--throttle-rate", type=float, default=0, help="Fraction of requests answered with 429")
+    parser.add_argument("--rate-limit", type=float, help="Requests/s above which requests get 429 + Retry-After")
+    parser.add_argument("--error-rate", type=float, default=0, help="Fraction of requests failing with HTTP 500")
+    parser.add_argument("--stall-rate", type=float, default=0,
+                        help="Fraction of transaction pages and lookups that hang first")
+    parser.add_argument("--stall-ms", type=float, default=5000, help="How long a stalled request hangs")
+    parser.add_argument("--compress", action="store_true", help="Gzip responses for clients that accept it")
+    parser.add_argument("--bcs", action="store_true", help="Serve transaction pages as BCS when asked for")
+    args = parser.parse_args()
+
+    if args.live:
+        ledger = live_ledger(head=args.head, cash_density=args.density, seed=args.seed,
+                             payload_bytes=args.payload_bytes, third_party_share=args.third_party_share)
+    else:
+        ledger = FakeLedger(head=args.head, cash_density=args.density, seed=args.seed,
+                            payload_bytes=args.payload_bytes, third_party_share=args.third_party_share)
+    app = make_app(ledger, latency=args.latency / 1000, throttle_rate=args.throttle_rate,
+                   rate_limit=args.rate_limit, error_rate=args.error_rate, seed=args.seed, compress=args.compress,
+                   bcs=args.bcs, stall_rate=args.stall_rate, stall=args.stall_ms / 1000)
+    if args.live:
+        async def start_growing(app):
+            app["grower"] = asyncio.create_task(advance_head(ledger))
+
+        async def stop_growing(app):
+            app["grower"].cancel()
+
+        app.on_startup.append(start_growing)
+        app.on_cleanup.append(stop_growing)
+    print(f"🧪 Fake Aptos node on http://{args.host}:{args.port} (head {args.head:,})")
+    web.run_app(app, host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
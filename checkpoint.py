@@ -0,0 +1,194 @@
+"""
+Durable, append-only checkpoints for resumable historical scans.
+
+The checkpoint file is JSON lines. A "scan" record holds the scan bounds,
+"range" records hold completed version ranges and "match" records hold the
+CASH transactions found so far. New records are only ever appended; once
+the log grows past COMPACT_AFTER records it is rewritten with the ranges
+merged.
+"""
+
+import json
+import os
+import time
+from datetime import datetime
+
+CHECKPOINT_PATH = "historical_scan.checkpoint"
+FLUSH_INTERVAL = 5  # Seconds between durable writes
+FLUSH_VERSIONS = 10000  # ...or versions completed, whichever comes first
+COMPACT_AFTER = 1000  # Log records before the file is compacted
+
+
+def merge_ranges(ranges):
+    """Merge overlapping or adjacent [start, end] ranges into a sorted list"""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def intersect_ranges(ranges, others):
+    """The parts of sorted, disjoint [start, end] `ranges` that also fall inside `others`"""
+    overlap = []
+    for start, end in ranges:
+        for other_start, other_end in others:
+            if other_start <= end and other_end >= start:
+                overlap.append([max(start, other_start), min(end, other_end)])
+    return merge_ranges(overlap)
+
+
+def encode_match(cash_txn_info):
+    """Turn a cash_txn_info dict into a JSON-safe checkpoint record"""
+    record = dict(cash_txn_info)
+    record["timestamp"] = cash_txn_info["timestamp"].isoformat()
+    record["type"] = "match"
+    return record
+
+
+def decode_match(record):
+    """Turn a checkpoint match record back into a cash_txn_info dict"""
+    cash_txn_info = {key: value for key, value in record.items() if key != "type"}
+    cash_txn_info["timestamp"] = datetime.fromisoformat(record["timestamp"])
+    return cash_txn_info
+
+
+class ScanCheckpoint:
+    """Append-only progress log for one historical scan"""
+
+    def __init__(self, path=CHECKPOINT_PATH):
+        self.path = path
+        self.start_version = None
+        self.end_version = None
+        self.completed = []  # Merged [start, end] ranges already classified
+        self.matches = []
+        self._file = None
+        self._records = 0
+        self._compacted_records = 0
+        self._pending = []  # Encoded records waiting for the next flush
+        self._run_start = None  # Completed versions not yet written
+        self._run_end = None
+        self._last_flush = time.time()
+
+    def load(self):
+        """Read an existing checkpoint; returns False if there is nothing to resume"""
+        if not os.path.exists(self.path):
+            return False
+        ranges = []
+        with open(self.path, "r") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break  # Torn final write from a crash - everything before it is intact
+                self._records += 1
+                if record["type"] == "scan":
+                    self.start_version = record["start"]
+                    self.end_version = record["end"]
+                elif record["type"] == "range":
+                    ranges.append((record["start"], record["end"]))
+                elif record["type"] == "match":
+                    self.matches.append(decode_match(record))
+        self.completed = merge_ranges(ranges)
+        # A match only counts once its range is durable; anything else gets rescanned
+        matches = {}
+        for cash_txn_info in self.matches:
+            if self.is_completed(cash_txn_info["version"]):
+                matches[cash_txn_info["version"]] = cash_txn_info
+        self.matches = [matches[version] for version in sorted(matches)]
+        return self.start_version is not None
+
+    def start(self, start_version, end_version):
+        """Begin a fresh checkpoint for a new scan, replacing any old one"""
+        self.start_version = start_version
+        self.end_version = end_version
+        self.completed = []
+        self.matches = []
+        self._rewrite()
+
+    def resume(self):
+        """Reopen a loaded checkpoint for appending"""
+        self._rewrite()
+
+    def missing_ranges(self):
+        """Version ranges of the scan that are not yet completed"""
+        missing = []
+        next_version = self.start_version
+        for start, end in self.completed:
+            if start > next_version:
+                missing.append((next_version, min(start - 1, self.end_version)))
+            next_version = max(next_version, end + 1)
+        if next_version <= self.end_version:
+            missing.append((next_version, self.end_version))
+        return missing
+
+    def is_completed(self, version):
+        """Whether a version falls inside a completed range"""
+        return any(start <= version <= end for start, end in self.completed)
+
+    def completed_count(self):
+        """Number of versions already completed"""
+        return sum(end - start + 1 for start, end in self.completed)
+
+    def add_match(self, cash_txn_info):
+        """Queue a match; it is written before the range that covers it"""
+        self.matches.append(cash_txn_info)
+        self._pending.append(encode_match(cash_txn_info))
+
+    def mark_done(self, version):
+        """Record that a version has been fully processed"""
+        if self._run_end is not None and version == self._run_end + 1:
+            self._run_end = version
+        else:
+            self._close_run()
+            self._run_start = self._run_end = version
+        if (self._run_end - self._run_start + 1 >= FLUSH_VERSIONS
+                or time.time() - self._last_flush >= FLUSH_INTERVAL):
+            self.flush()
+
+    def flush(self):
+        """Durably append everything recorded since the last flush"""
+        self._close_run()
+        self._last_flush = time.time()
+        if not self._pending or self._file is None:
+            return
+        self._file.write("".join(json.dumps(record) + "\n" for record in self._pending))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._records += len(self._pending)
+        self._pending = []
+        if self._records - self._compacted_records >= COMPACT_AFTER:
+            self._rewrite()
+
+    def close(self):
+        """Flush and close the checkpoint file"""
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _close_run(self):
+        if self._run_start is None:
+            return
+        self._pending.append({"type": "range", "start": self._run_start, "end": self._run_end})
+        self.completed = merge_ranges(self.completed + [[self._run_start, self._run_end]])
+        self._run_start = self._run_end = None
+
+    def _rewrite(self):
+        """Compact the log to one record per merged range and match, atomically"""
+        if self._file is not None:
+            self._file.close()
+        tmp_path = self.path + ".tmp"
+        records = [{"type": "scan", "start": self.start_version, "end": self.end_version}]
+        records += [{"type": "range", "start": start, "end": end} for start, end in self.completed]
+        records += [encode_match(cash_txn_info) for cash_txn_info in self.matches]
+        with open(tmp_path, "w") as f:
+            f.write("".join(json.dumps(record) + "\n" for record in records))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self._records = self._compacted_records = len(records)
+        self._pending = []
+        self._file = open(self.path, "a")
@@ -0,0 +1,116 @@
+"""
+Multi-core classification stage for large historical backfills.
+
+Decoding and classifying every page on the event loop's thread caps a
+backfill at one core. A ClassifierPool moves that work to worker
+processes: each raw JSON page goes over as a single bytes object, is split,
+prefiltered, decoded and matched against the watchlist there, and only the
+page's version numbers plus slim copies of the matching transactions come
+back. Nothing is pickled per transaction except the matches. BCS pages are
+screened in the workers too, returning just the candidate versions.
+"""
+
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+
+from prefilter import Prefilter, skipped_transaction, split_page
+from watchlist import Watchlist
+
+DEFAULT_WORKERS = os.cpu_count() or 1
+
+# Fields of a matching transaction that the scanners keep (see build_cash_txn_info)
+MATCH_FIELDS = ("version", "type", "timestamp", "hash", "sender", "events", "payload", "changes")
+
+# Set in each worker process by _start_worker
+_watchlist = None
+_prefilter = None
+
+
+def _start_worker(tokens):
+    global _watchlist, _prefilter
+    _watchlist = Watchlist(tokens)
+    _prefilter = Prefilter(_watchlist.tags)
+
+
+def _classify_page(raw_page, start_version):
+    """Worker side: (versions in the page, {version: slim matching txn}, full decodes)"""
+    try:
+        items = split_page(raw_page, start_version)
+    except ValueError:
+        return [], {}, 0
+    decoded_before = _prefilter.decoded
+    matches = {}
+    for version, txn in _prefilter.decode_page(raw_page, items).items():
+        if _watchlist.match(txn):
+            matches[version] = {field: txn[field] for field in MATCH_FIELDS if field in txn}
+    return [version for version, _ in items], matches, _prefilter.decoded - decoded_before
+
+
+def _screen_bcs_page(raw_page, start_version):
+    """Worker side: (versions in a BCS page, candidate versions to fetch as JSON)"""
+    screened = _prefilter.screen_bcs_page(raw_page, start_version)
+    return list(screened), [version for version, txn in screened.items() if txn is None]
+
+
+class ClassifierPool:
+    """Decodes and classifies raw transaction pages in `workers` processes"""
+
+    def __init__(self, watchlist, workers=DEFAULT_WORKERS):
+        self.workers = workers
+        self.pages = 0
+        self.decoded = 0
+        self.skipped = 0
+        self.broken = False
+        # Spawned, not forked: the parent is running an event loop and a connection pool
+        self._executor = ProcessPoolExecutor(workers, mp_context=get_context("spawn"), initializer=_start_worker,
+                                             initargs=(watchlist.tokens,))
+
+    async def decode_page(self, raw_page, start_version, end_version):
+        """{version: txn} for the page's versions up to `end_version`: matches in full, the rest as stand-ins
+
+        Returns None if the pool has broken down, so the caller decodes the
+        page itself.
+        """
+        if self.broken:
+            return None
+        loop = asyncio.get_running_loop()
+        try:
+            versions, matches, decoded = await loop.run_in_executor(self._executor, _classify_page, raw_page,
+                                                                    start_version)
+        except BrokenProcessPool:
+            self._break()
+            return None
+        self.pages += 1
+        self.decoded += decoded
+        self.skipped += len(versions) - decoded
+        return {version: matches.get(version) or skipped_transaction(version)
+                for version in versions if start_version <= version <= end_version}
+
+    async def screen_bcs_page(self, raw_page, start_version):
+        """Prefilter.screen_bcs_page, run in a worker; None if the pool has broken down
+
+        Raises BcsError when the page can't be decoded.
+        """
+        if self.broken:
+            return None
+        loop = asyncio.get_running_loop()
+        try:
+            versions, candidates = await loop.run_in_executor(self._executor, _screen_bcs_page, raw_page,
+                                                              start_version)
+        except BrokenProcessPool:
+            self._break()
+            return None
+        self.pages += 1
+        self.skipped += len(versions) - len(candidates)
+        candidates = set(candidates)
+        return {version: None if version in candidates else skipped_transaction(version) for version in versions}
+
+    def _break(self):
+        self.broken = True
+        print("⚠️  Classifier worker process died, classifying on the main thread from now on")
+
+    def close(self):
+        self._executor.shutdown(cancel_futures=True)
@@ -0,0 +1,263 @@
+"""
+Account/event-indexed discovery of CASH transactions.
+
+Instead of fetching every version in a range, this engine asks the node's
+account-scoped indexes where CASH activity happened: transactions sent by
+each watched token's publisher and the coin-store events registered on its
+account. Only those versions are fetched and classified with the
+watchlist, producing cash_txn_info records shaped like
+scan_historical_cash_transactions'.
+
+Those indexes only see activity that touches the publishers' accounts.
+Swaps and transfers between other accounts never do, so discovery finds a
+subset of what a full scan finds; the summary says so, and --verify walks
+the whole range and lists exactly what discovery missed.
+"""
+
+import argparse
+import asyncio
+from urllib.parse import quote
+
+from historical_cash_scanner import DEFAULT_WATCHLIST, WATCHLIST, find_healthy_nodes, get_latest_version
+from match_records import build_cash_txn_info
+from node_client import NodeClient
+from node_scheduler import NodeBudget, iter_transactions_sharded
+from prefilter import Prefilter
+from transaction_fetcher import get_json, get_transaction
+from transaction_store import STORE_PATH, STORE_SLIM, TransactionStore
+from watchlist import build_watchlist
+
+# Extra accounts whose sent transactions are candidates, on top of every watched token's publisher
+DISCOVERY_ACCOUNTS = []
+
+# Extra (account, event handle struct, field) whose events point at candidates, on top of
+# the deposit/withdraw events on every watched token's CoinStore at its publisher
+DISCOVERY_EVENT_HANDLES = []
+
+INDEX_PAGE_SIZE = 100  # Aptos caps account transaction and event pages at 100
+FETCH_CONCURRENCY = 16  # Candidate transactions fetched at once
+DISCOVERY_WINDOW = 100000  # Versions covered by default, like the historical scan
+
+
+def discovery_sources(watchlist):
+    """(accounts, event handles) to walk for `watchlist`: its publishers, their CoinStores and the extras"""
+    accounts = []
+    handles = []
+    for tag in watchlist.tags:
+        publisher = tag.split("::")[0]
+        if publisher not in accounts:
+            accounts.append(publisher)
+        for field in ("deposit_events", "withdraw_events"):
+            handles.append((publisher, f"0x1::coin::CoinStore<{tag}>", field))
+    accounts += [address for address in DISCOVERY_ACCOUNTS if address not in accounts]
+    handles += [handle for handle in DISCOVERY_EVENT_HANDLES if handle not in handles]
+    return accounts, handles
+
+
+async def iter_index_newest_first(client, url, start_version):
+    """Walk a sequence-numbered account index from the newest entry backwards
+
+    Stops once entries fall below `start_version`. A page that can't be
+    fetched raises IOError, so callers can tell "no activity" from "unknown".
+    """
+    page = await get_json(client, url, {"limit": str(INDEX_PAGE_SIZE)})
+    if page is None:
+        raise IOError(f"index unavailable: {url}")
+    while page:
+        for entry in reversed(page):
+            yield entry
+        if int(page[0]["version"]) < start_version:
+            return
+        lowest = int(page[0]["sequence_number"])
+        if lowest == 0:
+            return
+        start = max(0, lowest - INDEX_PAGE_SIZE)
+        page = await get_json(client, url, {"start": str(start), "limit": str(lowest - start)})
+        if page is None:
+            raise IOError(f"index page failed: {url}?start={start}")
+
+
+async def discover_cash_versions(client, node_url, start_version, end_version, watchlist=WATCHLIST):
+    """Collect candidate versions in [start_version, end_version] from the account indexes
+
+    Returns ({version: txn or None}, failed_sources). Account transaction
+    entries are full transactions, so those come back already fetched.
+    """
+    candidates = {}
+    failed_sources = []
+
+    accounts, handles = discovery_sources(watchlist)
+    sources = [(f"{node_url}/v1/accounts/{address}/transactions", f"transactions sent by {address[:10]}...")
+               for address in accounts]
+    sources += [(f"{node_url}/v1/accounts/{address}/events/{quote(handle, safe='')}/{field}",
+                 f"{field} on {address[:10]}...")
+                for address, handle, field in handles]
+
+    for url, label in sources:
+        found = 0
+        try:
+            async for entry in iter_index_newest_first(client, url, start_version):
+                version = int(entry["version"])
+                if start_version <= version <= end_version:
+                    found += 1
+                    # Event entries aren't transactions; only keep full transaction bodies
+                    txn = entry if "events" in entry else None
+                    if candidates.get(version) is None:
+                        candidates[version] = txn
+                elif version < start_version:
+                    break
+        except (IOError, KeyError, TypeError, ValueError) as e:
+            failed_sources.append(label)
+            print(f"⚠️  Discovery source failed ({label}): {e}")
+            continue
+        print(f"  🔎 {label}: {found:,} candidate versions")
+
+    return candidates, failed_sources
+
+
+async def fetch_candidates(client, node_url, candidates):
+    """Fill in every candidate transaction that discovery didn't return in full"""
+    semaphore = asyncio.Semaphore(FETCH_CONCURRENCY)
+
+    async def fetch(version):
+        async with semaphore:
+            candidates[version] = await get_transaction(client, node_url, version)
+
+    await asyncio.gather(*(fetch(version) for version, txn in candidates.items() if txn is None))
+
+
+async def verify_by_ledger_walk(client, node_urls, start_version, end_version, discovered_versions,
+                                watchlist=WATCHLIST):
+    """Brute-force walk the range and compare against what discovery found"""
+    print(f"🧾 Verifying with a full ledger walk of {end_version - start_version + 1:,} versions...")
+    nodes = [NodeBudget(node_url) for node_url in node_urls]
+    prefilter = Prefilter(watchlist.tags)
+    walked_versions = set()
+    unfetched = 0
+    async for version, txn in iter_transactions_sharded(client, nodes, start_version, end_version,
+                                                        prefilter=prefilter):
+        if txn is None:
+            unfetched += 1
+        elif watchlist.match(txn):
+            walked_versions.add(version)
+
+    missed = sorted(walked_versions - discovered_versions)
+    extra = sorted(discovered_versions - walked_versions)
+    if not missed and not extra and not unfetched:
+        print(f"✅ Verified: discovery matches the ledger walk ({len(walked_versions)} CASH transactions)")
+    else:
+        print(f"❌ Verification mismatch: {len(missed)} missed by discovery, {len(extra)} not in the walk, "
+              f"{unfetched:,} versions could not be walked")
+        for version in missed[:20]:
+            print(f"  ➖ Missed: version {version}")
+        for version in extra[:20]:
+            print(f"  ➕ Extra: version {version}")
+    return missed, extra
+
+
+async def scan_discovered_cash_transactions(client=None, start_version=None, end_version=None,
+                                            window=DISCOVERY_WINDOW, verify=False, store_path=STORE_PATH,
+                                            watchlist=None, healthy_nodes=None, store_slim=STORE_SLIM):
+    """Find CASH transactions through the account/event indexes instead of walking the ledger
+
+    Only activity touching the watched tokens' publisher accounts (or the
+    extra DISCOVERY_ACCOUNTS / DISCOVERY_EVENT_HANDLES) can be found this
+    way. `healthy_nodes` skips node discovery. With `store_slim` an owned
+    store keeps only the fields the scanners read.
+    """
+    watchlist = watchlist or WATCHLIST
+    if client is None:
+        store = TransactionStore(store_path, slim=store_slim) if store_path else None
+        async with NodeClient(store=store) as client:
+            return await scan_discovered_cash_transactions(client, start_version, end_version, window, verify,
+                                                           watchlist=watchlist, healthy_nodes=healthy_nodes)
+
+    print("🚀 CASH TRANSACTION DISCOVERY SCANNER")
+    print("🔎 Discovering CASH transactions through account and event indexes...")
+    print(f"👀 Watching {len(watchlist)} token(s): {watchlist.describe()}")
+    print("=" * 60)
+
+    if healthy_nodes is None:
+        try:
+            healthy_nodes = await find_healthy_nodes(client)
+        except Exception as e:
+            print(f"❌ Failed to connect: {e}")
+            return None
+    node_url = healthy_nodes[0]
+
+    if end_version is None:
+        try:
+            end_version = await get_latest_version(client, node_url)
+        except Exception as e:
+            print(f"❌ Failed to get current version: {e}")
+            return None
+    if start_version is None:
+        start_version = max(0, end_version - window)
+    print(f"📅 Discovering transactions from {start_version} to {end_version}")
+    print("=" * 60)
+
+    candidates, failed_sources = await discover_cash_versions(client, node_url, start_version, end_version,
+                                                              watchlist)
+    await fetch_candidates(client, node_url, candidates)
+
+    cash_transactions = []
+    for version in sorted(candidates):
+        tokens = watchlist.match(candidates[version])
+        if tokens:
+            cash_transactions.append(build_cash_txn_info(version, candidates[version], tokens))
+
+    print("\n" + "=" * 60)
+    print("🎯 DISCOVERY SCAN COMPLETE")
+    print("=" * 60)
+    print(f"🔎 Candidate versions discovered: {len(candidates):,}")
+    print(f"💰 Total CASH transactions found: {len(cash_transactions)}")
+    if failed_sources:
+        print(f"⚠️  Incomplete: {len(failed_sources)} discovery source(s) failed - run with --verify")
+    # Not a failure: swaps and transfers between other accounts aren't in any index discovery can walk
+    print("⚠️  Coverage: only transactions sent by the watched tokens' publishers or moving them through "
+          "the publishers' CoinStores are found. Swaps and transfers between other accounts need a full "
+          "scan (--verify or historical_cash_scanner.py)")
+
+    if cash_transactions:
+        print("\n📋 DISCOVERED CASH TRANSACTION DETAILS:")
+        for i, txn in enumerate(cash_transactions, 1):
+            print(f"  #{i}: {txn['timestamp']} - Version {txn['version']} - {txn['hash'][:20]}...")
+    else:
+        print("❌ No CASH transactions discovered")
+
+    if verify:
+        await verify_by_ledger_walk(client, healthy_nodes, start_version, end_version,
+                                    {txn['version'] for txn in cash_transactions}, watchlist)
+
+    print("✅ Discovery scanner completed!")
+    return cash_transactions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Discover CASH transactions through account and event indexes")
+    parser.add_argument("--start", type=int, help="First version (default: --window versions before --end)")
+    parser.add_argument("--end", type=int, help="Last version (default: current ledger version)")
+    parser.add_argument("--window", type=int, default=DISCOVERY_WINDOW,
+                        help=f"Versions to cover when --start isn't given (default: {DISCOVERY_WINDOW:,})")
+    parser.add_argument("--verify", action="store_true",
+                        help="Also walk the whole range and report anything discovery missed")
+    parser.add_argument("--no-store", action="store_true", help="Don't use the local transaction store")
+    parser.add_argument("--store-slim", action="store_true",
+                        help="Store only the fields the scanners read, not whole transactions")
+    parser.add_argument("--watchlist", metavar="PATH",
+                        help="Tokens to watch instead of CASH: a JSON object or 'LABEL type_tag' lines")
+    parser.add_argument("--token", action="append", default=[], metavar="LABEL=TYPE",
+                        help="Also watch a token type tag (repeatable)")
+    args = parser.parse_args()
+    try:
+        watchlist = build_watchlist(DEFAULT_WATCHLIST, args.watchlist, args.token)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+
+    try:
+        asyncio.run(scan_discovered_cash_transactions(start_version=args.start, end_version=args.end,
+                                                      window=args.window, verify=args.verify,
+                                                      store_path=None if args.no_store else STORE_PATH,
+                                                      watchlist=watchlist, store_slim=args.store_slim))
+    except KeyboardInterrupt:
+        print("\n🛑 Discovery scan interrupted")
@@ -0,0 +1,275 @@
+"""
+Pluggable output layer for scan events.
+
+Sinks are attached to an EventStream. Publishing only appends the event to
+the sink's buffer; a background task renders and writes buffered events in
+batches, so a burst of matches never stalls the scan. Batches for a file or
+pipe the sink owns are written from a worker thread. stdout and stderr are
+also written by the scanners' own print()s, so batches for them are
+written on the event loop's thread, where they can't interleave with a
+print mid-line.
+
+  JsonLinesSink  compact JSON-lines records (match, progress, aggregates,
+                 rate_limit, error, started, finished) for downstream tools
+  EmojiRenderer  the human-readable console output
+"""
+
+import asyncio
+import json
+import sys
+import time
+
+from aggregates import describe_window
+from scan_events import (HISTORICAL, REALTIME, AggregateSnapshot, CashTransactionFound, EventStream, NodeThrottled,
+                         ScanError, ScanFinished, ScanProgress, ScanStarted)
+
+FLUSH_INTERVAL = 0.2  # Seconds between background writes
+MAX_PENDING_EVENTS = 1000  # Buffered events that trigger an early write
+RATE_LIMIT_NOTICE_INTERVAL = 10  # Seconds between rendered rate-limit warnings for the same node
+
+
+def open_output(target):
+    """Open an output target: "-" is stdout, anything else a file or named pipe to append to
+
+    Returns (stream, owned): owned streams are closed with the sink.
+    """
+    if target in (None, "-"):
+        # The real stdout, even while console output is redirected to stderr
+        return sys.__stdout__, False
+    return open(target, "a", encoding="utf-8"), True
+
+
+def event_record(event, at=None):
+    """The JSON-lines record for an event, or None for events without one"""
+    record = {"time": round(at if at is not None else time.time(), 3)}
+    if isinstance(event, CashTransactionFound):
+        match = event.record
+        record.update(type="match", source=event.source, version=match['version'],
+                      timestamp=match['timestamp'].isoformat(), hash=match['hash'], sender=match['sender'],
+                      tokens=match.get('tokens', []), events=match['events'], payload=match['payload'])
+        if event.latency is not None:
+            record["latency"] = round(event.latency, 3)
+    elif isinstance(event, ScanProgress):
+        record.update(type="progress", source=event.source, analyzed=event.analyzed, total=event.total,
+                      matches=event.matches, batch_matches=event.batch_matches, **event.detail)
+    elif isinstance(event, AggregateSnapshot):
+        record.update(type="aggregates", source=event.source, windows=event.windows)
+    elif isinstance(event, NodeThrottled):
+        record.update(type="rate_limit", node=event.node_url, rate=round(event.rate, 2),
+                      retry_after=event.retry_after)
+    elif isinstance(event, ScanError):
+        record.update(type="error", source=event.source, message=event.message)
+    elif isinstance(event, ScanStarted):
+        record.update(type="started", source=event.source, start_version=event.start_version,
+                      end_version=event.end_version)
+    elif isinstance(event, ScanFinished):
+        record.update(type="finished", source=event.source, analyzed=event.analyzed, matches=event.matches)
+    else:
+        return None
+    return record
+
+
+class BufferedSink:
+    """Base sink: buffers events and writes render() output from a background task"""
+
+    def __init__(self, stream, owns_stream=False, flush_interval=FLUSH_INTERVAL,
+                 max_pending=MAX_PENDING_EVENTS):
+        self.stream = stream
+        self.owns_stream = owns_stream
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.written = 0
+        self._pending = []
+        self._task = None
+        self._wake = None
+        self._lock = None
+
+    def render(self, event, at):
+        """Text for one event (or None to skip it); runs wherever the batch is written"""
+        raise NotImplementedError
+
+    def emit(self, event):
+        """Buffer an event; never blocks"""
+        self._pending.append((time.time(), event))
+        if self._task is None:
+            self._wake = asyncio.Event()
+            self._lock = asyncio.Lock()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        if len(self._pending) >= self.max_pending or self.is_urgent(event):
+            self._wake.set()
+
+    def is_urgent(self, event):
+        """Live alerts are written right away instead of waiting for the next interval"""
+        return isinstance(event, CashTransactionFound) and event.source == REALTIME
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    def _write_batch(self, batch):
+        text = "".join(filter(None, (self.render(event, at) for at, event in batch)))
+        if text:
+            self.stream.write(text)
+            self.stream.flush()
+        self.written += len(batch)
+
+    async def flush(self):
+        """Write everything buffered so far"""
+        if self._lock is None:
+            return
+        async with self._lock:
+            if self._pending:
+                batch, self._pending = self._pending, []
+                if self.owns_stream:
+                    await asyncio.get_running_loop().run_in_executor(None, self._write_batch, batch)
+                else:
+                    # Shared with print() on this thread: a worker thread's write could land mid-line
+                    self._write_batch(batch)
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+        if self.owns_stream:
+            self.stream.close()
+
+
+class JsonLinesSink(BufferedSink):
+    """Writes one compact JSON record per event"""
+
+    def __init__(self, target="-", **kwargs):
+        stream, owned = open_output(target)
+        super().__init__(stream, owned, **kwargs)
+
+    def render(self, event, at):
+        record = event_record(event, at)
+        if record is None:
+            return None
+        return json.dumps(record, separators=(",", ":"), default=str) + "\n"
+
+
+class EmojiRenderer(BufferedSink):
+    """The scanners' human-readable console output"""
+
+    def __init__(self, watchlist, stream=None, **kwargs):
+        super().__init__(stream or sys.stdout, **kwargs)
+        self.watchlist = watchlist
+        self._last_throttle_notice = {}
+
+    def render(self, event, at):
+        if isinstance(event, CashTransactionFound):
+            if event.source == HISTORICAL:
+                return self.render_historical_match(event)
+            return self.render_realtime_match(event)
+        elif isinstance(event, ScanProgress):
+            return self.render_progress(event)
+        elif isinstance(event, AggregateSnapshot):
+            if not any(summary["matches"] for summary in event.windows):
+                return None
+            return "".join(f"📈 {event.source.upper()} {describe_window(summary)}\n" for summary in event.windows)
+        elif isinstance(event, NodeThrottled):
+            if at - self._last_throttle_notice.get(event.node_url, float("-inf")) < RATE_LIMIT_NOTICE_INTERVAL:
+                return None
+            self._last_throttle_notice[event.node_url] = at
+            return (f"⚠️  RATE LIMIT WARNING: {event.node_url} returned HTTP 429, "
+                    f"backing off to {event.rate:.1f} req/s\n")
+        elif isinstance(event, ScanError):
+            return f"❌ {event.source.upper()} ERROR: {event.message}\n"
+        return None
+
+    def render_historical_match(self, event):
+        match = event.record
+        lines = [
+            "💰 HISTORICAL CASH TRANSACTION FOUND!",
+            f"  📅 Transaction Time: {match['timestamp']}",
+            f"  🔗 Txn Hash: {match['hash']}",
+            f"  👤 Sender: {match['sender']}",
+            f"  📋 Version: {match['version']}",
+            f"  🏷️  Tokens: {', '.join(match.get('tokens', []))}",
+            f"  📊 Transactions Analyzed: {event.analyzed:,}",
+            f"  💰 CASH Swaps Found: {event.matches}",
+            "  📚 Type: HISTORICAL TRANSACTION",
+        ]
+        # Show watched-token events with detailed formatting
+        cash_events = [e for e in match['events'] if self.watchlist.mentions(e.get('type', ''))]
+        for i, cash_event in enumerate(cash_events, 1):
+            lines.append(f"  📊 Event {i}: {cash_event['type']}")
+            lines.append(f"  📊 Event Data: {json.dumps(cash_event.get('data'), indent=4)}")
+        # Show payload information if it mentions a watched token
+        payload = match['payload'] or {}
+        function = payload.get('function', '')
+        if self.watchlist.mentions(function):
+            lines.append(f"  🔧 Function: {function}")
+        for arg in payload.get('type_arguments', []):
+            if self.watchlist.mentions(arg):
+                lines.append(f"  🔧 Type Argument: {arg}")
+        lines.append("-" * 60)
+        return "\n".join(lines) + "\n"
+
+    def render_realtime_match(self, event):
+        match = event.record
+        lines = [
+            "🔥 REAL-TIME CASH TRANSACTION DETECTED!",
+            f"  📅 Transaction Time: {match['timestamp']}",
+            f"  🔗 Txn Hash: {match['hash']}",
+            f"  👤 Sender: {match['sender']}",
+            f"  📋 Version: {match['version']}",
+            f"  🏷️  Tokens: {', '.join(match.get('tokens', []))}",
+            "  ⚡ Type: LIVE TRANSACTION",
+        ]
+        if event.latency is not None:
+            lines.append(f"  ⏱️  Detection Latency: {event.latency:.2f}s")
+        lines.append(f"  📊 Total Transactions Analyzed: {event.analyzed:,}")
+        lines.append(f"  💰 Total CASH Swaps Found: {event.matches}")
+        # Show watched-token events
+        for i, cash_event in enumerate(match['events']):
+            if self.watchlist.mentions(cash_event.get('type', '')):
+                lines.append(f"  📊 Event {i+1}: {cash_event['type']}")
+                lines.append(f"  📊 Event Data: {json.dumps(cash_event.get('data'), indent=4)}")
+        lines.append("=" * 60)
+        return "\n".join(lines) + "\n"
+
+    def render_progress(self, event):
+        if event.source == HISTORICAL:
+            lines = [
+                f"📊 BATCH SUMMARY: Analyzed {event.analyzed:,} transactions",
+                f"💰 CASH Swaps in this batch: {event.batch_matches}",
+                f"💰 Total CASH Swaps found: {event.matches}",
+                f"📈 Progress: {event.analyzed:,} / {event.total:,} transactions",
+                f"📊 Completion: {((event.analyzed + event.detail.get('unfetched', 0)) / event.total * 100):.1f}%",
+            ]
+            if event.detail.get("retrying"):
+                lines.append(f"🔁 Retrying: {event.detail['retrying']:,} versions that failed to fetch")
+            if event.detail.get("unfetched"):
+                lines.append(f"⚠️  Could not fetch: {event.detail['unfetched']:,} versions")
+        else:
+            lines = [
+                f"📊 REAL-TIME BATCH SUMMARY: Analyzed {event.analyzed:,} transactions",
+                f"💰 CASH Swaps in this batch: {event.batch_matches}",
+                f"💰 Total CASH Swaps found: {event.matches}",
+            ]
+            detail = event.detail
+            if "head" in detail:
+                lines.append(f"📡 Head: {detail['head']:,} ({detail['behind']:,} behind, "
+                             f"polling every {detail['poll_interval']:.2f}s)")
+            if "latency" in detail:
+                lines.append(f"⏱️  Detection latency: {detail['latency']}")
+        lines.append("-" * 40)
+        return "\n".join(lines) + "\n"
+
+
+def build_event_stream(watchlist, jsonl=None, human=True):
+    """An EventStream with the emoji renderer and/or a JSON-lines sink attached"""
+    events = EventStream()
+    if human:
+        events.add_sink(EmojiRenderer(watchlist))
+    if jsonl is not None:
+        events.add_sink(JsonLinesSink(jsonl))
+    return events
@@ -0,0 +1,120 @@
+"""
+Hedged requests, to keep one stalled page or lookup from holding up the
+realtime monitor.
+
+A request that hasn't answered by its node's recent p95 latency for that
+kind of request (range pages and single-version lookups are timed apart)
+is sent again to a backup node; whichever answers first wins and the other
+is cancelled. Every request earns a fraction of a hedge (HEDGE_BUDGET), so
+the duplicates stay a small, capped share of the load even when a node
+slows down across the board.
+"""
+
+import asyncio
+import time
+from collections import deque
+
+from metrics import HEDGED_REQUESTS
+from node_client import node_origin
+
+# Kinds of request, each with its own latency samples
+LOOKUP = "lookup"
+PAGE = "page"
+
+HEDGE_QUANTILE = 0.95  # Latency quantile a request may take before it's hedged
+HEDGE_SAMPLES = 200  # Recent latencies kept per node and kind of request
+MIN_HEDGE_SAMPLES = 20  # Until a node has this many, DEFAULT_HEDGE_DELAY is used
+DEFAULT_HEDGE_DELAY = 1.0
+MIN_HEDGE_DELAY = 0.02  # Never hedge sooner than this, however fast the node usually is
+HEDGE_BUDGET = 0.05  # Hedges earned per request
+MAX_HEDGE_TOKENS = 10.0  # Hedges that can be saved up for a burst of slow requests
+
+
+class Hedger:
+    """Duplicates slow requests to a backup node, within a budget
+
+    `node_urls` are the nodes a request may be duplicated to (one per
+    origin); a request is never hedged to its own node's origin.
+    """
+
+    def __init__(self, node_urls, quantile=HEDGE_QUANTILE, budget=HEDGE_BUDGET, max_tokens=MAX_HEDGE_TOKENS):
+        self.backups = list(dict.fromkeys(node_origin(node_url) for node_url in node_urls))
+        self.quantile = quantile
+        self.budget = budget
+        self.max_tokens = max_tokens
+        self.requests = 0
+        self.sent = 0
+        self.won = 0
+        self.over_budget = 0
+        self._tokens = max_tokens
+        self._latencies = {}  # (origin, kind) -> recent latencies
+        self._failures = {}  # backup origin -> hedges in a row it didn't answer
+
+    def deadline(self, node_url, kind=LOOKUP):
+        """Seconds a request of this kind on this node may take before it's hedged"""
+        samples = self._latencies.get((node_origin(node_url), kind))
+        if samples is None or len(samples) < MIN_HEDGE_SAMPLES:
+            return DEFAULT_HEDGE_DELAY
+        ranked = sorted(samples)
+        return max(MIN_HEDGE_DELAY, ranked[min(len(ranked) - 1, int(self.quantile * len(ranked)))])
+
+    def observe(self, node_url, seconds, kind=LOOKUP):
+        key = (node_origin(node_url), kind)
+        samples = self._latencies.get(key)
+        if samples is None:
+            samples = self._latencies[key] = deque(maxlen=HEDGE_SAMPLES)
+        samples.append(seconds)
+
+    def backup_for(self, node_url):
+        """The backup to hedge a request on `node_url` to, or None; backups that keep failing go last"""
+        origin = node_origin(node_url)
+        candidates = [backup for backup in self.backups if backup != origin]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda backup: self._failures.get(backup, 0))
+
+    async def fetch(self, get, node_url, kind=LOOKUP):
+        """`await get(node_url)`, hedged to a backup node if it's slow; `get` returns None on failure
+
+        `kind` (LOOKUP or PAGE) picks the latency samples the deadline comes
+        from. Returns the first result that isn't None, or None if neither
+        node answered.
+        """
+        self.requests += 1
+        self._tokens = min(self.max_tokens, self._tokens + self.budget)
+        backup = self.backup_for(node_url)
+        started = time.perf_counter()
+        primary = asyncio.ensure_future(get(node_url))
+        hedge = None
+        try:
+            if backup is not None:
+                await asyncio.wait({primary}, timeout=self.deadline(node_url, kind))
+            if primary.done() or backup is None:
+                return await primary
+            if self._tokens < 1:
+                self.over_budget += 1
+                HEDGED_REQUESTS.labels(node_origin(node_url), kind, "over_budget").inc()
+                return await primary
+
+            self._tokens -= 1
+            self.sent += 1
+            HEDGED_REQUESTS.labels(node_origin(node_url), kind, "sent").inc()
+            hedge = asyncio.ensure_future(get(backup))
+            pending = {primary, hedge}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                if hedge in done:
+                    self._failures[backup] = 0 if hedge.result() is not None else self._failures.get(backup, 0) + 1
+                for task in (primary, hedge):
+                    if task in done and task.result() is not None:
+                        if task is hedge:
+                            self.won += 1
+                            HEDGED_REQUESTS.labels(node_origin(node_url), kind, "won").inc()
+                        return task.result()
+            return None
+        finally:
+            # A request the hedge beat took at least this long
+            self.observe(node_url, time.perf_counter() - started, kind)
+            for task in (primary, hedge):
+                if task is not None and not task.done():
+                    task.cancel()
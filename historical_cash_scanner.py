@@ -1,9 +1,27 @@
+import argparse
 import asyncio
-import aiohttp
-import json
-import ssl
+import sys
 import time
-from datetime import datetime
+from contextlib import nullcontext, redirect_stdout
+
+from aggregates import WindowedAggregates, describe_window
+from checkpoint import CHECKPOINT_PATH, ScanCheckpoint, intersect_ranges, merge_ranges
+from classifier_pool import DEFAULT_WORKERS, ClassifierPool
+from event_sink import build_event_stream
+from match_index import MATCH_INDEX_PATH, MatchIndex
+from match_records import MatchLog, build_cash_txn_info
+from metrics import (MATCHES, METRICS_PORT, TOKEN_MATCHES, VERSIONS_CLASSIFIED, VERSIONS_UNFETCHED,
+                     run_with_metrics)
+from node_client import DEFAULT_ENCODING, ENCODINGS, NodeClient, node_origin
+from node_probe import select_nodes
+from node_scheduler import NodeBudget, iter_transactions_sharded
+from prefilter import Prefilter
+from retry_queue import RetryQueue
+from scan_events import (HISTORICAL, AggregateSnapshot, CashTransactionFound, ScanError, ScanFinished,
+                         ScanProgress, ScanStarted)
+from time_index import BlockIndex, TimeResolver, parse_time_window
+from transaction_store import STORE_PATH, STORE_SLIM, TransactionStore
+from watchlist import Watchlist, build_watchlist
 
 # Multiple reliable Aptos nodes - Historical scanner uses different nodes
 NODE_URLS = [
@@ -15,275 +33,400 @@ NODE_URLS = [
 
 CASH_TOKEN_TYPE = "0x61ed8b048636516b4eaf4c74250fa4f9440d9c3e163d96aeb863fe658a4bdc67::CASH::CASH"
 
-# Create SSL context that bypasses certificate issues
-ssl_context = ssl.create_default_context()
-ssl_context.check_hostname = False
-ssl_context.verify_mode = ssl.CERT_NONE
+# Tokens watched unless --watchlist / --token say otherwise
+DEFAULT_WATCHLIST = {"CASH": CASH_TOKEN_TYPE}
+WATCHLIST = Watchlist(DEFAULT_WATCHLIST)
 
-async def test_node_connectivity(node_url):
-    """Test if a node is responding"""
-    try:
-        connector = aiohttp.TCPConnector(ssl=ssl_context)
-        timeout = aiohttp.ClientTimeout(total=15)
-        
-        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
-            async with session.get(f"{node_url}/v1", ssl=False) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    if "ledger_version" in data:
-                        return True, data["ledger_version"]
-            
-            async with session.get(f"{node_url}/", ssl=False) as response:
-                if response.status == 200:
-                    return True, None
-                    
-    except Exception as e:
-        return False, None
-    
-    return False, None
+# Number of version ranges fetched concurrently from each node during the historical scan
+SCAN_CONCURRENCY = 8
+
+# Versions scanned back from the head when no time window is given
+DEFAULT_SCAN_VERSIONS = 100000
 
-async def find_working_node():
-    """Find a working Aptos node"""
+# Coverage gaps listed individually in the final report
+MAX_REPORTED_GAPS = 20
+
+async def find_healthy_nodes(client):
+    """Find every working Aptos node, one per host, fastest first"""
     print("🔍 Testing Aptos nodes for historical scanner...")
-    for i, node_url in enumerate(NODE_URLS, 1):
-        print(f"  {i}/{len(NODE_URLS)} Testing: {node_url}")
-        is_working, ledger_version = await test_node_connectivity(node_url)
-        
-        if is_working:
-            print(f"✅ Found working node: {node_url}")
-            if ledger_version:
-                print(f"📊 Current ledger version: {ledger_version}")
-            return node_url
+    # URLs on the same host share one per-IP rate limit, so only the first one is used
+    candidates = {}
+    for node_url in NODE_URLS:
+        candidates.setdefault(node_origin(node_url), node_url)
     
-    raise Exception("No working nodes found")
+    # All nodes are probed at once (or a cached ranking is used and confirmed in the background)
+    healthy_nodes = await select_nodes(client, list(candidates.values()), wait_for_all=True)
+    print(f"✅ Sharding scan across {len(healthy_nodes)} node(s)")
+    return healthy_nodes
 
-async def get_latest_version(node_url):
+async def get_latest_version(client, node_url):
     """Get the latest ledger version from a node"""
+    # The node's rate limiter paces every retry, so there are no fixed sleeps here
     max_retries = 3
-    for attempt in range(max_retries):
+    attempt = 0
+    while attempt < max_retries:
         try:
-            connector = aiohttp.TCPConnector(ssl=ssl_context)
-            timeout = aiohttp.ClientTimeout(total=15)
-            
-            async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
-                async with session.get(f"{node_url}/v1", ssl=False) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        return int(data.get("ledger_version", 0))
-                    elif response.status == 429:
-                        wait_time = (attempt + 1) * 5  # Progressive backoff
-                        print(f"⚠️  Rate limited (HTTP 429). Waiting {wait_time} seconds...")
-                        await asyncio.sleep(wait_time)
-                        continue
-                    else:
-                        raise Exception(f"HTTP {response.status}")
+            async with client.get(f"{node_url}/v1") as response:
+                if response.status == 200:
+                    data = await response.json()
+                    return int(data.get("ledger_version", 0))
+                elif response.status == 429:
+                    # Throttling doesn't use up an attempt - the limiter waits out Retry-After
+                    print(f"⚠️  Rate limited (HTTP 429). Backing off to {client.limiter(node_url).rate:.1f} req/s...")
+                    continue
+                else:
+                    raise Exception(f"HTTP {response.status}")
                         
         except Exception as e:
-            if attempt == max_retries - 1:
+            attempt += 1
+            if attempt == max_retries:
                 raise
-            wait_time = (attempt + 1) * 2
-            print(f"⚠️  Error getting version (attempt {attempt + 1}/{max_retries}). Waiting {wait_time} seconds...")
-            await asyncio.sleep(wait_time)
+            print(f"⚠️  Error getting version (attempt {attempt}/{max_retries}). Retrying...")
     
     raise Exception("Failed to get latest version after all retries")
 
-async def get_transaction(node_url, version):
-    """Get a specific transaction by version"""
-    try:
-        connector = aiohttp.TCPConnector(ssl=ssl_context)
-        timeout = aiohttp.ClientTimeout(total=15)
-        
-        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
-            async with session.get(f"{node_url}/v1/transactions/by_version/{version}", ssl=False) as response:
-                if response.status == 200:
-                    return await response.json()
-                elif response.status == 404:
-                    return None
-                elif response.status == 429:
-                    await asyncio.sleep(3)
-                    return None
-                else:
-                    return None
-                    
-    except Exception as e:
-        return None
+def is_cash_related_transaction(txn, watchlist=WATCHLIST):
+    """Check if a transaction involves CASH token (or any other watched token)"""
+    # Events, function and type arguments are each searched once for the whole watchlist
+    return bool(watchlist.match(txn))
 
-def is_cash_related_transaction(txn):
-    """Check if a transaction involves CASH token"""
-    if not txn or txn.get("type") != "user_transaction":
-        return False
-    
-    # Check events for CASH token
-    events = txn.get("events", [])
-    for event in events:
-        event_type = event.get("type", "")
-        if CASH_TOKEN_TYPE in event_type:
-            return True
+async def scan_historical_cash_transactions(client=None, concurrency=SCAN_CONCURRENCY,
+                                            resume=False, checkpoint_path=CHECKPOINT_PATH,
+                                            store_path=STORE_PATH, healthy_nodes=None, events=None,
+                                            coverage=None, jsonl=None, time_window=None, watchlist=None,
+                                            index_path=MATCH_INDEX_PATH, encoding=DEFAULT_ENCODING, workers=0,
+                                            store_slim=STORE_SLIM):
+    """Scan historically for all CASH transactions
+
+    `healthy_nodes` skips node discovery (the orchestrator probes once for
+    both scanners). Matches, progress and errors are published as typed
+    events on `events`; without one, the scan renders its own console
+    output (plus JSON lines to `jsonl`, if given). With a shared
+    CoverageTracker the scan stops where the live tail started and skips
+    versions another scanner already claimed. `time_window` is a (start,
+    end) pair of datetimes (end None for "up to now") to scan instead of
+    the last DEFAULT_SCAN_VERSIONS versions. `watchlist` (default: just
+    CASH) sets the tokens looked for; every match is tagged with the ones
+    it mentions. Matches are appended to the match index at `index_path`
+    (None to skip it). `encoding` is the page encoding an owned client asks
+    nodes for. With `workers`, JSON pages are decoded and classified in
+    that many worker processes (see classifier_pool.py). With `store_slim`
+    an owned store keeps only the fields the scanners read.
+    """
+    watchlist = watchlist or WATCHLIST
+    if events is None:
+        events = build_event_stream(watchlist, jsonl=jsonl)
+        try:
+            return await scan_historical_cash_transactions(client, concurrency, resume, checkpoint_path, store_path,
+                                                           healthy_nodes, events, coverage, time_window=time_window,
+                                                           watchlist=watchlist, index_path=index_path,
+                                                           encoding=encoding, workers=workers,
+                                                           store_slim=store_slim)
+        finally:
+            await events.close()
     
-    # Check payload for CASH token
-    payload = txn.get("payload", {})
-    if payload:
-        # Check function calls
-        function = payload.get("function", "")
-        if CASH_TOKEN_TYPE in function:
-            return True
-        
-        # Check type arguments
-        type_arguments = payload.get("type_arguments", [])
-        for arg in type_arguments:
-            if CASH_TOKEN_TYPE in arg:
-                return True
+    if client is None:
+        # Own a pooled client for the whole run so every request reuses connections;
+        # versions fetched by earlier runs are served from the local store
+        store = TransactionStore(store_path, slim=store_slim) if store_path else None
+        async with NodeClient(store=store, events=events, encoding=encoding) as client:
+            return await scan_historical_cash_transactions(client, concurrency, resume, checkpoint_path,
+                                                           healthy_nodes=healthy_nodes, events=events,
+                                                           coverage=coverage, time_window=time_window,
+                                                           watchlist=watchlist, index_path=index_path,
+                                                           workers=workers)
     
-    return False
-
-async def scan_historical_cash_transactions():
-    """Scan historically for all CASH transactions"""
     print("🚀 HISTORICAL CASH TRANSACTION SCANNER")
     print("📚 Scanning past CASH transactions...")
+    print(f"👀 Watching {len(watchlist)} token(s): {watchlist.describe()}")
     print("=" * 60)
     
-    # Find a working node
-    try:
-        working_node = await find_working_node()
-    except Exception as e:
-        print(f"❌ Failed to connect: {e}")
-        return
+    # Find every healthy node
+    if healthy_nodes is None:
+        try:
+            healthy_nodes = await find_healthy_nodes(client)
+        except Exception as e:
+            events.publish(ScanError(HISTORICAL, f"Failed to connect: {e}"))
+            return
     
-    # Get current version
-    try:
-        current_version = await get_latest_version(working_node)
-        print(f"📊 Current ledger version: {current_version}")
-    except Exception as e:
-        print(f"❌ Failed to get current version: {e}")
-        return
+    checkpoint = ScanCheckpoint(checkpoint_path)
+    if resume and checkpoint.load():
+        # Pick up the interrupted scan's exact bounds
+        historical_start = checkpoint.start_version
+        current_version = checkpoint.end_version
+        checkpoint.resume()
+        print(f"♻️  Resuming scan from checkpoint: {checkpoint_path}")
+        print(f"📊 Already completed: {checkpoint.completed_count():,} transactions, {len(checkpoint.matches)} CASH swaps")
+    else:
+        if resume:
+            print(f"⚠️  No checkpoint found at {checkpoint_path}, starting a fresh scan")
+        
+        # Get current version
+        try:
+            current_version = await get_latest_version(client, healthy_nodes[0])
+            print(f"📊 Current ledger version: {current_version}")
+            if coverage is not None and coverage.backfill_end(current_version) != current_version:
+                # Stop exactly where the live tail started
+                current_version = coverage.backfill_end(current_version)
+                print(f"🤝 Live tail starts at version {current_version + 1}; backfilling up to {current_version}")
+        except Exception as e:
+            events.publish(ScanError(HISTORICAL, f"Failed to get current version: {e}"))
+            return
 
-    # Scan last 100,000 transactions for historical data
-    historical_start = max(0, current_version - 100000)
+        if time_window is None:
+            # Scan the last 100,000 transactions for historical data
+            historical_start = max(0, current_version - DEFAULT_SCAN_VERSIONS)
+        else:
+            # Binary-search block timestamps for the window's versions, starting from cached anchors
+            window_start, window_end = time_window
+            resolver = TimeResolver(client, healthy_nodes[0], BlockIndex())
+            try:
+                historical_start, end_version = await resolver.version_range(window_start, window_end)
+            except Exception as e:
+                events.publish(ScanError(HISTORICAL, f"Failed to resolve the time window: {e}"))
+                return
+            print(f"🕒 {window_start:%Y-%m-%d %H:%M} → {f'{window_end:%Y-%m-%d %H:%M}' if window_end else 'now'} "
+                  f"is versions {historical_start:,}-{end_version:,} ({resolver.requests} requests, "
+                  f"{len(resolver.index):,} block anchors cached)")
+            current_version = min(current_version, end_version)
+            if historical_start > current_version:
+                print("❌ No transactions in that time window")
+                return []
+        checkpoint.start(historical_start, current_version)
+    
     print(f"📅 Scanning transactions from {historical_start} to {current_version}")
     print(f"📊 Total transactions to scan: {current_version - historical_start + 1:,}")
     print("=" * 60)
+    events.publish(ScanStarted(HISTORICAL, historical_start, current_version))
     
-    cash_transactions = []
-    transactions_checked = 0
+    # Matches spill their payloads to disk; only the most recent stay in memory
+    cash_transactions = MatchLog()
+    cash_transactions.extend(checkpoint.matches)
+    # Rolling volume/sender aggregates of the matches, snapshotted with every progress report
+    aggregates = WindowedAggregates(watchlist, HISTORICAL)
+    for cash_txn_info in checkpoint.matches:
+        aggregates.add(cash_txn_info)
+    # Every match also goes into the queryable index (see match_index.py)
+    match_index = MatchIndex(index_path) if index_path else None
+    transactions_checked = checkpoint.completed_count()
     swaps_in_current_batch = 0
     last_summary_time = time.time()
     summary_interval = 5  # seconds
     
-    for version in range(historical_start, current_version + 1):
-        try:
-            txn = await get_transaction(working_node, version)
-            
-            if txn:
-                transactions_checked += 1
-                
-                if is_cash_related_transaction(txn):
-                    transaction_time = datetime.fromtimestamp(int(txn['timestamp']) / 1000000)
-                    swaps_in_current_batch += 1
-                    
-                    cash_txn_info = {
-                        'version': version,
-                        'timestamp': transaction_time,
-                        'hash': txn['hash'],
-                        'sender': txn.get('sender', 'unknown'),
-                        'events': txn.get('events', []),
-                        'payload': txn.get('payload', {})
-                    }
-                    cash_transactions.append(cash_txn_info)
-                    
-                    print(f"💰 HISTORICAL CASH TRANSACTION FOUND!")
-                    print(f"  📅 Transaction Time: {transaction_time}")
-                    print(f"  🔗 Txn Hash: {txn['hash']}")
-                    print(f"  👤 Sender: {txn.get('sender', 'unknown')}")
-                    print(f"  📋 Version: {version}")
-                    print(f"  📊 Transactions Analyzed: {transactions_checked:,}")
-                    print(f"  💰 CASH Swaps Found: {len(cash_transactions)}")
-                    print(f"  📚 Type: HISTORICAL TRANSACTION")
-                    
-                    # Show CASH-related events with detailed formatting
-                    events = txn.get('events', [])
-                    cash_events_found = 0
-                    for i, event in enumerate(events):
-                        if CASH_TOKEN_TYPE in event.get('type', ''):
-                            cash_events_found += 1
-                            print(f"  📊 Event {cash_events_found}: {event['type']}")
-                            print(f"  📊 Event Data: {json.dumps(event['data'], indent=4)}")
-                    
-                    # Show payload information if it contains CASH token
-                    payload = txn.get('payload', {})
-                    if payload:
-                        function = payload.get('function', '')
-                        if CASH_TOKEN_TYPE in function:
-                            print(f"  🔧 Function: {function}")
-                        
-                        type_arguments = payload.get('type_arguments', [])
-                        for arg in type_arguments:
-                            if CASH_TOKEN_TYPE in arg:
-                                print(f"  🔧 Type Argument: {arg}")
-                    
-                    print("-" * 60)
-                
-                # Report progress every 5 seconds
-                current_time = time.time()
-                if current_time - last_summary_time >= summary_interval:
-                    print(f"📊 BATCH SUMMARY: Analyzed {transactions_checked:,} transactions")
-                    print(f"💰 CASH Swaps in this batch: {swaps_in_current_batch}")
-                    print(f"💰 Total CASH Swaps found: {len(cash_transactions)}")
-                    print(f"📈 Progress: {transactions_checked:,} / {current_version - historical_start + 1:,} transactions")
-                    print(f"📊 Completion: {(transactions_checked / (current_version - historical_start + 1) * 100):.1f}%")
-                    print("-" * 40)
-                    swaps_in_current_batch = 0  # Reset for next batch
-                    last_summary_time = current_time
-                
-                # Add small delay to avoid rate limiting
-                if transactions_checked % 50 == 0:
-                    await asyncio.sleep(0.5)  # Increased delay for historical scanner
+    # Every node gets its own concurrency budget (and rate limiter in the client); results still arrive in version order
+    nodes = [NodeBudget(node_url, concurrency=concurrency) for node_url in healthy_nodes]
+    # Only transactions whose raw bytes mention a watched token get a full JSON decode
+    prefilter = Prefilter(watchlist.tags)
+    # Optionally, decoding and classifying pages runs on every core instead of just this thread
+    classifier = ClassifierPool(watchlist, workers) if workers else None
+    
+    # Only the ranges the checkpoint hasn't seen completed yet...
+    ranges_to_fetch = checkpoint.missing_ranges()
+    if coverage is not None:
+        # ...and nobody else has claimed. Claim them all now, so a live tail
+        # starting later picks up right after the backfill
+        claimed = []
+        for range_start, range_end in ranges_to_fetch:
+            claimed.extend(coverage.claim(range_start, min(range_end, coverage.backfill_end(range_end))))
+        skipped = sum(end - start + 1 for start, end in ranges_to_fetch) - sum(end - start + 1 for start, end in claimed)
+        if skipped:
+            print(f"⏭️  Skipping {skipped:,} versions already covered by another scanner")
+        ranges_to_fetch = claimed
+    # Everything this scan is answerable for: what a resumed checkpoint already completed plus what it fetches now
+    scan_ranges = merge_ranges(checkpoint.completed + [list(r) for r in ranges_to_fetch])
+    
+    async def iter_missing_transactions():
+        for range_start, range_end in ranges_to_fetch:
+            # Ranges with a few missing versions come straight through; the retry queue handles those
+            async for item in iter_transactions_sharded(client, nodes, range_start, range_end,
+                                                        prefilter=prefilter, accept_partial=True,
+                                                        classifier=classifier):
+                yield item
+    
+    classified = VERSIONS_CLASSIFIED.labels(HISTORICAL)
+    unfetched = VERSIONS_UNFETCHED.labels(HISTORICAL)
+    matched = MATCHES.labels(HISTORICAL)
+    token_matched = {label: TOKEN_MATCHES.labels(HISTORICAL, label) for label in watchlist.labels}
+    # Versions no node could serve go to a dead-letter queue that's retried with
+    # backoff alongside the scan, instead of being skipped
+    retries = RetryQueue(client, healthy_nodes, prefilter, name="historical_retry")
+    
+    def classify(version, txn):
+        nonlocal transactions_checked, swaps_in_current_batch
+        transactions_checked += 1
+        classified.inc()
+        # One pass tags every watched token the transaction mentions
+        tokens = watchlist.match(txn)
+        if tokens:
+            cash_txn_info = build_cash_txn_info(version, txn, tokens)
+            matched.inc()
+            for token in tokens:
+                token_matched[token].inc()
+            swaps_in_current_batch += 1
+            cash_transactions.append(cash_txn_info)
+            aggregates.add(cash_txn_info)
+            if match_index is not None:
+                match_index.add(cash_txn_info, HISTORICAL)
+            checkpoint.add_match(cash_txn_info)
+            events.publish(CashTransactionFound(HISTORICAL, cash_txn_info, analyzed=transactions_checked,
+                                                matches=len(cash_transactions)))
+        checkpoint.mark_done(version)
+    
+    def report_progress():
+        detail = {}
+        if retries.pending:
+            detail["retrying"] = retries.pending
+        if retries.gave_up:
+            detail["unfetched"] = len(retries.gave_up)
+        events.publish(ScanProgress(HISTORICAL, transactions_checked, current_version - historical_start + 1,
+                                    len(cash_transactions), batch_matches=swaps_in_current_batch, detail=detail))
+        events.publish(AggregateSnapshot(HISTORICAL, aggregates.snapshot()))
+    
+    try:
+        async for version, txn in iter_missing_transactions():
+            if txn is None:
+                unfetched.inc()
+                retries.add(version)
             else:
-                # Count attempted transactions even if they don't exist
-                transactions_checked += 1
-                
-                # Report progress every 5 seconds (including failed attempts)
-                current_time = time.time()
-                if current_time - last_summary_time >= summary_interval:
-                    print(f"📊 BATCH SUMMARY: Analyzed {transactions_checked:,} transactions")
-                    print(f"💰 CASH Swaps in this batch: {swaps_in_current_batch}")
-                    print(f"💰 Total CASH Swaps found: {len(cash_transactions)}")
-                    print(f"📈 Progress: {transactions_checked:,} / {current_version - historical_start + 1:,} transactions")
-                    print(f"📊 Completion: {(transactions_checked / (current_version - historical_start + 1) * 100):.1f}%")
-                    print("-" * 40)
-                    swaps_in_current_batch = 0  # Reset for next batch
-                    last_summary_time = current_time
-                    
-        except Exception as e:
-            # Count attempted transactions even if they fail
-            transactions_checked += 1
+                classify(version, txn)
+            for recovered_version, recovered_txn in retries.take_recovered():
+                classify(recovered_version, recovered_txn)
             
-            # Report progress every 5 seconds (including failed attempts)
+            # Report progress every 5 seconds
             current_time = time.time()
             if current_time - last_summary_time >= summary_interval:
-                print(f"📊 BATCH SUMMARY: Analyzed {transactions_checked:,} transactions")
-                print(f"💰 CASH Swaps in this batch: {swaps_in_current_batch}")
-                print(f"💰 Total CASH Swaps found: {len(cash_transactions)}")
-                print(f"📈 Progress: {transactions_checked:,} / {current_version - historical_start + 1:,} transactions")
-                print(f"📊 Completion: {(transactions_checked / (current_version - historical_start + 1) * 100):.1f}%")
-                print("-" * 40)
+                report_progress()
                 swaps_in_current_batch = 0  # Reset for next batch
                 last_summary_time = current_time
+        
+        if retries.pending:
+            print(f"🔁 Main scan done; retrying {retries.pending:,} versions that failed to fetch...")
+            async for recovered_version, recovered_txn in retries.drain():
+                classify(recovered_version, recovered_txn)
+    finally:
+        await retries.close()
+        if classifier is not None:
+            classifier.close()
+        # Persist whatever was completed, even on Ctrl+C
+        checkpoint.close()
+        if match_index is not None:
+            match_index.close()
+        print(f"💾 Checkpoint saved: {checkpoint_path}")
+    
+    # Let buffered match output land before the summary
+    await events.flush()
     
     # Final Summary
     print("\n" + "=" * 60)
     print("🎯 HISTORICAL SCAN COMPLETE")
     print("=" * 60)
     print(f"📊 Total transactions analyzed: {transactions_checked:,}")
+    if retries.added:
+        print(f"🔁 Retried {retries.added:,} failed versions: {retries.added - len(retries.gave_up):,} recovered, "
+              f"{len(retries.gave_up):,} given up")
+    
+    # Coverage of the versions this scan was responsible for, from the checkpoint's completed ranges
+    gaps = intersect_ranges(checkpoint.missing_ranges(), scan_ranges)
+    scan_size = sum(end - start + 1 for start, end in scan_ranges)
+    if not gaps:
+        print(f"🧩 Coverage: 100% - all {scan_size:,} versions classified")
+    else:
+        missing = sum(end - start + 1 for start, end in gaps)
+        print(f"⚠️  Coverage: {scan_size - missing:,} / {scan_size:,} versions classified, {missing:,} missing in "
+              f"{len(gaps)} gap(s) (run with --resume to retry them):")
+        for start, end in gaps[:MAX_REPORTED_GAPS]:
+            print(f"    {start}" if start == end else f"    {start}-{end}")
+        if len(gaps) > MAX_REPORTED_GAPS:
+            print(f"    ... and {len(gaps) - MAX_REPORTED_GAPS:,} more")
     print(f"💰 Total CASH transactions found: {len(cash_transactions)}")
+    if len(watchlist) > 1:
+        for label in watchlist.labels:
+            print(f"  🏷️  {label}: {cash_transactions.token_counts[label]:,}")
+    # Windows end at the newest match found
+    windows = aggregates.snapshot()
+    for summary in windows:
+        print(f"📈 {describe_window(summary)}")
+    
+    if match_index is not None:
+        print(f"🗂️  Match index: {match_index.added:,} matches written to {index_path} "
+              f"(python match_index.py query --help)")
+    print(f"🧮 Full JSON decodes: {prefilter.decoded:,} ({prefilter.skipped:,} skipped by prefilter)")
+    if classifier is not None:
+        print(f"🧵 Classifier pool: {classifier.pages:,} pages across {classifier.workers} worker processes, "
+              f"{classifier.decoded:,} full decodes ({classifier.skipped:,} skipped)")
+    if client.store is not None:
+        print(f"💽 Local store: {client.store.hits:,} versions served from disk, "
+              f"{client.store.size_bytes() / 1024 ** 2:.1f} MB stored")
+    
+    print(f"\n🌐 NODE USAGE:")
+    for node in nodes:
+        status = "healthy" if node.healthy else "retired"
+        limiter = client.limiter(node.node_url)
+        print(f"  {node.node_url}: {node.ranges_done:,} ranges fetched, {node.ranges_failed:,} failed ({status})")
+        print(f"    ⏱️  Settled rate: {limiter.rate:.1f} req/s, {limiter.throttled:,} throttled responses")
     
     if cash_transactions:
         print(f"\n📋 HISTORICAL CASH TRANSACTION DETAILS:")
-        for i, txn in enumerate(cash_transactions, 1):
-            print(f"  #{i}: {txn['timestamp']} - Version {txn['version']} - {txn['hash'][:20]}...")
+        for line in cash_transactions.summary_lines():
+            print(line)
     else:
         print("❌ No CASH transactions found in historical scan")
     
     print("✅ Historical scanner completed!")
+    events.publish(AggregateSnapshot(HISTORICAL, windows))
+    events.publish(ScanFinished(HISTORICAL, transactions_checked, len(cash_transactions)))
+    # Every match as a cash_txn_info dict, read back from the spill file
+    matches = cash_transactions.all_infos()
+    cash_transactions.close()
+    return matches
 
 if __name__ == "__main__":
-    asyncio.run(scan_historical_cash_transactions()) 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Scan historical transactions for CASH token activity")
+    parser.add_argument("--resume", action="store_true",
+                        help="Resume an interrupted scan, fetching only versions the checkpoint is missing")
+    parser.add_argument("--checkpoint", default=CHECKPOINT_PATH,
+                        help=f"Checkpoint file (default: {CHECKPOINT_PATH})")
+    parser.add_argument("--store", default=STORE_PATH,
+                        help=f"Local transaction store (default: {STORE_PATH})")
+    parser.add_argument("--no-store", action="store_true",
+                        help="Always fetch from the network; don't read or write the local store")
+    parser.add_argument("--store-slim", action="store_true",
+                        help="Store only the fields the scanners read, not whole transactions")
+    parser.add_argument("--jsonl", metavar="PATH",
+                        help="Also write JSON-lines events to PATH (a file or pipe; '-' for stdout, "
+                             "which moves the console output to stderr)")
+    window = parser.add_argument_group("time window (default: the last 100,000 versions)")
+    window.add_argument("--since", metavar="DURATION", help="Scan the last DURATION, e.g. 90m, 24h, 7d")
+    window.add_argument("--from", dest="start", metavar="DATE", help="Scan from DATE (e.g. 2024-05-01T12:00)")
+    window.add_argument("--to", dest="end", metavar="DATE", help="...up to DATE (default: now)")
+    parser.add_argument("--index", default=MATCH_INDEX_PATH,
+                        help=f"Queryable index matches are appended to (default: {MATCH_INDEX_PATH})")
+    parser.add_argument("--no-index", action="store_true", help="Don't write matches to the index")
+    parser.add_argument("--workers", type=int, nargs="?", const=DEFAULT_WORKERS, default=0, metavar="N",
+                        help=f"Decode and classify pages in N worker processes (default N: {DEFAULT_WORKERS}, "
+                             "one per core; off unless given)")
+    parser.add_argument("--watchlist", metavar="PATH",
+                        help="Tokens to watch instead of CASH: a JSON object or 'LABEL type_tag' lines")
+    parser.add_argument("--token", action="append", default=[], metavar="LABEL=TYPE",
+                        help="Also watch a token or pool type tag (repeatable)")
+    parser.add_argument("--encoding", choices=ENCODINGS, default=DEFAULT_ENCODING,
+                        help=f"Page encoding to ask nodes for, falling back to JSON (default: {DEFAULT_ENCODING})")
+    parser.add_argument("--metrics-port", type=int, nargs="?", const=METRICS_PORT, metavar="PORT",
+                        help=f"Serve Prometheus metrics on 127.0.0.1:PORT/metrics (default port: {METRICS_PORT})")
+    args = parser.parse_args()
+    try:
+        time_window = parse_time_window(args.since, args.start, args.end)
+        watchlist = build_watchlist(DEFAULT_WATCHLIST, args.watchlist, args.token)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    
+    try:
+        with redirect_stdout(sys.stderr) if args.jsonl == "-" else nullcontext():
+            asyncio.run(run_with_metrics(scan_historical_cash_transactions(
+                resume=args.resume, checkpoint_path=args.checkpoint,
+                store_path=None if args.no_store else args.store, jsonl=args.jsonl, time_window=time_window,
+                watchlist=watchlist, index_path=None if args.no_index else args.index,
+                encoding=args.encoding, workers=args.workers, store_slim=args.store_slim),
+                args.metrics_port))
+    except KeyboardInterrupt:
+        print("\n🛑 Historical scan interrupted - run with --resume to continue") 
\ No newline at end of file
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+Queryable local index of the CASH transactions the scanners found.
+
+Both scanners append every match to a SQLite index as they go (the
+realtime monitor commits each alert straight away), so earlier results
+can be looked up without rescanning or grepping logs:
+
+    python match_index.py query --sender 0x61ed...
+    python match_index.py query --hash 0x3f9a --json
+    python match_index.py query --versions 1000000-1100000 --token CASH
+    python match_index.py query --since 24h
+    python match_index.py import historical_scan.checkpoint
+
+Sender, hash, version and time lookups are each served by an index.
+"""
+
+import argparse
+import json
+import sqlite3
+import sys
+import time
+import zlib
+from datetime import datetime
+
+from checkpoint import decode_match
+from scan_events import HISTORICAL
+from time_index import parse_time_window, to_micros
+from watchlist import normalize_type_tag
+
+MATCH_INDEX_PATH = "matches.sqlite"
+FLUSH_MATCHES = 200  # Queued matches that trigger a commit
+FLUSH_INTERVAL = 1.0  # Seconds a match may wait in the queue before it's committed
+QUERY_LIMIT = 100  # Rows returned by default
+
+
+def _hash_upper_bound(prefix):
+    """The smallest string greater than every string starting with `prefix`"""
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+class MatchIndex:
+    """SQLite index of matches by version, sender, hash and time"""
+
+    def __init__(self, path=MATCH_INDEX_PATH):
+        self.path = path
+        self.added = 0
+        self._pending = []
+        self._last_flush = time.time()
+        # Both scanners can write to one index from the same process
+        self._db = sqlite3.connect(path, timeout=10)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS matches ("
+            "version INTEGER PRIMARY KEY, timestamp_us INTEGER NOT NULL, hash TEXT NOT NULL, "
+            "sender TEXT NOT NULL, tokens TEXT NOT NULL, function TEXT, source TEXT, data BLOB NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS matches_sender ON matches (sender, version)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS matches_hash ON matches (hash)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS matches_time ON matches (timestamp_us)")
+        self._db.commit()
+
+    def add(self, cash_txn_info, source=None):
+        """Queue a match; it's committed in batches (see flush)"""
+        timestamp = cash_txn_info['timestamp']
+        data = zlib.compress(json.dumps({'events': cash_txn_info.get('events', []),
+                                         'payload': cash_txn_info.get('payload', {})},
+                                        separators=(",", ":")).encode())
+        sender = normalize_type_tag(cash_txn_info.get('sender', 'unknown'))
+        self._pending.append((cash_txn_info['version'], round(timestamp.timestamp() * 1000000),
+                              cash_txn_info['hash'].lower(), sender, json.dumps(list(cash_txn_info.get('tokens', []))),
+                              (cash_txn_info.get('payload') or {}).get('function'), source, data))
+        if len(self._pending) >= FLUSH_MATCHES or time.time() - self._last_flush >= FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        """Commit every queued match"""
+        self._last_flush = time.time()
+        if not self._pending:
+            return
+        # Rescanning a version replaces its row, so the index never holds duplicates
+        self._db.executemany("INSERT OR REPLACE INTO matches VALUES (?, ?, ?, ?, ?, ?, ?, ?)", self._pending)
+        self._db.commit()
+        self.added += len(self._pending)
+        self._pending = []
+
+    def count(self):
+        return self._db.execute("SELECT COUNT(*) FROM matches").fetchone()[0]
+
+    def query(self, sender=None, hash_prefix=None, start_version=None, end_version=None, start_time=None,
+              end_time=None, token=None, limit=QUERY_LIMIT, full=False):
+        """Matches meeting every given filter, newest first, as cash_txn_info dicts
+
+        Times are datetimes (end exclusive); `full` also loads each match's
+        events and payload.
+        """
+        clauses, params = [], []
+        if sender is not None:
+            clauses.append("sender = ?")
+            params.append(normalize_type_tag(sender))
+        if hash_prefix:
+            hash_prefix = hash_prefix.lower()
+            if not hash_prefix.startswith("0x"):
+                hash_prefix = "0x" + hash_prefix
+            clauses.append("hash >= ? AND hash < ?")
+            params += [hash_prefix, _hash_upper_bound(hash_prefix)]
+        if start_version is not None:
+            clauses.append("version >= ?")
+            params.append(start_version)
+        if end_version is not None:
+            clauses.append("version <= ?")
+            params.append(end_version)
+        if start_time is not None:
+            clauses.append("timestamp_us >= ?")
+            params.append(to_micros(start_time))
+        if end_time is not None:
+            clauses.append("timestamp_us < ?")
+            params.append(to_micros(end_time))
+        if token is not None:
+            clauses.append("EXISTS (SELECT 1 FROM json_each(matches.tokens) WHERE value = ?)")
+            params.append(token)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        columns = "version, timestamp_us, hash, sender, tokens, source" + (", data" if full else "")
+        rows = self._db.execute(f"SELECT {columns} FROM matches{where} ORDER BY version DESC LIMIT ?",
+                                params + [limit]).fetchall()
+        matches = []
+        for row in rows:
+            cash_txn_info = {'version': row[0], 'timestamp': datetime.fromtimestamp(row[1] / 1000000),
+                             'hash': row[2], 'sender': row[3], 'tokens': json.loads(row[4]), 'source': row[5]}
+            if full:
+                cash_txn_info.update(json.loads(zlib.decompress(row[6])))
+            matches.append(cash_txn_info)
+        return matches
+
+    def close(self):
+        """Commit what's queued and close the database"""
+        self.flush()
+        self._db.close()
+
+
+def import_checkpoint(index, checkpoint_path):
+    """Add the matches recorded in a historical scan checkpoint; returns how many"""
+    imported = 0
+    with open(checkpoint_path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break  # Torn final write
+            if record.get("type") == "match":
+                index.add(decode_match(record), source=HISTORICAL)
+                imported += 1
+    index.flush()
+    return imported
+
+
+def parse_version_range(text):
+    """'START-END', 'START-' or '-END' as (start, end) with None for an open side"""
+    start, sep, end = text.partition("-")
+    try:
+        if not sep:
+            return int(start), int(start)
+        return (int(start) if start else None), (int(end) if end else None)
+    except ValueError:
+        raise ValueError(f"Invalid version range {text!r} (expected e.g. 1000-2000, 1000- or -2000)")
+
+
+def run_query(args):
+    try:
+        start_version, end_version = parse_version_range(args.versions) if args.versions else (None, None)
+        window = parse_time_window(args.since, args.start, args.end)
+    except ValueError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 2
+    start_time, end_time = window if window else (None, None)
+
+    index = MatchIndex(args.index)
+    started = time.perf_counter()
+    matches = index.query(sender=args.sender, hash_prefix=args.hash, start_version=start_version,
+                          end_version=end_version, start_time=start_time, end_time=end_time, token=args.token,
+                          limit=args.limit, full=args.json)
+    elapsed = time.perf_counter() - started
+    total = index.count()
+    index.close()
+
+    if args.json:
+        for match in matches:
+            match['timestamp'] = match['timestamp'].isoformat()
+            print(json.dumps(match, separators=(",", ":")))
+        return 0
+    for match in matches:
+        tokens = f" [{', '.join(match['tokens'])}]" if match['tokens'] else ""
+        print(f"  {match['timestamp']} - Version {match['version']} - {match['hash'][:20]}... - "
+              f"{match['sender'][:20]}...{tokens}")
+    more = " (limit reached)" if len(matches) == args.limit else ""
+    print(f"🔎 {len(matches):,} of {total:,} indexed matches{more} in {elapsed * 1000:.1f} ms")
+    return 0
+
+
+def run_import(args):
+    index = MatchIndex(args.index)
+    total = 0
+    for path in args.checkpoints:
+        imported = import_checkpoint(index, path)
+        print(f"📥 {path}: {imported:,} matches")
+        total += imported
+    print(f"✅ Index {args.index} now holds {index.count():,} matches ({total:,} imported)")
+    index.close()
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the local index of CASH transactions found by the scanners")
+    parser.add_argument("--index", default=MATCH_INDEX_PATH, help=f"Match index (default: {MATCH_INDEX_PATH})")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    query = commands.add_parser("query", help="Look up indexed matches (filters combine)")
+    query.add_argument("--sender", metavar="ADDRESS", help="Sent by ADDRESS")
+    query.add_argument("--hash", metavar="PREFIX", help="Transaction hash starts with PREFIX")
+    query.add_argument("--versions", metavar="START-END", help="Version range (either side may be left open)")
+    query.add_argument("--token", metavar="LABEL", help="Matched this watchlist token")
+    query.add_argument("--since", metavar="DURATION", help="Block time within the last DURATION, e.g. 90m, 24h")
+    query.add_argument("--from", dest="start", metavar="DATE", help="Block time from DATE (e.g. 2024-05-01T12:00)")
+    query.add_argument("--to", dest="end", metavar="DATE", help="...up to DATE")
+    query.add_argument("--limit", type=int, default=QUERY_LIMIT, help=f"Most rows shown (default: {QUERY_LIMIT})")
+    query.add_argument("--json", action="store_true", help="Full JSON-lines records, with events and payload")
+    query.set_defaults(run=run_query)
+
+    import_ = commands.add_parser("import", help="Index the matches recorded in historical scan checkpoints")
+    import_.add_argument("checkpoints", nargs="+", metavar="CHECKPOINT")
+    import_.set_defaults(run=run_import)
+
+    args = parser.parse_args()
+    sys.exit(args.run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""
+Bounded-memory bookkeeping for matches.
+
+A long-running monitor can't keep every match's full events and payload
+in RAM. Each match becomes a small __slots__ MatchRecord (version,
+timestamp, hash, sender and the offset of its payload in a spill file);
+the whole match is appended to the spill file on disk, and only the most
+recent RING_CAPACITY records stay in memory for the final summary. A
+finished scan reads its matches back from the spill as cash_txn_info
+dicts.
+"""
+
+import json
+import tempfile
+from collections import Counter, deque
+from datetime import datetime
+
+from aggregates import coin_stores
+
+RING_CAPACITY = 1000  # Most recent matches kept in memory
+
+
+def build_cash_txn_info(version, txn, tokens):
+    """The cash_txn_info record kept for every match (historical, realtime and indexed alike)"""
+    return {
+        'version': version,
+        'timestamp': datetime.fromtimestamp(int(txn['timestamp']) / 1000000),
+        'hash': txn['hash'],
+        'sender': txn.get('sender', 'unknown'),
+        'tokens': tokens,
+        'events': txn.get('events', []),
+        'payload': txn.get('payload', {}),
+        # Which coin each withdraw/deposit event moved (see aggregates.coin_stores)
+        'coin_stores': coin_stores(txn)
+    }
+
+
+class MatchRecord:
+    """Compact in-memory form of a cash_txn_info dict"""
+
+    __slots__ = ("version", "timestamp_us", "hash", "sender", "tokens", "offset", "length")
+
+    def __init__(self, version, timestamp_us, hash, sender, tokens=(), offset=None, length=0):
+        self.version = version
+        self.timestamp_us = timestamp_us
+        self.hash = hash
+        self.sender = sender
+        self.tokens = tokens  # Watchlist labels the transaction matched
+        self.offset = offset  # Where events/payload live in the spill file (None if not spilled)
+        self.length = length
+
+    @property
+    def timestamp(self):
+        return datetime.fromtimestamp(self.timestamp_us / 1000000)
+
+    @classmethod
+    def from_info(cls, cash_txn_info, offset=None, length=0):
+        timestamp = cash_txn_info['timestamp']
+        if isinstance(timestamp, datetime):
+            timestamp_us = round(timestamp.timestamp() * 1000000)
+        else:
+            timestamp_us = int(timestamp)
+        return cls(cash_txn_info['version'], timestamp_us, cash_txn_info['hash'],
+                   cash_txn_info.get('sender', 'unknown'), tuple(cash_txn_info.get('tokens', ())), offset, length)
+
+
+class PayloadSpill:
+    """Append-only file of whole matches, read back by offset or all in order"""
+
+    def __init__(self, path=None):
+        # Without a path the spill lives in an anonymous temp file that's removed on close
+        self.path = path
+        self._file = open(path, "a+b") if path else tempfile.TemporaryFile()
+        self._file.seek(0, 2)
+        self._start = self._end = self._file.tell()
+
+    def write(self, cash_txn_info):
+        """Append a match; returns (offset, length)"""
+        record = MatchRecord.from_info(cash_txn_info)
+        data = json.dumps({'version': record.version, 'timestamp_us': record.timestamp_us, 'hash': record.hash,
+                           'sender': record.sender, 'tokens': list(record.tokens),
+                           'events': cash_txn_info.get('events', []), 'payload': cash_txn_info.get('payload', {}),
+                           'coin_stores': cash_txn_info.get('coin_stores', {})}, separators=(",", ":")).encode() + b"\n"
+        offset = self._end
+        self._file.seek(offset)
+        self._file.write(data)
+        self._end += len(data)
+        return offset, len(data)
+
+    def read(self, offset, length):
+        """The dict spilled at `offset`"""
+        self._file.flush()
+        self._file.seek(offset)
+        return json.loads(self._file.read(length))
+
+    def read_all(self):
+        """Every dict this spill wrote, in order"""
+        self._file.flush()
+        self._file.seek(self._start)
+        return [json.loads(line) for line in self._file.read(self._end - self._start).splitlines()]
+
+    def close(self):
+        self._file.close()
+
+
+class MatchLog:
+    """Counts every match, spills its payload to disk and keeps only a ring buffer in memory"""
+
+    def __init__(self, capacity=RING_CAPACITY, spill_path=None, spill=True):
+        self.recent = deque(maxlen=capacity)
+        self.count = 0
+        self.token_counts = Counter()  # Matches per watchlist label, over every match
+        self.spill = PayloadSpill(spill_path) if spill else None
+
+    def __len__(self):
+        return self.count
+
+    def append(self, cash_txn_info):
+        """Record a match; returns its MatchRecord"""
+        offset, length = self.spill.write(cash_txn_info) if self.spill is not None else (None, 0)
+        record = MatchRecord.from_info(cash_txn_info, offset, length)
+        self.recent.append(record)
+        self.count += 1
+        self.token_counts.update(record.tokens)
+        return record
+
+    def extend(self, infos):
+        for cash_txn_info in infos:
+            self.append(cash_txn_info)
+
+    def load(self, record):
+        """Full cash_txn_info for a record, read back from the spill file"""
+        info = {'version': record.version, 'timestamp': record.timestamp, 'hash': record.hash,
+                'sender': record.sender, 'tokens': list(record.tokens), 'events': [], 'payload': {},
+                'coin_stores': {}}
+        if self.spill is not None and record.offset is not None:
+            spilled = self.spill.read(record.offset, record.length)
+            info['events'] = spilled['events']
+            info['payload'] = spilled['payload']
+            info['coin_stores'] = spilled.get('coin_stores', {})
+        return info
+
+    def all_infos(self):
+        """Every match's cash_txn_info, in the order they were recorded
+
+        Read back from the spill file; without one only the in-memory
+        matches are left. Call it before close().
+        """
+        if self.spill is None:
+            return [self.load(record) for record in self.recent]
+        infos = []
+        for spilled in self.spill.read_all():
+            info = {key: spilled[key] for key in ('version', 'hash', 'sender', 'tokens', 'events', 'payload',
+                                                  'coin_stores')}
+            info['timestamp'] = datetime.fromtimestamp(spilled['timestamp_us'] / 1000000)
+            infos.append(info)
+        return infos
+
+    def summary_lines(self):
+        """Final-summary lines for the matches still in memory"""
+        lines = []
+        first = self.count - len(self.recent) + 1
+        if first > 1:
+            lines.append(f"  ... {first - 1:,} earlier matches not kept in memory")
+        for i, record in enumerate(self.recent, first):
+            tokens = f" [{', '.join(record.tokens)}]" if record.tokens else ""
+            lines.append(f"  #{i}: {record.timestamp} - Version {record.version} - {record.hash[:20]}...{tokens}")
+        return lines
+
+    def close(self):
+        if self.spill is not None:
+            self.spill.close()
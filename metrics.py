@@ -0,0 +1,272 @@
+"""
+Runtime metrics for the scanners, exposed in the Prometheus text format.
+
+Recording is just an attribute increment on a pre-resolved child, so the
+hot loops bind their labelled children once and can leave metrics on all
+the time. start_metrics_server() serves REGISTRY on a local HTTP port:
+
+    curl http://127.0.0.1:9108/metrics
+"""
+
+import bisect
+
+from aiohttp import web
+
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9108
+
+# Node request latency bucket upper bounds (seconds)
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Value:
+    """One labelled counter or gauge value"""
+
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def set(self, value):
+        self.value = value
+
+    def reset(self):
+        self.value = 0
+
+
+class _HistogramValue:
+    """One labelled histogram: cumulative-on-render bucket counts, sum and count"""
+
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def reset(self):
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, fraction):
+        """Estimate a quantile by linear interpolation inside its bucket, like histogram_quantile()"""
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        seen = 0
+        lower = 0.0
+        for bound, count in zip(self.bounds, self.counts):
+            if count and seen + count >= rank:
+                return lower + (bound - lower) * (rank - seen) / count
+            seen += count
+            lower = bound
+        return self.bounds[-1]
+
+
+class Metric:
+    """A named metric family with a fixed set of label names"""
+
+    kind = None
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.children = {}
+
+    def _new_child(self):
+        return _Value()
+
+    def labels(self, *values):
+        """The child for these label values; bind it once outside hot loops"""
+        child = self.children.get(values)
+        if child is None:
+            child = self.children[values] = self._new_child()
+        return child
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def set(self, value):
+        self.labels().set(value)
+
+    def reset(self):
+        # Zeroed in place: hot loops keep references to their bound children
+        for child in self.children.values():
+            child.reset()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in sorted(self.children.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}")
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=REQUEST_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(buckets)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in sorted(self.children.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, values, [("le", _format_value(bound))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(child.sum)}")
+            lines.append(f"{self.name}_count{labels} {child.count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Every metric the process exposes"""
+
+    def __init__(self):
+        self.metrics = []
+
+    def _register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._register(Counter(name, help_text, labelnames))
+
+    def gauge(self, name, help_text, labelnames=()):
+        return self._register(Gauge(name, help_text, labelnames))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=REQUEST_BUCKETS):
+        return self._register(Histogram(name, help_text, labelnames, buckets))
+
+    def reset(self):
+        """Drop every recorded value (between benchmark runs)"""
+        for metric in self.metrics:
+            metric.reset()
+
+    def render(self):
+        """The whole registry in the Prometheus text exposition format"""
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+# Node requests (labelled by node origin)
+NODE_REQUEST_SECONDS = REGISTRY.histogram(
+    "cash_scanner_node_request_seconds", "Time from sending a node request to its response headers", ("node",))
+NODE_RESPONSES = REGISTRY.counter(
+    "cash_scanner_node_responses_total", "Node responses by HTTP status (429 throttled, 404 not found)",
+    ("node", "status"))
+NODE_REQUEST_FAILURES = REGISTRY.counter(
+    "cash_scanner_node_request_failures_total", "Node requests that got no response, by reason (timeout, error)",
+    ("node", "reason"))
+NODE_RATE_LIMIT = REGISTRY.gauge(
+    "cash_scanner_node_rate_limit", "Current adaptive request rate allowed per node (req/s)", ("node",))
+PAGE_BYTES = REGISTRY.counter(
+    "cash_scanner_page_bytes_total", "Transaction page bytes received after decompression, by encoding (json, bcs)",
+    ("encoding",))
+BCS_FALLBACKS = REGISTRY.counter(
+    "cash_scanner_bcs_fallbacks_total", "BCS pages answered or re-fetched as JSON, by reason (unsupported, decode)",
+    ("node", "reason"))
+HEDGED_REQUESTS = REGISTRY.counter(
+    "cash_scanner_hedged_requests_total",
+    "Slow transaction pages and single-version lookups duplicated to a backup node, by kind (page, lookup) "
+    "and outcome (sent, won, over_budget)", ("node", "kind", "outcome"))
+
+# Versions through the pipeline (labelled by scanner or by where they came from)
+VERSIONS_FETCHED = REGISTRY.counter(
+    "cash_scanner_versions_fetched_total", "Versions obtained, by origin (network, store)", ("origin",))
+VERSIONS_CLASSIFIED = REGISTRY.counter(
+    "cash_scanner_versions_classified_total", "Versions run through the CASH classifier", ("source",))
+VERSIONS_UNFETCHED = REGISTRY.counter(
+    "cash_scanner_versions_unfetched_total", "Versions that could not be fetched at all", ("source",))
+MATCHES = REGISTRY.counter(
+    "cash_scanner_matches_total", "CASH transactions found", ("source",))
+TOKEN_MATCHES = REGISTRY.counter(
+    "cash_scanner_token_matches_total", "Matches per watchlist token (a transaction can match several)",
+    ("source", "token"))
+
+# Sliding-window aggregates (see aggregates.py), as of the latest snapshot
+WINDOW_MATCHES = REGISTRY.gauge(
+    "cash_scanner_window_matches", "Matches inside each sliding window", ("source", "window"))
+WINDOW_VOLUME = REGISTRY.gauge(
+    "cash_scanner_window_volume", "Raw coin amount moved per watchlist token inside each sliding window",
+    ("source", "window", "token"))
+
+# Queues and lag
+QUEUE_DEPTH = REGISTRY.gauge(
+    "cash_scanner_queue_depth", "Items waiting in each pipeline queue", ("queue",))
+REALTIME_BEHIND = REGISTRY.gauge(
+    "cash_scanner_realtime_versions_behind", "Versions between the live tail and the chain head")
+
+
+async def handle_metrics(request):
+    return web.Response(text=request.app["registry"].render(), content_type="text/plain", charset="utf-8",
+                        headers={"X-Content-Type-Options": "nosniff"})
+
+
+async def start_metrics_server(port=METRICS_PORT, host=METRICS_HOST, registry=REGISTRY):
+    """Serve `registry` at http://host:port/metrics; returns the runner (call runner.cleanup() to stop)"""
+    app = web.Application()
+    app["registry"] = registry
+    app.router.add_get("/metrics", handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    print(f"📈 Metrics at http://{host}:{port}/metrics")
+    return runner
+
+
+async def run_with_metrics(coro, port=None, host=METRICS_HOST):
+    """Await `coro` while serving metrics on `port` (no server when port is None)"""
+    if port is None:
+        return await coro
+    runner = await start_metrics_server(port, host)
+    try:
+        return await coro
+    finally:
+        await runner.cleanup()
@@ -0,0 +1,184 @@
+"""
+Shared HTTP client that keeps one keep-alive connection pool per Aptos node.
+"""
+
+import asyncio
+import ssl
+import time
+from contextlib import asynccontextmanager
+
+import aiohttp
+from yarl import URL
+
+from metrics import BCS_FALLBACKS, NODE_RATE_LIMIT, NODE_REQUEST_FAILURES, NODE_REQUEST_SECONDS, NODE_RESPONSES
+from rate_limiter import INITIAL_RATE, MAX_RATE, RateLimiter, parse_retry_after
+from scan_events import NodeThrottled
+
+# Connection pool settings
+POOL_LIMIT = 100  # Max open connections per node pool
+POOL_LIMIT_PER_HOST = 50  # Max open connections to a single host
+DNS_CACHE_TTL = 300  # Seconds to cache resolved node addresses
+KEEPALIVE_TIMEOUT = 60  # Seconds an idle connection stays open for reuse
+REQUEST_TIMEOUT = 15  # Seconds before a single request gives up
+
+# Response encodings: every response may come compressed, and transaction
+# pages are asked for as BCS ("bcs") or JSON ("json")
+ACCEPT_ENCODING = "gzip, deflate"
+ENCODINGS = ("bcs", "json")
+DEFAULT_ENCODING = "json"  # BCS (--encoding bcs) is opt-in: bcs.py only knows the layouts it was tested on
+MAX_BCS_FAILURES = 3  # Undecodable BCS pages before a node is only asked for JSON
+
+# Create SSL context that bypasses certificate issues
+ssl_context = ssl.create_default_context()
+ssl_context.check_hostname = False
+ssl_context.verify_mode = ssl.CERT_NONE
+
+
+def node_origin(node_url):
+    """Return the scheme://host:port part of a node URL"""
+    return str(URL(node_url).origin())
+
+
+class NodeClient:
+    """Owns one pooled aiohttp session and one rate limiter per node origin
+
+    "https://node" and "https://node/v1" share the same pool, so every
+    request to a node reuses warm TCP/TLS connections instead of paying
+    for a fresh handshake. Every request also waits on, and reports back
+    to, that node's adaptive rate limiter. An optional TransactionStore
+    rides along so the fetchers can serve versions from disk, and an
+    optional EventStream is told about every throttled response. Request
+    latency, response statuses and failures are recorded in metrics.
+    `encoding` is the preferred page encoding; each node is switched to
+    JSON once it shows it can't serve BCS.
+    """
+
+    def __init__(self, pool_limit=POOL_LIMIT, pool_limit_per_host=POOL_LIMIT_PER_HOST,
+                 dns_cache_ttl=DNS_CACHE_TTL, keepalive_timeout=KEEPALIVE_TIMEOUT,
+                 request_timeout=REQUEST_TIMEOUT, initial_rate=INITIAL_RATE, max_rate=MAX_RATE,
+                 store=None, events=None, encoding=DEFAULT_ENCODING):
+        if encoding not in ENCODINGS:
+            raise ValueError(f"Unknown encoding {encoding!r} (expected one of {', '.join(ENCODINGS)})")
+        self.pool_limit = pool_limit
+        self.pool_limit_per_host = pool_limit_per_host
+        self.dns_cache_ttl = dns_cache_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self.request_timeout = request_timeout
+        self.initial_rate = initial_rate
+        self.max_rate = max_rate
+        self.store = store
+        self.events = events
+        self.encoding = encoding
+        self._sessions = {}
+        self._bcs_failures = {}
+        self._limiters = {}
+        self._node_metrics = {}
+        self._background = set()
+
+    def session(self, node_url):
+        """Get (or lazily create) the pooled session for a node"""
+        origin = node_origin(node_url)
+        session = self._sessions.get(origin)
+        if session is None or session.closed:
+            connector = aiohttp.TCPConnector(
+                ssl=ssl_context,
+                limit=self.pool_limit,
+                limit_per_host=self.pool_limit_per_host,
+                ttl_dns_cache=self.dns_cache_ttl,
+                use_dns_cache=True,
+                keepalive_timeout=self.keepalive_timeout,
+            )
+            timeout = aiohttp.ClientTimeout(total=self.request_timeout)
+            session = aiohttp.ClientSession(connector=connector, timeout=timeout,
+                                            headers={"Accept-Encoding": ACCEPT_ENCODING})
+            self._sessions[origin] = session
+        return session
+
+    def limiter(self, node_url):
+        """Get (or lazily create) the rate limiter for a node"""
+        origin = node_origin(node_url)
+        limiter = self._limiters.get(origin)
+        if limiter is None:
+            limiter = RateLimiter(rate=self.initial_rate, max_rate=self.max_rate)
+            self._limiters[origin] = limiter
+        return limiter
+
+    def node_metrics(self, node_url):
+        """(latency histogram, rate gauge, statuses dict) for a node's origin, bound once"""
+        origin = node_origin(node_url)
+        bound = self._node_metrics.get(origin)
+        if bound is None:
+            bound = self._node_metrics[origin] = (NODE_REQUEST_SECONDS.labels(origin),
+                                                  NODE_RATE_LIMIT.labels(origin), {})
+        return bound
+
+    def accepts_bcs(self, node_url):
+        """Whether transaction pages from this node should be asked for as BCS"""
+        return self.encoding == "bcs" and self._bcs_failures.get(node_origin(node_url), 0) < MAX_BCS_FAILURES
+
+    def bcs_failed(self, node_url, error):
+        """A BCS page from this node didn't decode; after MAX_BCS_FAILURES the node gets JSON requests only"""
+        origin = node_origin(node_url)
+        BCS_FALLBACKS.labels(origin, "decode").inc()
+        failures = self._bcs_failures[origin] = self._bcs_failures.get(origin, 0) + 1
+        if failures == MAX_BCS_FAILURES:
+            print(f"⚠️  {origin}: BCS pages keep failing to decode ({error}), switching to JSON")
+
+    def bcs_unsupported(self, node_url):
+        """The node answered a BCS request with JSON: stop asking it for BCS"""
+        origin = node_origin(node_url)
+        BCS_FALLBACKS.labels(origin, "unsupported").inc()
+        self._bcs_failures[origin] = MAX_BCS_FAILURES
+
+    @asynccontextmanager
+    async def get(self, url, **kwargs):
+        """Issue a rate-limited GET through the pool that owns the URL's node"""
+        limiter = self.limiter(url)
+        latency, rate, statuses = self.node_metrics(url)
+        await limiter.acquire()
+        started = time.perf_counter()
+        try:
+            async with self.session(url).get(url, **kwargs) as response:
+                latency.observe(time.perf_counter() - started)
+                status = statuses.get(response.status)
+                if status is None:
+                    status = statuses[response.status] = NODE_RESPONSES.labels(node_origin(url), str(response.status))
+                status.inc()
+                retry_after = response.headers.get("Retry-After")
+                limiter.feedback(response.status, retry_after)
+                rate.set(limiter.rate)
+                if response.status == 429 and self.events is not None:
+                    self.events.publish(NodeThrottled(node_origin(url), limiter.rate, parse_retry_after(retry_after)))
+                yield response
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            reason = "timeout" if isinstance(e, asyncio.TimeoutError) else "error"
+            NODE_REQUEST_FAILURES.labels(node_origin(url), reason).inc()
+            limiter.on_error()
+            rate.set(limiter.rate)
+            raise
+
+    def spawn(self, coro):
+        """Run `coro` as a background task that's cancelled when the client closes"""
+        task = asyncio.ensure_future(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+        return task
+
+    async def close(self):
+        """Cancel background tasks, then close every pooled session and the transaction store"""
+        for task in list(self._background):
+            task.cancel()
+        await asyncio.gather(*self._background, return_exceptions=True)
+        sessions = list(self._sessions.values())
+        self._sessions.clear()
+        for session in sessions:
+            await session.close()
+        if self.store is not None:
+            self.store.close()
+            self.store = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
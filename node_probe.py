@@ -0,0 +1,187 @@
+"""
+Concurrent node probing with a cached last-known-good ranking.
+
+Every candidate node is probed at once with a short timeout. The first
+healthy responder can start a scan straight away while the rest finish
+and are ranked by measured latency. The ranking is saved to disk, so the
+next start skips probing every node: it only checks that the cached
+nodes it hands out still answer, uses them right away and re-probes
+everything in the background to confirm the ranking. Cached nodes that
+are down are left out; if none answers, every node is probed as if there
+were no cache.
+"""
+
+import asyncio
+import json
+import os
+import time
+
+import aiohttp
+
+NODE_RANKING_PATH = "node_ranking.json"
+PROBE_TIMEOUT = 5  # Seconds before a probe request gives up
+PROBE_GRACE = 1.0  # Seconds slower nodes get to answer after the first healthy one
+RANKING_MAX_AGE = 24 * 3600  # Seconds a cached ranking is trusted without probing every node first
+LIVENESS_TIMEOUT = 2  # Seconds a cached node gets to show it's still up
+
+
+class ProbeResult:
+    """Outcome of probing one node; `latency` is None if it didn't respond"""
+
+    __slots__ = ("node_url", "latency", "ledger_version")
+
+    def __init__(self, node_url, latency=None, ledger_version=None):
+        self.node_url = node_url
+        self.latency = latency
+        self.ledger_version = ledger_version
+
+    @property
+    def healthy(self):
+        return self.latency is not None
+
+    def describe(self):
+        if not self.healthy:
+            return f"❌ {self.node_url}"
+        version = f", ledger version: {self.ledger_version}" if self.ledger_version is not None else ""
+        return f"✅ {self.node_url} ({self.latency * 1000:.0f} ms{version})"
+
+
+async def probe_node(client, node_url, timeout=PROBE_TIMEOUT):
+    """Time one node's /v1 (falling back to /); never raises"""
+    client_timeout = aiohttp.ClientTimeout(total=timeout)
+    started = time.perf_counter()
+    try:
+        async with client.get(f"{node_url}/v1", timeout=client_timeout) as response:
+            if response.status == 200:
+                data = await response.json(content_type=None)
+                if "ledger_version" in data:
+                    return ProbeResult(node_url, time.perf_counter() - started, int(data["ledger_version"]))
+
+        async with client.get(f"{node_url}/", timeout=client_timeout) as response:
+            if response.status == 200:
+                return ProbeResult(node_url, time.perf_counter() - started)
+    except Exception:
+        pass
+    return ProbeResult(node_url)
+
+
+def rank(results):
+    """Healthy nodes fastest first, then the ones that failed"""
+    return sorted(results, key=lambda result: (not result.healthy, result.latency or 0))
+
+
+async def probe_nodes(client, node_urls, timeout=PROBE_TIMEOUT, first_healthy=None, results=None):
+    """Probe every node concurrently; returns all results, ranked
+
+    With a `first_healthy` future, it's resolved with the first healthy
+    result as soon as it arrives (or an exception if none is healthy).
+    Results are appended to `results`, if given, as they come in.
+    """
+    results = [] if results is None else results
+    for next_result in asyncio.as_completed([probe_node(client, node_url, timeout) for node_url in node_urls]):
+        result = await next_result
+        results.append(result)
+        if result.healthy and first_healthy is not None and not first_healthy.done():
+            first_healthy.set_result(result)
+    if first_healthy is not None and not first_healthy.done():
+        first_healthy.set_exception(Exception("No working nodes found"))
+    return rank(results)
+
+
+class NodeRanking:
+    """Last-known-good node ranking, cached on disk between runs"""
+
+    def __init__(self, path=NODE_RANKING_PATH, max_age=RANKING_MAX_AGE):
+        self.path = path
+        self.max_age = max_age
+
+    def load(self, node_urls):
+        """Cached healthy nodes among `node_urls`, fastest first ([] if missing or stale)"""
+        try:
+            with open(self.path) as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return []
+        if time.time() - cached.get("updated", 0) > self.max_age:
+            return []
+        return [entry["node_url"] for entry in cached.get("nodes", [])
+                if entry.get("latency") is not None and entry["node_url"] in node_urls]
+
+    def save(self, results):
+        """Replace the cached ranking atomically"""
+        nodes = [{"node_url": result.node_url, "latency": result.latency, "ledger_version": result.ledger_version}
+                 for result in rank(results)]
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump({"updated": time.time(), "nodes": nodes}, f, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"⚠️  Could not save node ranking to {self.path}: {e}")
+
+
+async def confirm_ranking(client, node_urls, ranking, in_use):
+    """Background re-probe of a cached ranking; saves the fresh one"""
+    results = await probe_nodes(client, node_urls)
+    ranking.save(results)
+    failed = [result.node_url for result in results if not result.healthy and result.node_url in in_use]
+    if failed:
+        print(f"⚠️  Cached node(s) no longer responding: {', '.join(failed)}")
+    else:
+        print(f"✅ Cached node ranking confirmed ({sum(result.healthy for result in results)} healthy)")
+    return results
+
+
+async def select_nodes(client, node_urls, wait_for_all=False, ranking_path=NODE_RANKING_PATH):
+    """Healthy nodes to scan with, fastest first
+
+    A fresh cached ranking is returned as soon as the nodes it returns
+    (just the fastest by default, every cached one with `wait_for_all`)
+    have answered one probe each; the ones that didn't are left out, and
+    the ranking is confirmed in the background. Otherwise (or if none
+    answers) every node is probed at once: by default the
+    first healthy responder is returned alone, without waiting for the
+    rest; with `wait_for_all` so is every node that answers within
+    PROBE_GRACE of it. Either way the full ranking is saved once all
+    probes finish. Raises if no node is healthy.
+    """
+    ranking = NodeRanking(ranking_path) if ranking_path else None
+    cached = ranking.load(node_urls) if ranking is not None else []
+    if cached:
+        # The caller commits work to every node it gets, so each one has to be up
+        candidates = cached if wait_for_all else cached[:1]
+        checks = await asyncio.gather(*(probe_node(client, node_url, LIVENESS_TIMEOUT) for node_url in candidates))
+        live = [check.node_url for check in checks if check.healthy]
+        if live:
+            print(f"⚡ Using cached node ranking from {ranking.path}; confirming in the background")
+            dead = [check.node_url for check in checks if not check.healthy]
+            if dead:
+                print(f"⚠️  Cached node(s) not responding, left out: {', '.join(dead)}")
+            client.spawn(confirm_ranking(client, node_urls, ranking, live))
+            return live
+        print(f"⚠️  Cached node(s) {', '.join(candidates)} aren't responding; probing every node")
+
+    first_healthy = asyncio.get_running_loop().create_future()
+    results = []
+
+    async def probe_and_save():
+        try:
+            await probe_nodes(client, node_urls, first_healthy=first_healthy, results=results)
+        finally:
+            # Even if the run ends first, keep what the probes found so far
+            if ranking is not None and any(result.healthy for result in results):
+                ranking.save(results)
+
+    probing = client.spawn(probe_and_save())
+    first = await first_healthy
+    if not wait_for_all:
+        print(f"  {first.describe()} answered first")
+        return [first.node_url]
+
+    # Nodes still silent after the grace period only make it into the saved ranking
+    await asyncio.wait({probing}, timeout=PROBE_GRACE)
+    for result in rank(results):
+        print(f"  {result.describe()}")
+    if not probing.done():
+        print(f"  ⏳ {len(node_urls) - len(results)} node(s) still probing in the background")
+    return [result.node_url for result in rank(results) if result.healthy]
@@ -0,0 +1,132 @@
+"""
+Multi-node scheduler: splits a version range across every healthy node and
+hands the results back in version order.
+"""
+
+import asyncio
+from collections import deque
+
+from metrics import QUEUE_DEPTH
+from transaction_fetcher import MAX_PAGE_SIZE, iter_transactions
+
+# Per-node defaults
+DEFAULT_NODE_CONCURRENCY = 8  # Ranges in flight per node
+NODE_FAILURE_LIMIT = 3  # Consecutive failed ranges before a node is retired
+MAX_RANGE_ATTEMPTS = 3  # Attempts per range before accepting missing versions
+
+
+class NodeBudget:
+    """Concurrency budget and health of one node in a scan
+
+    The node's request rate is governed separately by its adaptive
+    RateLimiter in NodeClient.
+    """
+
+    def __init__(self, node_url, concurrency=DEFAULT_NODE_CONCURRENCY):
+        self.node_url = node_url
+        self.concurrency = concurrency
+        self.healthy = True
+        self.consecutive_failures = 0
+        self.ranges_done = 0
+        self.ranges_failed = 0
+
+    def record(self, ok):
+        """Record the outcome of one range fetched from this node"""
+        if ok:
+            self.ranges_done += 1
+            self.consecutive_failures = 0
+        else:
+            self.ranges_failed += 1
+            self.consecutive_failures += 1
+
+
+async def iter_transactions_sharded(client, nodes, start_version, end_version, range_size=MAX_PAGE_SIZE,
+                                    prefilter=None, accept_partial=False, classifier=None):
+    """Yield (version, txn) for [start_version, end_version] in order, fetched from all `nodes`
+
+    `nodes` is a list of NodeBudget. Every node runs `concurrency` workers
+    that pull ranges from one shared work queue, so faster nodes naturally
+    take a bigger share. A range with missing versions is put back on the
+    queue for another node to retry, and a node that fails
+    NODE_FAILURE_LIMIT ranges in a row is retired while any other node is
+    still healthy. Results pass through a reorder buffer bounded to twice
+    the total concurrency. `prefilter` and `classifier` are passed on to
+    iter_transactions.
+    With `accept_partial`, a range that came back with only some versions
+    missing is handed over as is, for the caller to retry those versions
+    itself rather than re-fetching the whole range.
+    """
+    loop = asyncio.get_running_loop()
+    # Lowest range first, so a retried range jumps ahead of the rest of the scan
+    work = asyncio.PriorityQueue()
+    in_order = deque()
+    for range_start in range(start_version, end_version + 1, range_size):
+        range_end = min(range_start + range_size - 1, end_version)
+        result = loop.create_future()
+        work.put_nowait((range_start, range_end, 1, result))
+        in_order.append(result)
+
+    queued = QUEUE_DEPTH.labels("historical_ranges_queued")
+    ready = QUEUE_DEPTH.labels("historical_reorder_buffer")
+    queued.set(work.qsize())
+    ready.set(0)
+
+    total_concurrency = sum(max(1, node.concurrency) for node in nodes)
+    # Each range holds a window slot from dequeue until the consumer drains it
+    window = asyncio.Semaphore(total_concurrency * 2)
+
+    def other_node_healthy(node):
+        return any(other.healthy for other in nodes if other is not node)
+
+    async def worker(node):
+        while node.healthy:
+            await window.acquire()
+            range_start, range_end, attempt, result = await work.get()
+            queued.set(work.qsize())
+            try:
+                batch = [item async for item in iter_transactions(client, node.node_url, range_start, range_end,
+                                                                   range_size, prefilter, classifier)]
+            except Exception as e:
+                batch = None
+                error = e
+            ok = batch is not None and all(txn is not None for _, txn in batch)
+            partial = accept_partial and batch is not None and any(txn is not None for _, txn in batch)
+            node.record(ok)
+
+            if not ok and node.consecutive_failures >= NODE_FAILURE_LIMIT and other_node_healthy(node):
+                # Node is failing or throttled - retire it and let the others take its ranges
+                node.healthy = False
+
+            if ok or partial or attempt >= MAX_RANGE_ATTEMPTS or not (node.healthy or other_node_healthy(node)):
+                ready.inc()
+                if batch is None:
+                    result.set_exception(error)
+                else:
+                    result.set_result(batch)
+            else:
+                window.release()
+                work.put_nowait((range_start, range_end, attempt + 1, result))
+                queued.set(work.qsize())
+
+    tasks = [asyncio.create_task(worker(node)) for node in nodes for _ in range(max(1, node.concurrency))]
+    try:
+        while in_order:
+            batch = await in_order.popleft()
+            ready.inc(-1)
+            window.release()
+            for item in batch:
+                yield item
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def iter_transactions_concurrent(client, node_url, start_version, end_version,
+                                       workers=DEFAULT_NODE_CONCURRENCY, range_size=MAX_PAGE_SIZE,
+                                       prefilter=None):
+    """Yield (version, txn) for [start_version, end_version] in order from a single node's worker pool"""
+    node = NodeBudget(node_url, concurrency=workers)
+    async for item in iter_transactions_sharded(client, [node], start_version, end_version, range_size,
+                                                prefilter):
+        yield item
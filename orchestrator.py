@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Run the historical scanner and the real-time monitor in one process.
+
+Both scanners run as tasks in a single asyncio event loop. They share one
+NodeClient, so one connection pool, one adaptive rate limiter and one
+local store per node, and node discovery happens once. Alerts travel as
+typed events on a shared EventStream, rendered by one output layer,
+rather than being scraped from another process's stdout.
+"""
+
+import argparse
+import asyncio
+import sys
+from contextlib import nullcontext, redirect_stdout
+
+from checkpoint import CHECKPOINT_PATH
+from classifier_pool import DEFAULT_WORKERS
+from event_sink import build_event_stream
+from historical_cash_scanner import (DEFAULT_WATCHLIST, WATCHLIST, find_healthy_nodes,
+                                     scan_historical_cash_transactions)
+from match_index import MATCH_INDEX_PATH
+from metrics import METRICS_PORT, run_with_metrics
+from node_client import DEFAULT_ENCODING, ENCODINGS, NodeClient
+from realtime_cash_monitor import monitor_realtime_cash_transactions
+from transaction_store import STORE_PATH, TransactionStore
+from version_coverage import CoverageTracker
+from watchlist import build_watchlist
+
+
+async def run_orchestrated(resume=False, checkpoint_path=CHECKPOINT_PATH, store_path=STORE_PATH, jsonl=None,
+                           watchlist=WATCHLIST, index_path=MATCH_INDEX_PATH, encoding=DEFAULT_ENCODING, workers=0):
+    """Run both scanners on one watchlist until the historical scan finishes (or either one fails)"""
+    print("🚀 CASH Token Scanner Orchestrator")
+    print("=" * 60)
+    print("📚 Historical scanner and ⚡ real-time monitor in one event loop")
+    print("💡 Press Ctrl+C to stop both scanners.")
+    print("=" * 60)
+
+    # One output layer for both scanners: console rendering plus optional JSON lines
+    events = build_event_stream(watchlist, jsonl=jsonl)
+    store = TransactionStore(store_path) if store_path else None
+    async with NodeClient(store=store, events=events, encoding=encoding) as client:
+        # One probe for both scanners; realtime hedges to the healthy nodes it doesn't follow
+        try:
+            healthy_nodes = await find_healthy_nodes(client)
+        except Exception as e:
+            print(f"❌ Failed to connect: {e}")
+            await events.close()
+            return
+
+        # Historical and realtime claim versions here, so none is fetched twice
+        coverage = CoverageTracker()
+        realtime = asyncio.create_task(monitor_realtime_cash_transactions(
+            client, working_node=healthy_nodes[0], events=events, coverage=coverage, watchlist=watchlist,
+            index_path=index_path, hedge_nodes=healthy_nodes[1:]))
+        historical = asyncio.create_task(scan_historical_cash_transactions(
+            client, resume=resume, checkpoint_path=checkpoint_path, healthy_nodes=healthy_nodes, events=events,
+            coverage=coverage, watchlist=watchlist, index_path=index_path, workers=workers))
+
+        try:
+            done, _ = await asyncio.wait({historical, realtime}, return_when=asyncio.FIRST_COMPLETED)
+            if realtime in done and not historical.done():
+                print("\n⚠️  Real-time monitor has stopped unexpectedly!")
+                if realtime.exception() is not None:
+                    print(f"❌ {realtime.exception()}")
+            elif historical.exception() is not None:
+                print(f"\n❌ Historical scanner failed: {historical.exception()}")
+        finally:
+            print("\n🛑 Stopping scanners...")
+            for task in (historical, realtime):
+                task.cancel()
+            await asyncio.gather(historical, realtime, return_exceptions=True)
+            await events.close()
+
+        print(f"🧩 Versions covered without overlap: {coverage.claimed_count():,} in {len(coverage.ranges())} range(s)")
+
+    print(f"\n🎯 Both scanners have been stopped ({events.published:,} events).")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the historical scanner and real-time monitor in one process")
+    parser.add_argument("--resume", action="store_true", help="Resume an interrupted historical scan")
+    parser.add_argument("--checkpoint", default=CHECKPOINT_PATH,
+                        help=f"Historical scan checkpoint file (default: {CHECKPOINT_PATH})")
+    parser.add_argument("--store", default=STORE_PATH,
+                        help=f"Local transaction store (default: {STORE_PATH})")
+    parser.add_argument("--no-store", action="store_true", help="Don't read or write the local store")
+    parser.add_argument("--jsonl", metavar="PATH",
+                        help="Also write JSON-lines events to PATH (a file or pipe; '-' for stdout, "
+                             "which moves the console output to stderr)")
+    parser.add_argument("--metrics-port", type=int, nargs="?", const=METRICS_PORT, metavar="PORT",
+                        help=f"Serve Prometheus metrics on 127.0.0.1:PORT/metrics (default port: {METRICS_PORT})")
+    parser.add_argument("--index", default=MATCH_INDEX_PATH,
+                        help=f"Queryable index both scanners append matches to (default: {MATCH_INDEX_PATH})")
+    parser.add_argument("--no-index", action="store_true", help="Don't write matches to the index")
+    parser.add_argument("--encoding", choices=ENCODINGS, default=DEFAULT_ENCODING,
+                        help=f"Page encoding to ask nodes for, falling back to JSON (default: {DEFAULT_ENCODING})")
+    parser.add_argument("--workers", type=int, nargs="?", const=DEFAULT_WORKERS, default=0, metavar="N",
+                        help=f"Decode and classify historical pages in N processes (default N: {DEFAULT_WORKERS})")
+    parser.add_argument("--watchlist", metavar="PATH",
+                        help="Tokens to watch instead of CASH: a JSON object or 'LABEL type_tag' lines")
+    parser.add_argument("--token", action="append", default=[], metavar="LABEL=TYPE",
+                        help="Also watch a token or pool type tag (repeatable)")
+    args = parser.parse_args()
+    try:
+        watchlist = build_watchlist(DEFAULT_WATCHLIST, args.watchlist, args.token)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+
+    try:
+        with redirect_stdout(sys.stderr) if args.jsonl == "-" else nullcontext():
+            asyncio.run(run_with_metrics(run_orchestrated(resume=args.resume, checkpoint_path=args.checkpoint,
+                                                          store_path=None if args.no_store else args.store,
+                                                          jsonl=args.jsonl, watchlist=watchlist,
+                                                          index_path=None if args.no_index else args.index,
+                                                          encoding=args.encoding, workers=args.workers),
+                                     args.metrics_port))
+    except KeyboardInterrupt:
+        print("\n🛑 Stopped - run with --resume to continue the historical scan")
@@ -0,0 +1,178 @@
+"""
+Raw-bytes prefilter for the classification hot path.
+
+Nearly every transaction on the ledger never mentions a watched token, so
+instead of decoding every response we look for the watched type tags in
+the raw bytes first (one regex pass for a long watchlist, see
+watchlist.py). Only candidates are fully decoded (with orjson when it is
+installed); everything else becomes a tiny stand-in record that the
+watchlist rejects immediately.
+
+BCS pages are screened the same way: a page whose bytes hold none of the
+watched tags' address + module names is skipped without being parsed.
+"""
+
+import json
+import re
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from bcs import decode_page as decode_bcs_page, module_prefixes, page_length
+from watchlist import compile_raw_search
+
+PREFILTERED_TYPE = "prefiltered"
+
+# Up to this many tags, separate `in` scans beat one regex search over the bytes
+MAX_SUBSTRING_TAGS = 4
+
+# Aptos serves compact JSON with "version" as the first key of every transaction
+_TXN_PREFIX = b'{"version":"'
+_TXN_BOUNDARY = b'},{"version":"'
+
+
+def loads(raw):
+    """Decode JSON bytes with the fastest parser available"""
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+def dumps(obj):
+    """Encode an object as compact JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":")).encode()
+
+
+def skipped_transaction(version):
+    """Stand-in for a transaction whose bytes never mention a watched token"""
+    return {"version": str(version), "type": PREFILTERED_TYPE}
+
+
+def _split_compact_page(raw, start_version):
+    """Split a compact page at transaction boundaries, or None if it isn't that shape"""
+    raw = raw.strip()
+    if raw == b"[]":
+        return []
+    if not raw.startswith(b"[" + _TXN_PREFIX) or not raw.endswith(b"}]"):
+        return None
+    parts = raw[len(b"[" + _TXN_PREFIX):-len(b"}]")].split(_TXN_BOUNDARY)
+    items = []
+    for expected_version, part in enumerate(parts, start_version):
+        end_quote = part.find(b'"')
+        if part[:end_quote] != str(expected_version).encode():
+            # Versions must run consecutively from the page start; anything
+            # else means a nested object fooled the split
+            return None
+        items.append((expected_version, _TXN_PREFIX + part + b"}"))
+    return items
+
+
+def split_page(raw, start_version):
+    """Split a raw /v1/transactions page into [(version, raw_txn_bytes)] without decoding it
+
+    Falls back to a full decode when the page isn't compact, consecutive JSON.
+    """
+    items = _split_compact_page(raw, start_version)
+    if items is not None:
+        return items
+    items = []
+    page = loads(raw)
+    if not isinstance(page, list):
+        return []
+    for txn in page:
+        try:
+            items.append((int(txn["version"]), dumps(txn)))
+        except (KeyError, TypeError, ValueError):
+            continue
+    return items
+
+
+class Prefilter:
+    """Decodes a raw transaction only if it mentions one of the watched type tags"""
+
+    def __init__(self, tags):
+        self.tags = [tag.encode() if isinstance(tag, str) else tag for tag in tags]
+        self.decoded = 0
+        self.skipped = 0
+        self._search = None
+        if len(self.tags) > MAX_SUBSTRING_TAGS:
+            # One pass over the bytes for the whole watchlist
+            self._search = compile_raw_search(self.tags)
+        self._text_tags = [tag.decode() for tag in self.tags]
+        self._bcs_search = None
+
+    def is_bcs_candidate(self, raw):
+        """Whether BCS bytes could encode any watched tag"""
+        if self._bcs_search is None:
+            # The most specific struct of each tag is enough to rule a page out
+            prefixes = sorted({module_prefixes(tag)[0] for tag in self._text_tags})
+            self._bcs_search = re.compile(b"|".join(re.escape(prefix) for prefix in prefixes)).search
+        return self._bcs_search(raw) is not None
+
+    def _mentions(self, txn):
+        texts = [event["type"] for event in txn["events"]]
+        payload = txn.get("payload") or {}
+        texts += payload.get("type_arguments", ())
+        if "function" in payload:
+            texts.append(payload["function"])
+        return any(tag in text for text in texts for tag in self._text_tags)
+
+    def is_candidate(self, raw):
+        """Whether the raw bytes mention any watched tag"""
+        if self._search is not None:
+            return self._search(raw)
+        for tag in self.tags:
+            if tag in raw:
+                return True
+        return False
+
+    def decode(self, raw, version):
+        """Fully decode a candidate; return a stand-in for everything else"""
+        if self.is_candidate(raw):
+            self.decoded += 1
+            return loads(raw)
+        self.skipped += 1
+        return skipped_transaction(version)
+
+    def decode_page(self, raw_page, items):
+        """Decode the (version, raw) items split from `raw_page`, as {version: txn}
+
+        A page whose bytes mention no watched tag is skipped wholesale
+        without checking each transaction.
+        """
+        if not self.is_candidate(raw_page):
+            self.skipped += len(items)
+            return {version: skipped_transaction(version) for version, raw in items}
+        return {version: self.decode(raw, version) for version, raw in items}
+
+    def screen_bcs_page(self, raw_page, start_version):
+        """{version: stand-in or None} for a BCS page; None marks a candidate to fetch as JSON
+
+        Raises BcsError when the page can't be decoded.
+        """
+        if not self.is_bcs_candidate(raw_page):
+            count = page_length(raw_page)
+            self.skipped += count
+            return {version: skipped_transaction(version) for version in range(start_version, start_version + count)}
+        screened = {}
+        for txn in decode_bcs_page(raw_page, start_version):
+            version = int(txn["version"])
+            if txn["type"] == "user_transaction" and self._mentions(txn):
+                screened[version] = None
+            else:
+                self.skipped += 1
+                screened[version] = skipped_transaction(version)
+        return screened
+
+
+def decode_transaction(raw, version, prefilter=None):
+    """Decode raw transaction bytes, through the prefilter when one is given"""
+    if raw is None:
+        return None
+    if prefilter is None:
+        return loads(raw)
+    return prefilter.decode(raw, version)
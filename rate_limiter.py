@@ -0,0 +1,115 @@
+"""
+Adaptive per-node rate limiting: a token bucket whose refill rate follows
+AIMD (additive increase, multiplicative decrease) feedback from responses.
+"""
+
+import asyncio
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+# Rate settings (requests per second)
+INITIAL_RATE = 20.0
+MIN_RATE = 0.5
+MAX_RATE = 500.0
+BURST_SECONDS = 1.0  # Bucket holds this many seconds' worth of tokens
+
+# AIMD feedback
+ADDITIVE_INCREASE = 1.0  # Requests/sec gained per second of clean responses
+MULTIPLICATIVE_DECREASE = 0.5  # Rate multiplier on a 429
+DECREASE_COOLDOWN = 1.0  # Seconds after a decrease before another one counts
+DEFAULT_THROTTLE_PAUSE = 1.0  # Pause when a 429 carries no Retry-After
+MAX_RETRY_AFTER = 120.0  # Never honor a Retry-After longer than this
+
+
+def parse_retry_after(value):
+    """Parse a Retry-After header (seconds or HTTP date) into seconds, or None"""
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            retry_at = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if retry_at.tzinfo is None:
+            retry_at = retry_at.replace(tzinfo=timezone.utc)
+        seconds = (retry_at - datetime.now(timezone.utc)).total_seconds()
+    return min(max(0.0, seconds), MAX_RETRY_AFTER)
+
+
+class RateLimiter:
+    """Token bucket for one node, tuned by AIMD feedback
+
+    Every request waits in acquire() for a token. Clean responses raise the
+    refill rate additively; a 429 halves it, empties the bucket and pauses
+    the node until its Retry-After has passed, so the rate settles just under
+    the node's real limit.
+    """
+
+    def __init__(self, rate=INITIAL_RATE, min_rate=MIN_RATE, max_rate=MAX_RATE,
+                 additive_increase=ADDITIVE_INCREASE, multiplicative_decrease=MULTIPLICATIVE_DECREASE):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.additive_increase = additive_increase
+        self.multiplicative_decrease = multiplicative_decrease
+        self.throttled = 0
+        self.errors = 0
+        self._tokens = 1.0
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+
+    def _refill(self, now):
+        capacity = max(1.0, self.rate * BURST_SECONDS)
+        self._tokens = min(capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        """Wait until a request may be sent to this node"""
+        while True:
+            now = time.monotonic()
+            if now < self._paused_until:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+            self._refill(now)
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                return
+            await asyncio.sleep((1.0 - self._tokens) / self.rate)
+
+    def on_success(self):
+        """A request went through cleanly - probe upward"""
+        self.rate = min(self.max_rate, self.rate + self.additive_increase / self.rate)
+
+    def on_throttle(self, retry_after=None):
+        """The node answered 429 - back off sharply and honor Retry-After"""
+        self.throttled += 1
+        now = time.monotonic()
+        pause = retry_after if retry_after is not None else DEFAULT_THROTTLE_PAUSE
+        self._paused_until = max(self._paused_until, now + pause)
+        self._tokens = 0.0
+        self._updated = now
+        # A burst of 429s from one overloaded window only counts once
+        if now - self._last_decrease >= DECREASE_COOLDOWN:
+            self.rate = max(self.min_rate, self.rate * self.multiplicative_decrease)
+            self._last_decrease = now
+
+    def on_error(self):
+        """A request timed out or the node returned 5xx - ease off without pausing"""
+        self.errors += 1
+        now = time.monotonic()
+        if now - self._last_decrease >= DECREASE_COOLDOWN:
+            self.rate = max(self.min_rate, self.rate * self.multiplicative_decrease)
+            self._last_decrease = now
+
+    def feedback(self, status, retry_after=None):
+        """Feed an HTTP status code back into the limiter"""
+        if status == 429:
+            self.on_throttle(parse_retry_after(retry_after))
+        elif status >= 500:
+            self.on_error()
+        else:
+            self.on_success()
@@ -1,8 +1,25 @@
+import argparse
 import asyncio
-import aiohttp
-import json
-import ssl
-from datetime import datetime
+import sys
+import time
+from contextlib import nullcontext, redirect_stdout
+
+from aggregates import WindowedAggregates, describe_window
+from event_sink import build_event_stream
+from hedging import Hedger
+from match_index import MATCH_INDEX_PATH, MatchIndex
+from match_records import MatchLog, build_cash_txn_info
+from metrics import (MATCHES, METRICS_PORT, TOKEN_MATCHES, VERSIONS_CLASSIFIED, VERSIONS_UNFETCHED,
+                     run_with_metrics)
+from node_client import DEFAULT_ENCODING, ENCODINGS, NodeClient
+from node_probe import select_nodes
+from prefilter import Prefilter
+from retry_queue import RetryQueue
+from scan_events import (REALTIME, AggregateSnapshot, CashTransactionFound, ScanError, ScanFinished, ScanProgress,
+                         ScanStarted)
+from tail_follow import MIN_POLL_INTERVAL, LatencyHistogram, TailFollower, detection_latency
+from transaction_store import STORE_PATH, TransactionStore
+from watchlist import Watchlist, build_watchlist
 
 # Multiple reliable Aptos nodes - Real-time monitor uses different nodes
 NODE_URLS = [
@@ -14,233 +31,217 @@ NODE_URLS = [
 
 CASH_TOKEN_TYPE = "0x61ed8b048636516b4eaf4c74250fa4f9440d9c3e163d96aeb863fe658a4bdc67::CASH::CASH"
 
-# Create SSL context that bypasses certificate issues
-ssl_context = ssl.create_default_context()
-ssl_context.check_hostname = False
-ssl_context.verify_mode = ssl.CERT_NONE
+# Tokens watched unless --watchlist / --token say otherwise
+DEFAULT_WATCHLIST = {"CASH": CASH_TOKEN_TYPE}
+WATCHLIST = Watchlist(DEFAULT_WATCHLIST)
 
-async def test_node_connectivity(node_url):
-    """Test if a node is responding"""
-    try:
-        connector = aiohttp.TCPConnector(ssl=ssl_context)
-        timeout = aiohttp.ClientTimeout(total=15)
-        
-        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
-            async with session.get(f"{node_url}/v1", ssl=False) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    if "ledger_version" in data:
-                        return True, data["ledger_version"]
-            
-            async with session.get(f"{node_url}/", ssl=False) as response:
-                if response.status == 200:
-                    return True, None
-                    
-    except Exception as e:
-        return False, None
-    
-    return False, None
+async def find_working_node(client):
+    """Find a working Aptos node: the first to answer, or the cached fastest one"""
+    return (await find_working_nodes(client, wait_for_all=False))[0]
 
-async def find_working_node():
-    """Find a working Aptos node"""
+async def find_working_nodes(client, wait_for_all=True):
+    """Find the healthy Aptos nodes, fastest first: the first is followed, the rest can take hedged requests"""
     print("🔍 Testing Aptos nodes for real-time monitor...")
-    for i, node_url in enumerate(NODE_URLS, 1):
-        print(f"  {i}/{len(NODE_URLS)} Testing: {node_url}")
-        is_working, ledger_version = await test_node_connectivity(node_url)
-        
-        if is_working:
-            print(f"✅ Found working node: {node_url}")
-            if ledger_version:
-                print(f"📊 Current ledger version: {ledger_version}")
-            return node_url
-    
-    raise Exception("No working nodes found")
+    working_nodes = await select_nodes(client, NODE_URLS, wait_for_all)
+    print(f"✅ Found working node: {working_nodes[0]}")
+    return working_nodes
 
-async def get_latest_version(node_url):
+async def get_latest_version(client, node_url):
     """Get the latest ledger version from a node"""
+    # The node's rate limiter paces every retry, so there are no fixed sleeps here
     max_retries = 3
-    for attempt in range(max_retries):
+    attempt = 0
+    while attempt < max_retries:
         try:
-            connector = aiohttp.TCPConnector(ssl=ssl_context)
-            timeout = aiohttp.ClientTimeout(total=15)
-            
-            async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
-                async with session.get(f"{node_url}/v1", ssl=False) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        return int(data.get("ledger_version", 0))
-                    elif response.status == 429:
-                        wait_time = (attempt + 1) * 5  # Progressive backoff
-                        print(f"⚠️  Rate limited (HTTP 429). Waiting {wait_time} seconds...")
-                        await asyncio.sleep(wait_time)
-                        continue
-                    else:
-                        raise Exception(f"HTTP {response.status}")
+            async with client.get(f"{node_url}/v1") as response:
+                if response.status == 200:
+                    data = await response.json()
+                    return int(data.get("ledger_version", 0))
+                elif response.status == 429:
+                    # Throttling doesn't use up an attempt - the limiter waits out Retry-After
+                    print(f"⚠️  Rate limited (HTTP 429). Backing off to {client.limiter(node_url).rate:.1f} req/s...")
+                    continue
+                else:
+                    raise Exception(f"HTTP {response.status}")
                         
         except Exception as e:
-            if attempt == max_retries - 1:
+            attempt += 1
+            if attempt == max_retries:
                 raise
-            wait_time = (attempt + 1) * 2
-            print(f"⚠️  Error getting version (attempt {attempt + 1}/{max_retries}). Waiting {wait_time} seconds...")
-            await asyncio.sleep(wait_time)
+            print(f"⚠️  Error getting version (attempt {attempt}/{max_retries}). Retrying...")
     
     raise Exception("Failed to get latest version after all retries")
 
-async def get_transaction(node_url, version):
-    """Get a specific transaction by version"""
-    try:
-        connector = aiohttp.TCPConnector(ssl=ssl_context)
-        timeout = aiohttp.ClientTimeout(total=15)
-        
-        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
-            async with session.get(f"{node_url}/v1/transactions/by_version/{version}", ssl=False) as response:
-                if response.status == 200:
-                    return await response.json()
-                elif response.status == 404:
-                    return None
-                elif response.status == 429:
-                    await asyncio.sleep(3)
-                    return None
-                else:
-                    return None
-                    
-    except Exception as e:
-        return None
+def is_cash_related_transaction(txn, watchlist=WATCHLIST):
+    """Check if a transaction involves CASH token (or any other watched token)"""
+    # Events, function and type arguments are each searched once for the whole watchlist
+    return bool(watchlist.match(txn))
 
-def is_cash_related_transaction(txn):
-    """Check if a transaction involves CASH token"""
-    if not txn or txn.get("type") != "user_transaction":
-        return False
-    
-    # Check events for CASH token
-    events = txn.get("events", [])
-    for event in events:
-        event_type = event.get("type", "")
-        if CASH_TOKEN_TYPE in event_type:
-            return True
+async def monitor_realtime_cash_transactions(client=None, store_path=STORE_PATH, working_node=None, events=None,
+                                             coverage=None, jsonl=None, watchlist=None, index_path=MATCH_INDEX_PATH,
+                                             encoding=DEFAULT_ENCODING, hedge_nodes=None):
+    """Monitor for new CASH transactions in real-time
+
+    `working_node` skips node discovery. Detections, progress and errors
+    are published as typed events on `events`; without one, the monitor
+    renders its own console output (plus JSON lines to `jsonl`, if given).
+    With a shared CoverageTracker the tail picks up right where a running
+    historical backfill ends. `watchlist` (default: just CASH) sets the
+    tokens looked for; every alert is tagged with the ones it mentions.
+    Alerts are committed to the match index at `index_path` as they happen
+    (None to skip it). `encoding` is the page encoding an owned client asks
+    nodes for. Pages and lookups that run past the node's usual p95 are
+    hedged to one of `hedge_nodes`: by default the other healthy nodes found
+    by node discovery (none when `working_node` is given); empty to turn
+    hedging off. The Hedger is the monitor's own, so a client shared with
+    a historical scan isn't hedged.
+    """
+    watchlist = watchlist or WATCHLIST
+    if events is None:
+        events = build_event_stream(watchlist, jsonl=jsonl)
+        try:
+            return await monitor_realtime_cash_transactions(client, store_path, working_node, events, coverage,
+                                                            watchlist=watchlist, index_path=index_path,
+                                                            encoding=encoding, hedge_nodes=hedge_nodes)
+        finally:
+            await events.close()
     
-    # Check payload for CASH token
-    payload = txn.get("payload", {})
-    if payload:
-        # Check function calls
-        function = payload.get("function", "")
-        if CASH_TOKEN_TYPE in function:
-            return True
-        
-        # Check type arguments
-        type_arguments = payload.get("type_arguments", [])
-        for arg in type_arguments:
-            if CASH_TOKEN_TYPE in arg:
-                return True
+    if client is None:
+        # Own a pooled client for the whole run so every request reuses connections;
+        # live versions are written through to the local store for later historical scans
+        store = TransactionStore(store_path) if store_path else None
+        async with NodeClient(store=store, events=events, encoding=encoding) as client:
+            return await monitor_realtime_cash_transactions(client, working_node=working_node, events=events,
+                                                            coverage=coverage, watchlist=watchlist,
+                                                            index_path=index_path, hedge_nodes=hedge_nodes)
     
-    return False
-
-async def monitor_realtime_cash_transactions():
-    """Monitor for new CASH transactions in real-time"""
     print("🚀 REAL-TIME CASH TRANSACTION MONITOR")
     print("⚡ Monitoring for live CASH transactions...")
+    print(f"👀 Watching {len(watchlist)} token(s): {watchlist.describe()}")
     print("=" * 60)
     
-    # Find a working node
-    try:
-        working_node = await find_working_node()
-    except Exception as e:
-        print(f"❌ Failed to connect: {e}")
-        return
+    # Find a working node, plus the other healthy ones when they're wanted as hedge backups
+    if working_node is None:
+        try:
+            working_nodes = await find_working_nodes(client, wait_for_all=hedge_nodes is None)
+        except Exception as e:
+            events.publish(ScanError(REALTIME, f"Failed to connect: {e}"))
+            return
+        working_node = working_nodes[0]
+        if hedge_nodes is None:
+            hedge_nodes = working_nodes[1:]
+    
+    # A stalled page or lookup shouldn't hold up alerts: slow ones are raced against a probed backup node
+    hedger = Hedger(hedge_nodes) if hedge_nodes else None
     
     # Get current version to start monitoring from
     try:
-        start_version = await get_latest_version(working_node)
+        start_version = await get_latest_version(client, working_node)
+        if coverage is not None:
+            # Take over right after whatever the historical backfill has claimed
+            start_version = coverage.start_tail(start_version) - 1
         print(f"📊 Starting real-time monitoring from version: {start_version}")
     except Exception as e:
-        print(f"❌ Failed to get current version: {e}")
+        events.publish(ScanError(REALTIME, f"Failed to get current version: {e}"))
         return
+    events.publish(ScanStarted(REALTIME, start_version + 1))
 
     print("📡 REAL-TIME MONITORING ACTIVE")
     print("💡 Press Ctrl+C to stop monitoring")
     print("=" * 60)
     
-    last_checked_version = start_version
-    realtime_transactions = []
+    # Only transactions whose raw bytes mention a watched token get a full JSON decode
+    prefilter = Prefilter(watchlist.tags)
+    latency = LatencyHistogram()
+    # Matches spill their payloads to disk; only the most recent stay in memory,
+    # so a monitor running for weeks doesn't grow
+    realtime_transactions = MatchLog()
+    # Rolling volume/sender aggregates of the alerts, snapshotted with every progress report
+    aggregates = WindowedAggregates(watchlist, REALTIME)
+    # Alerts are appended to the queryable index one by one (see match_index.py)
+    match_index = MatchIndex(index_path) if index_path else None
     total_transactions_analyzed = 0
     swaps_in_current_batch = 0
     batch_size = 1000
+    next_report = batch_size
+    last_checked_version = start_version
+    classified = VERSIONS_CLASSIFIED.labels(REALTIME)
+    unfetched = VERSIONS_UNFETCHED.labels(REALTIME)
+    matched = MATCHES.labels(REALTIME)
+    token_matched = {label: TOKEN_MATCHES.labels(REALTIME, label) for label in watchlist.labels}
+    # Versions the tail couldn't fetch are retried with backoff in the background
+    retries = RetryQueue(client, [working_node], prefilter, name="realtime_retry")
     
-    while True:
-        try:
-            # Get current latest version
-            current_version = await get_latest_version(working_node)
+    def classify(version, txn):
+        nonlocal total_transactions_analyzed, swaps_in_current_batch
+        total_transactions_analyzed += 1
+        classified.inc()
+        
+        # One pass tags every watched token the transaction mentions
+        tokens = watchlist.match(txn)
+        if tokens:
+            matched.inc()
+            for token in tokens:
+                token_matched[token].inc()
+            detection_seconds = detection_latency(txn)
+            latency.observe(detection_seconds)
+            swaps_in_current_batch += 1
             
-            if current_version > last_checked_version:
-                new_transactions_count = current_version - last_checked_version
-                print(f"📈 New transactions detected: {last_checked_version + 1} to {current_version} ({new_transactions_count} transactions)")
-                
-                # Check new transactions
-                for version in range(last_checked_version + 1, current_version + 1):
-                    try:
-                        txn = await get_transaction(working_node, version)
-                        
-                        if txn:
-                            total_transactions_analyzed += 1
-                            
-                            if is_cash_related_transaction(txn):
-                                transaction_time = datetime.fromtimestamp(int(txn['timestamp']) / 1000000)
-                                swaps_in_current_batch += 1
-                                
-                                cash_txn_info = {
-                                    'version': version,
-                                    'timestamp': transaction_time,
-                                    'hash': txn['hash'],
-                                    'sender': txn.get('sender', 'unknown'),
-                                    'events': txn.get('events', []),
-                                    'payload': txn.get('payload', {})
-                                }
-                                realtime_transactions.append(cash_txn_info)
-                                
-                                print(f"🔥 REAL-TIME CASH TRANSACTION DETECTED!")
-                                print(f"  📅 Transaction Time: {transaction_time}")
-                                print(f"  🔗 Txn Hash: {txn['hash']}")
-                                print(f"  👤 Sender: {txn.get('sender', 'unknown')}")
-                                print(f"  📋 Version: {version}")
-                                print(f"  ⚡ Type: LIVE TRANSACTION")
-                                print(f"  📊 Total Transactions Analyzed: {total_transactions_analyzed:,}")
-                                print(f"  💰 Total CASH Swaps Found: {len(realtime_transactions)}")
-                                
-                                # Show CASH-related events
-                                events = txn.get('events', [])
-                                for i, event in enumerate(events):
-                                    if CASH_TOKEN_TYPE in event.get('type', ''):
-                                        print(f"  📊 Event {i+1}: {event['type']}")
-                                        print(f"  📊 Event Data: {json.dumps(event['data'], indent=4)}")
-                                
-                                print("=" * 60)
-                        
-                        # Report progress every 1,000 transactions
-                        if total_transactions_analyzed % batch_size == 0:
-                            print(f"📊 REAL-TIME BATCH SUMMARY: Analyzed {total_transactions_analyzed:,} transactions")
-                            print(f"💰 CASH Swaps in this batch: {swaps_in_current_batch}")
-                            print(f"💰 Total CASH Swaps found: {len(realtime_transactions)}")
-                            print("-" * 40)
-                            swaps_in_current_batch = 0  # Reset for next batch
-                            
-                    except Exception as e:
+            cash_txn_info = build_cash_txn_info(version, txn, tokens)
+            realtime_transactions.append(cash_txn_info)
+            aggregates.add(cash_txn_info)
+            if match_index is not None:
+                match_index.add(cash_txn_info, REALTIME)
+                match_index.flush()
+            events.publish(CashTransactionFound(REALTIME, cash_txn_info, detection_seconds,
+                                                analyzed=total_transactions_analyzed,
+                                                matches=len(realtime_transactions)))
+    
+    try:
+        while True:
+            # Poll the head adaptively and fetch new versions as a pipeline, in order
+            follower = TailFollower(client, working_node, last_checked_version, prefilter=prefilter, coverage=coverage,
+                                    hedger=hedger)
+            try:
+                async for version, txn in follower.follow():
+                    last_checked_version = version
+                    if not txn:
+                        unfetched.inc()
+                        retries.add(version)
                         continue
+                    classify(version, txn)
+                    for recovered_version, recovered_txn in retries.take_recovered():
+                        classify(recovered_version, recovered_txn)
                 
-                last_checked_version = current_version
-            else:
-                print(f"⏳ No new transactions. Current version: {current_version}")
-            
-            # Wait before next check
-            await asyncio.sleep(10)  # Increased delay for real-time monitor
+                    # Report progress every 1,000 transactions; recovered retries can carry the count past
+                    # a multiple in one step, so compare against the next threshold instead
+                    if total_transactions_analyzed >= next_report:
+                        next_report = (total_transactions_analyzed // batch_size + 1) * batch_size
+                        events.publish(ScanProgress(REALTIME, total_transactions_analyzed, None, len(realtime_transactions),
+                                                    batch_matches=swaps_in_current_batch,
+                                                    detail={"head": follower.head, "behind": follower.behind,
+                                                            "poll_interval": follower.poll_interval,
+                                                            "latency": latency.summary()}))
+                        # The live windows end now, even when the last alert was a while ago
+                        events.publish(AggregateSnapshot(REALTIME, aggregates.snapshot(time.time())))
+                        swaps_in_current_batch = 0  # Reset for next batch
             
-        except KeyboardInterrupt:
-            print("\n🛑 Real-time monitoring stopped by user")
-            print(f"📊 Final real-time analysis: {total_transactions_analyzed:,} transactions analyzed")
-            break
-        except Exception as e:
-            print(f"⚠️  Error in real-time monitoring: {e}")
-            await asyncio.sleep(10)
-            continue
+            except KeyboardInterrupt:
+                print("\n🛑 Real-time monitoring stopped by user")
+                print(f"📊 Final real-time analysis: {total_transactions_analyzed:,} transactions analyzed")
+                break
+            except Exception as e:
+                # Restart the follower from the last version it handed us
+                events.publish(ScanError(REALTIME, f"Error in real-time monitoring: {e}"))
+                await asyncio.sleep(MIN_POLL_INTERVAL)
+                continue
+    finally:
+        await retries.close()
+        if match_index is not None:
+            match_index.close()
+    
+    # Let buffered alerts land before the summary
+    await events.flush()
     
     # Final Summary
     print("\n" + "=" * 60)
@@ -248,15 +249,60 @@ async def monitor_realtime_cash_transactions():
     print("=" * 60)
     print(f"📊 Total transactions analyzed: {total_transactions_analyzed:,}")
     print(f"💰 Total CASH transactions found: {len(realtime_transactions)}")
+    if len(watchlist) > 1:
+        for label in watchlist.labels:
+            print(f"  🏷️  {label}: {realtime_transactions.token_counts[label]:,}")
+    if retries.added:
+        print(f"🔁 Retried {retries.added:,} failed versions: {retries.added - len(retries.gave_up) - retries.pending:,} "
+              f"recovered, {len(retries.gave_up):,} given up, {retries.pending:,} still pending")
+    if hedger is not None and hedger.sent + hedger.over_budget:
+        print(f"🔀 Hedged {hedger.sent:,} of {hedger.requests:,} requests to a backup node: "
+              f"{hedger.won:,} answered first, {hedger.over_budget:,} more were over the hedge budget")
+    windows = aggregates.snapshot(time.time())
+    for summary in windows:
+        print(f"📈 {describe_window(summary)}")
+    print(f"⏱️  Detection latency (block timestamp to alert): {latency.summary()}")
+    for line in latency.lines():
+        print(f"  {line}")
     
     if realtime_transactions:
         print(f"\n📋 REAL-TIME CASH TRANSACTION DETAILS:")
-        for i, txn in enumerate(realtime_transactions, 1):
-            print(f"  #{i}: {txn['timestamp']} - Version {txn['version']} - {txn['hash'][:20]}...")
+        for line in realtime_transactions.summary_lines():
+            print(line)
     else:
         print("❌ No CASH transactions found during real-time monitoring")
     
     print("✅ Real-time monitor completed!")
+    events.publish(AggregateSnapshot(REALTIME, windows))
+    events.publish(ScanFinished(REALTIME, total_transactions_analyzed, len(realtime_transactions)))
+    realtime_transactions.close()
 
 if __name__ == "__main__":
-    asyncio.run(monitor_realtime_cash_transactions()) 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Monitor live transactions for CASH token activity")
+    parser.add_argument("--jsonl", metavar="PATH",
+                        help="Also write JSON-lines events to PATH (a file or pipe; '-' for stdout, "
+                             "which moves the console output to stderr)")
+    parser.add_argument("--metrics-port", type=int, nargs="?", const=METRICS_PORT, metavar="PORT",
+                        help=f"Serve Prometheus metrics on 127.0.0.1:PORT/metrics (default port: {METRICS_PORT})")
+    parser.add_argument("--index", default=MATCH_INDEX_PATH,
+                        help=f"Queryable index alerts are appended to (default: {MATCH_INDEX_PATH})")
+    parser.add_argument("--no-index", action="store_true", help="Don't write alerts to the index")
+    parser.add_argument("--encoding", choices=ENCODINGS, default=DEFAULT_ENCODING,
+                        help=f"Page encoding to ask nodes for, falling back to JSON (default: {DEFAULT_ENCODING})")
+    parser.add_argument("--no-hedge", action="store_true",
+                        help="Don't send slow pages and lookups to a second node")
+    parser.add_argument("--watchlist", metavar="PATH",
+                        help="Tokens to watch instead of CASH: a JSON object or 'LABEL type_tag' lines")
+    parser.add_argument("--token", action="append", default=[], metavar="LABEL=TYPE",
+                        help="Also watch a token or pool type tag (repeatable)")
+    args = parser.parse_args()
+    try:
+        watchlist = build_watchlist(DEFAULT_WATCHLIST, args.watchlist, args.token)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    
+    with redirect_stdout(sys.stderr) if args.jsonl == "-" else nullcontext():
+        asyncio.run(run_with_metrics(monitor_realtime_cash_transactions(
+            jsonl=args.jsonl, watchlist=watchlist, index_path=None if args.no_index else args.index,
+            encoding=args.encoding, hedge_nodes=[] if args.no_hedge else None),
+            args.metrics_port)) 
\ No newline at end of file
@@ -0,0 +1,508 @@
+#!/usr/bin/env python3
+"""
+Record-and-replay of scan runs, for deterministic offline profiling.
+
+`record` runs the historical scan or the realtime monitor against real
+nodes and keeps every response they send back (node info, single versions,
+transaction pages, throttles and failures) in one gzip-compressed archive.
+`replay` feeds the same run those responses from the archive instead of
+the network, as fast as the scanner can take them, optionally under
+cProfile or pyinstrument:
+
+    python replay.py record historical scan.replay --since 2h
+    python replay.py record realtime tail.replay --duration 120
+    python replay.py replay scan.replay --profile cprofile --profile-out scan.prof
+    python replay.py replay tail.replay --profile pyinstrument --quiet
+
+Both sides run in a scratch directory with no checkpoint, store or index,
+so nothing cached on disk changes which requests are made. Responses are
+looked up by URL, query and Accept header and served in the order they
+were recorded. A transaction range the recording never asked for (the
+realtime tail splits ranges by whatever the head was at the time) is
+stitched together from the recorded pages that cover it.
+"""
+
+import argparse
+import asyncio
+import cProfile
+import gzip
+import json
+import os
+import pstats
+import struct
+import sys
+import tempfile
+import time
+from collections import defaultdict, deque
+from contextlib import asynccontextmanager, contextmanager, nullcontext, redirect_stdout
+from datetime import datetime
+from urllib.parse import urlencode, urlsplit
+
+try:
+    from pyinstrument import Profiler
+except ImportError:
+    Profiler = None
+
+import aiohttp
+
+import tail_follow
+from bcs import BCS_CONTENT_TYPE, BcsError, BcsReader, read_transaction, uleb128
+from classifier_pool import DEFAULT_WORKERS
+from historical_cash_scanner import DEFAULT_WATCHLIST, find_healthy_nodes, scan_historical_cash_transactions
+from node_client import DEFAULT_ENCODING, ENCODINGS, NodeClient, node_origin
+from prefilter import split_page
+from realtime_cash_monitor import find_working_node, monitor_realtime_cash_transactions
+from time_index import parse_time_window
+from watchlist import Watchlist, build_watchlist
+
+MODES = ("historical", "realtime")
+RECORD_DURATION = 60  # Seconds of realtime monitoring recorded by default
+ARCHIVE_LEVEL = 6  # gzip level: pages are repetitive JSON, so this is most of the gain
+PROFILERS = ("cprofile", "pyinstrument")
+PROFILE_PATH = "replay.prof"
+PROFILE_LINES = 25  # Functions listed in the cProfile summary
+
+# A replayed tail polls the head almost back to back and never waits for a lagging node
+REPLAY_POLL_INTERVAL = 0.001
+# A realtime replay ends once the recorded head polls are used up and no page has been asked for this long
+REPLAY_SETTLE = 0.5
+
+_LENGTHS = struct.Struct(">II")
+
+
+def is_head_poll(url):
+    return urlsplit(url).path.rstrip("/") == "/v1"
+
+
+def request_key(url, params=None, headers=None):
+    """What identifies a request in the archive: URL, sorted query and Accept header"""
+    if params:
+        url = f"{url}?{urlencode(sorted((key, str(value)) for key, value in params.items()))}"
+    return f"{url} {(headers or {}).get('Accept', '')}"
+
+
+class ResponseArchive:
+    """Gzip stream of (header, body) records; the first one describes the run"""
+
+    def __init__(self, path, metadata=None):
+        self.path = path
+        self.records = 0
+        self.body_bytes = 0
+        self._file = gzip.open(path, "wb", compresslevel=ARCHIVE_LEVEL)
+        self._write(dict(metadata or {}, recorded_at=datetime.now().isoformat(timespec="seconds")))
+
+    def _write(self, header, body=b""):
+        encoded = json.dumps(header, separators=(",", ":")).encode()
+        self._file.write(_LENGTHS.pack(len(encoded), len(body)))
+        self._file.write(encoded)
+        self._file.write(body)
+
+    def add(self, key, status, content_type=None, retry_after=None, body=b"", error=None):
+        header = {"key": key, "status": status}
+        if content_type:
+            header["content_type"] = content_type
+        if retry_after is not None:
+            header["retry_after"] = retry_after
+        if error is not None:
+            header["error"] = error
+        self._write(header, body)
+        self.records += 1
+        self.body_bytes += len(body)
+
+    def close(self):
+        self._file.close()
+
+
+def read_archive(path):
+    """(metadata, [(header, body)]) from an archive written by ResponseArchive"""
+    records = []
+    with gzip.open(path, "rb") as f:
+        while True:
+            lengths = f.read(_LENGTHS.size)
+            if len(lengths) < _LENGTHS.size:
+                break  # End of the archive, or a recording cut off mid-record
+            header_length, body_length = _LENGTHS.unpack(lengths)
+            header = f.read(header_length)
+            body = f.read(body_length)
+            if len(header) < header_length or len(body) < body_length:
+                break
+            records.append((json.loads(header), body))
+    if not records:
+        raise ValueError(f"{path} is not a replay archive")
+    return records[0][0], records[1:]
+
+
+class RecordingClient(NodeClient):
+    """A NodeClient that also writes every response it gets to a ResponseArchive"""
+
+    def __init__(self, archive, **kwargs):
+        super().__init__(**kwargs)
+        self.archive = archive
+
+    @asynccontextmanager
+    async def get(self, url, **kwargs):
+        key = request_key(url, kwargs.get("params"), kwargs.get("headers"))
+        recorded = False
+        try:
+            async with super().get(url, **kwargs) as response:
+                # aiohttp keeps the body, so the caller's own read() still works
+                body = await response.read()
+                self.archive.add(key, response.status, response.content_type,
+                                 response.headers.get("Retry-After"), body)
+                recorded = True
+                yield response
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            if not recorded:
+                self.archive.add(key, None, error="timeout" if isinstance(e, asyncio.TimeoutError) else str(e))
+            raise
+
+
+class ReplayResponse:
+    """The parts of an aiohttp response the scanners use, served from an archive record"""
+
+    def __init__(self, status, content_type=None, retry_after=None, body=b""):
+        self.status = status
+        self.content_type = content_type or "application/octet-stream"
+        self.headers = {"Content-Type": self.content_type}
+        if retry_after is not None:
+            self.headers["Retry-After"] = retry_after
+        self._body = body
+
+    async def read(self):
+        return self._body
+
+    async def json(self, content_type=None):
+        return json.loads(self._body)
+
+
+def _bcs_items(raw):
+    """[(version, raw_txn_bytes)] of a BCS page"""
+    reader = BcsReader(raw)
+    items = []
+    for _ in range(reader.uleb128()):
+        start = reader.pos
+        txn = read_transaction(reader)
+        items.append((int(txn["version"]), raw[start:reader.pos]))
+    return items
+
+
+class ReplayClient(NodeClient):
+    """A NodeClient that answers every request from a recorded archive, without the network
+
+    Each request gets the recorded responses for it in order; once they're
+    used up the last one is repeated. `polls_done` is set when the head
+    poll responses (`/v1`) have all been served.
+    """
+
+    def __init__(self, records, **kwargs):
+        super().__init__(**kwargs)
+        self.served = 0
+        self.stitched = 0
+        self.missing = 0
+        self.last_page = time.monotonic()
+        self.polls_done = asyncio.Event()
+        self._responses = defaultdict(deque)
+        for header, body in records:
+            self._responses[header["key"]].append((header, body))
+        self._polls = sum(len(responses) for key, responses in self._responses.items()
+                          if is_head_poll(key.split(" ")[0]))
+        # Nodes that served BCS pages in the recording
+        self._bcs_origins = {node_origin(header["key"].split(" ")[0]) for header, _ in records
+                             if header.get("content_type") == BCS_CONTENT_TYPE}
+        self._pages = None
+
+    def bcs_unsupported(self, node_url):
+        # A BCS node can be handed a range stitched from another node's JSON pages; that doesn't make it JSON-only
+        if node_origin(node_url) not in self._bcs_origins:
+            super().bcs_unsupported(node_url)
+
+    def _index_pages(self):
+        """Every recorded version's raw bytes, per encoding, from any node's pages and single-version lookups"""
+        self._pages = {"json": {}, "bcs": {}}
+        for key, responses in self._responses.items():
+            parts = urlsplit(key.split(" ", 1)[0])
+            single = "/transactions/by_version/" in parts.path
+            if not single and not parts.path.endswith("/transactions"):
+                continue
+            start = dict(pair.split("=", 1) for pair in parts.query.split("&") if "=" in pair).get("start")
+            for header, body in responses:
+                if header["status"] != 200 or not single and start is None:
+                    continue
+                try:
+                    if single:
+                        self._pages["json"][int(parts.path.rsplit("/", 1)[1])] = body
+                    elif header.get("content_type") == BCS_CONTENT_TYPE:
+                        self._pages["bcs"].update(_bcs_items(body))
+                    else:
+                        self._pages["json"].update(split_page(body, int(start)))
+                except (BcsError, ValueError):
+                    continue
+
+    def prepare(self):
+        """Index the recorded pages up front, so stitching doesn't show up in a profile"""
+        if self._pages is None:
+            self._index_pages()
+
+    def _stitch(self, url, params, headers):
+        """A response for a request that wasn't recorded, built from the recorded versions; None if it can't be"""
+        self.prepare()
+        path = urlsplit(url).path
+        if "/transactions/by_version/" in path:
+            raw = self._pages["json"].get(int(path.rsplit("/", 1)[1]))
+            return None if raw is None else ReplayResponse(200, "application/json", body=raw)
+        if not path.endswith("/transactions") or not params:
+            return None
+        start = int(params["start"])
+        # A range only some other node served, in the other encoding, comes back in that one; the fetcher takes either
+        bcs = (headers or {}).get("Accept") == BCS_CONTENT_TYPE
+        if start not in self._pages["bcs" if bcs else "json"]:
+            bcs = not bcs
+        versions = self._pages["bcs" if bcs else "json"]
+        items = []
+        for version in range(start, start + int(params.get("limit", 1))):
+            if version not in versions:
+                break
+            items.append(versions[version])
+        if not items:
+            return None
+        if bcs:
+            return ReplayResponse(200, BCS_CONTENT_TYPE, body=uleb128(len(items)) + b"".join(items))
+        return ReplayResponse(200, "application/json", body=b"[" + b",".join(items) + b"]")
+
+    @asynccontextmanager
+    async def get(self, url, **kwargs):
+        params, headers = kwargs.get("params"), kwargs.get("headers")
+        if is_head_poll(url):
+            self._polls -= 1
+            if self._polls <= 0:
+                self.polls_done.set()
+        else:
+            self.last_page = time.monotonic()
+        responses = self._responses.get(request_key(url, params, headers))
+        if responses:
+            header, body = responses.popleft() if len(responses) > 1 else responses[0]
+            self.served += 1
+            if header.get("error") == "timeout":
+                raise asyncio.TimeoutError()
+            if header.get("error") is not None:
+                raise aiohttp.ClientConnectionError(header["error"])
+            yield ReplayResponse(header["status"], header.get("content_type"), header.get("retry_after"), body)
+            return
+        response = self._stitch(url, params, headers)
+        if response is None:
+            self.missing += 1
+            response = ReplayResponse(404)
+        else:
+            self.stitched += 1
+        yield response
+
+
+@contextmanager
+def working_directory(path):
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+@contextmanager
+def fast_polling():
+    """Run TailFollowers without their poll and range-retry waits"""
+    saved = tail_follow.MIN_POLL_INTERVAL, tail_follow.RANGE_RETRY_DELAY
+    tail_follow.MIN_POLL_INTERVAL, tail_follow.RANGE_RETRY_DELAY = REPLAY_POLL_INTERVAL, 0
+    try:
+        yield
+    finally:
+        tail_follow.MIN_POLL_INTERVAL, tail_follow.RANGE_RETRY_DELAY = saved
+
+
+def encode_window(time_window):
+    return None if time_window is None else [moment and moment.isoformat() for moment in time_window]
+
+
+def decode_window(window):
+    return None if window is None else tuple(moment and datetime.fromisoformat(moment) for moment in window)
+
+
+async def run_scanner(client, metadata, workdir, workers=0):
+    """Run the archive's scanner on `client`: the historical scan to the end, the realtime monitor for `duration`
+
+    A realtime run with no duration stops once the client has served its
+    recorded head polls and gone REPLAY_SETTLE seconds without a page request.
+    """
+    watchlist = Watchlist(metadata["watchlist"])
+    if metadata["mode"] == "historical":
+        await scan_historical_cash_transactions(
+            client, checkpoint_path=os.path.join(workdir, "replay.checkpoint"), store_path=None,
+            healthy_nodes=metadata["nodes"], time_window=decode_window(metadata["time_window"]),
+            watchlist=watchlist, index_path=None, workers=workers)
+        return
+    monitor = asyncio.create_task(monitor_realtime_cash_transactions(
+        client, store_path=None, working_node=metadata["nodes"][0], watchlist=watchlist, index_path=None))
+    if metadata.get("duration") is not None:
+        await asyncio.wait([monitor], timeout=metadata["duration"])
+    else:
+        polls_done = asyncio.create_task(client.polls_done.wait())
+        await asyncio.wait([monitor, polls_done], return_when=asyncio.FIRST_COMPLETED)
+        polls_done.cancel()
+        while not monitor.done() and time.monotonic() - client.last_page < REPLAY_SETTLE:
+            await asyncio.sleep(REPLAY_SETTLE / 10)
+    monitor.cancel()
+    await asyncio.gather(monitor, return_exceptions=True)
+
+
+async def record(args, archive_path, workdir, time_window, watchlist):
+    nodes = args.node
+    if not nodes:
+        async with NodeClient() as client:
+            nodes = await find_healthy_nodes(client) if args.mode == "historical" else [await find_working_node(client)]
+    metadata = {"mode": args.mode, "nodes": nodes, "time_window": encode_window(time_window),
+                "watchlist": watchlist.tokens, "encoding": args.encoding}
+    archive = ResponseArchive(archive_path, metadata)
+    try:
+        async with RecordingClient(archive, encoding=args.encoding) as client:
+            await run_scanner(client, dict(metadata, duration=args.duration), workdir)
+    finally:
+        archive.close()
+    return archive
+
+
+def run_record(args):
+    try:
+        time_window = parse_time_window(args.since, args.start, args.end) if args.mode == "historical" else None
+        watchlist = build_watchlist(DEFAULT_WATCHLIST, args.watchlist, args.token)
+    except (OSError, ValueError) as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 2
+    archive_path = os.path.abspath(args.archive)
+    try:
+        with tempfile.TemporaryDirectory() as workdir, working_directory(workdir):
+            archive = asyncio.run(record(args, archive_path, workdir, time_window, watchlist))
+    except KeyboardInterrupt:
+        print(f"\n🛑 Recording interrupted; {args.archive} holds the responses recorded so far")
+        return 130
+    print(f"💾 Recorded {archive.records:,} responses ({archive.body_bytes / 1024 ** 2:.1f} MB of bodies, "
+          f"{os.path.getsize(archive_path) / 1024 ** 2:.1f} MB archived) to {args.archive}")
+    return 0
+
+
+class ProfileHook:
+    """cProfile or pyinstrument around a replay; `report` prints (and saves) what it found"""
+
+    def __init__(self, profiler, out=None):
+        self.profiler = profiler
+        self.out = out or (PROFILE_PATH if profiler == "cprofile" else None)
+        self._session = Profiler(async_mode="enabled") if profiler == "pyinstrument" else cProfile.Profile()
+
+    def start(self):
+        if self.profiler == "pyinstrument":
+            self._session.start()
+        else:
+            self._session.enable()
+
+    def stop(self):
+        if self.profiler == "pyinstrument":
+            self._session.stop()
+        else:
+            self._session.disable()
+
+    def report(self):
+        if self.profiler == "cprofile":
+            self._session.dump_stats(self.out)
+            pstats.Stats(self._session).sort_stats("cumulative").print_stats(PROFILE_LINES)
+            print(f"📊 Profile written to {self.out} (browse it with python -m pstats)")
+        elif self.out:
+            with open(self.out, "w") as f:
+                f.write(self._session.output_html() if self.out.endswith(".html") else self._session.output_text())
+            print(f"📊 Profile written to {self.out}")
+        else:
+            print(self._session.output_text(unicode=True, color=sys.stdout.isatty()))
+
+
+async def replay(client, metadata, workdir, workers):
+    async with client:
+        started = time.monotonic()
+        await run_scanner(client, metadata, workdir, workers)
+        if metadata["mode"] == "realtime":
+            # Don't count the idle wait that ends a realtime replay
+            return client.last_page - started
+        return time.monotonic() - started
+
+
+def run_replay(args):
+    if args.profile == "pyinstrument" and Profiler is None:
+        print("❌ pyinstrument isn't installed (pip install pyinstrument), use --profile cprofile", file=sys.stderr)
+        return 2
+    try:
+        metadata, records = read_archive(args.archive)
+    except (OSError, ValueError) as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 2
+    print(f"⏯️  Replaying a {metadata['mode']} run recorded {metadata['recorded_at']}: {len(records):,} responses "
+          f"from {', '.join(metadata['nodes'])}")
+    client = ReplayClient(records, encoding=metadata["encoding"])
+    # Indexed before the clock (and any profiler) starts
+    client.prepare()
+    profile = None
+    if args.profile:
+        profile = ProfileHook(args.profile, args.profile_out and os.path.abspath(args.profile_out))
+
+    with tempfile.TemporaryDirectory() as workdir, working_directory(workdir):
+        with open(os.devnull, "w") as devnull, redirect_stdout(devnull) if args.quiet else nullcontext():
+            if profile is not None:
+                profile.start()
+            try:
+                with fast_polling():
+                    elapsed = asyncio.run(replay(client, metadata, workdir, args.workers))
+            finally:
+                if profile is not None:
+                    profile.stop()
+    if profile is not None:
+        profile.report()
+    print(f"⏩ Replayed {client.served:,} recorded responses ({client.stitched:,} stitched from recorded pages, "
+          f"{client.missing:,} missing) in {elapsed:.2f}s")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record scan runs' node responses and replay them offline")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    record_ = commands.add_parser("record", help="Run a scanner against real nodes and archive every response")
+    record_.add_argument("mode", choices=MODES, help="Scanner to record")
+    record_.add_argument("archive", metavar="ARCHIVE", help="Archive to write")
+    record_.add_argument("--node", action="append", metavar="URL",
+                         help="Node to scan (repeatable; default: probe the scanner's own node list)")
+    record_.add_argument("--duration", type=float, default=RECORD_DURATION, metavar="SECONDS",
+                         help=f"Seconds of realtime monitoring to record (default: {RECORD_DURATION})")
+    window = record_.add_argument_group("historical time window (default: the last 100,000 versions)")
+    window.add_argument("--since", metavar="DURATION", help="Scan the last DURATION, e.g. 90m, 24h, 7d")
+    window.add_argument("--from", dest="start", metavar="DATE", help="Scan from DATE (e.g. 2024-05-01T12:00)")
+    window.add_argument("--to", dest="end", metavar="DATE", help="...up to DATE (default: now)")
+    record_.add_argument("--watchlist", metavar="PATH",
+                         help="Tokens to watch instead of CASH: a JSON object or 'LABEL type_tag' lines")
+    record_.add_argument("--token", action="append", default=[], metavar="LABEL=TYPE",
+                         help="Also watch a token or pool type tag (repeatable)")
+    record_.add_argument("--encoding", choices=ENCODINGS, default=DEFAULT_ENCODING,
+                         help=f"Page encoding to ask nodes for, falling back to JSON (default: {DEFAULT_ENCODING})")
+    record_.set_defaults(run=run_record)
+
+    replay_ = commands.add_parser("replay", help="Re-run a recorded scan from its archive, without the network")
+    replay_.add_argument("archive", metavar="ARCHIVE", help="Archive written by record")
+    replay_.add_argument("--workers", type=int, nargs="?", const=DEFAULT_WORKERS, default=0, metavar="N",
+                         help=f"Classify historical pages in N worker processes (default N: {DEFAULT_WORKERS})")
+    replay_.add_argument("--profile", choices=PROFILERS, help="Profile the replay")
+    replay_.add_argument("--profile-out", metavar="PATH",
+                         help=f"Where the profile goes (default: {PROFILE_PATH} for cProfile; pyinstrument prints "
+                              "its report, or writes HTML for a .html PATH)")
+    replay_.add_argument("--quiet", action="store_true", help="Hide the scanner's own output")
+    replay_.set_defaults(run=run_replay)
+
+    args = parser.parse_args()
+    sys.exit(args.run(args))
+
+
+if __name__ == "__main__":
+    main()
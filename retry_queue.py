@@ -0,0 +1,125 @@
+"""
+Dead-letter retry queue for versions a scan couldn't fetch.
+
+When a range comes back with versions missing (throttled, timed out or a
+5xx), the scan hands those versions to a RetryQueue and keeps going. A
+couple of background workers re-fetch them one at a time with
+exponential backoff, rotating across the healthy nodes, and put what they
+recover on the `recovered` queue for the scan to classify. A version is
+only given up on after MAX_RETRY_ATTEMPTS, and is then reported as a gap.
+"""
+
+import asyncio
+import heapq
+import random
+import time
+
+from metrics import QUEUE_DEPTH
+from transaction_fetcher import get_transaction
+
+RETRY_CONCURRENCY = 2  # Versions re-fetched at once; small, so the main scan keeps its throughput
+MAX_RETRY_ATTEMPTS = 8
+RETRY_BASE_DELAY = 1.0  # Seconds before the first retry; doubles on every attempt
+RETRY_MAX_DELAY = 60.0
+
+
+class RetryQueue:
+    """Re-fetches failed versions with backoff until they're recovered or given up on"""
+
+    def __init__(self, client, node_urls, prefilter=None, concurrency=RETRY_CONCURRENCY,
+                 max_attempts=MAX_RETRY_ATTEMPTS, base_delay=RETRY_BASE_DELAY, max_delay=RETRY_MAX_DELAY,
+                 name="retry"):
+        self.client = client
+        self.node_urls = list(node_urls)
+        self.prefilter = prefilter
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.recovered = asyncio.Queue()  # (version, txn) ready to classify
+        self.gave_up = []  # Versions still missing after max_attempts
+        self.added = 0
+        self.retries = 0
+        self._due = []  # Heap of (due_time, version, attempt)
+        self._in_flight = 0
+        self._changed = asyncio.Event()
+        self._workers = []
+        self._depth = QUEUE_DEPTH.labels(name)
+
+    @property
+    def pending(self):
+        """Versions waiting for, or in, a retry"""
+        return len(self._due) + self._in_flight
+
+    def add(self, version):
+        """Dead-letter a version; never blocks"""
+        self.added += 1
+        self._schedule(version, 1)
+        if not self._workers:
+            self._workers = [asyncio.create_task(self._worker(i)) for i in range(self.concurrency)]
+
+    def _schedule(self, version, attempt):
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        # Jitter keeps a burst of failures from retrying in lockstep
+        heapq.heappush(self._due, (time.monotonic() + delay * random.uniform(0.5, 1.0), version, attempt))
+        self._depth.set(self.pending)
+        self._changed.set()
+
+    async def _next_due(self):
+        while True:
+            if self._due:
+                wait = self._due[0][0] - time.monotonic()
+                if wait <= 0:
+                    return heapq.heappop(self._due)
+            else:
+                wait = None
+            self._changed.clear()
+            try:
+                await asyncio.wait_for(self._changed.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _worker(self, index):
+        while True:
+            _, version, attempt = await self._next_due()
+            self._in_flight += 1
+            try:
+                node_url = self.node_urls[(version + attempt + index) % len(self.node_urls)]
+                self.retries += 1
+                try:
+                    txn = await get_transaction(self.client, node_url, version, self.prefilter)
+                except Exception:
+                    txn = None
+                if txn is not None:
+                    self.recovered.put_nowait((version, txn))
+                elif attempt >= self.max_attempts:
+                    self.gave_up.append(version)
+                else:
+                    self._schedule(version, attempt + 1)
+            finally:
+                self._in_flight -= 1
+                self._depth.set(self.pending)
+                self._changed.set()
+
+    def take_recovered(self):
+        """Every recovered (version, txn) available right now, without waiting"""
+        items = []
+        while not self.recovered.empty():
+            items.append(self.recovered.get_nowait())
+        return items
+
+    async def drain(self):
+        """Yield recovered (version, txn) until nothing is left to retry"""
+        while True:
+            for item in self.take_recovered():
+                yield item
+            if not self.pending:
+                return
+            self._changed.clear()
+            await self._changed.wait()
+
+    async def close(self):
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
@@ -1,35 +1,260 @@
 #!/usr/bin/env python3
 """
 Helper script to run both CASH scanners with real-time alerts during historical scanning.
+
+Both scanners run as child processes supervised from one asyncio loop, so
+neither stream ever waits on the other. The real-time monitor reports in
+JSON lines (--jsonl -); its alerts jump ahead of queued historical output,
+and if it crashes it is restarted with backoff while the historical scan
+carries on.
 """
 
-import subprocess
-import time
-import sys
+import asyncio
+import json
 import signal
-import os
-import threading
-import queue
-import re
+import sys
+import time
+from collections import deque
+
+from event_sink import RATE_LIMIT_NOTICE_INTERVAL
+
+HISTORICAL_COMMAND = [sys.executable, "-u", "historical_cash_scanner.py"]
+REALTIME_COMMAND = [sys.executable, "-u", "realtime_cash_monitor.py", "--jsonl", "-"]
+REALTIME_START_DELAY = 2  # Seconds to let the historical scanner start first
+READ_SIZE = 64 * 1024  # Bytes read from a child's pipe at a time
+STREAM_LIMIT = 1024 * 1024  # Longest line read from a child; longer ones are skipped
+MAX_QUEUED_LINES = 1000  # Historical lines buffered for the terminal before its scanner waits
+MAX_QUEUED_ALERTS = 1000  # Alerts buffered before the real-time monitor waits
+STDERR_TAIL_LINES = 20  # Real-time console lines kept to show when it crashes
+RESTART_DELAY = 1.0  # Seconds before the first restart of a crashed real-time monitor
+MAX_RESTART_DELAY = 60.0
+STABLE_RUN = 60.0  # A monitor that ran this long starts over at RESTART_DELAY
+STOP_TIMEOUT = 5  # Seconds a child gets to exit before it's killed
+
+
+class Terminal:
+    """Bounded queues for the terminal; alerts are always printed first"""
 
-def signal_handler(sig, frame):
-    print("\n🛑 Stopping all scripts...")
-    sys.exit(0)
+    def __init__(self):
+        self.alerts = asyncio.Queue(MAX_QUEUED_ALERTS)
+        self.lines = asyncio.Queue(MAX_QUEUED_LINES)
+        self._ready = asyncio.Event()
 
-def monitor_realtime_output(process, alert_queue):
-    """Monitor real-time process output for CASH transaction alerts"""
+    async def alert(self, text):
+        await self.alerts.put(text)
+        self._ready.set()
+
+    async def line(self, text):
+        await self.lines.put(text)
+        self._ready.set()
+
+    async def run(self):
+        while True:
+            if not self.alerts.empty():
+                print(self.alerts.get_nowait(), flush=True)
+            elif not self.lines.empty():
+                print(self.lines.get_nowait(), flush=True)
+            else:
+                self._ready.clear()
+                await self._ready.wait()
+
+    def drain(self):
+        """Print whatever is still queued, alerts first"""
+        for queue in (self.alerts, self.lines):
+            while not queue.empty():
+                print(queue.get_nowait())
+
+
+async def read_lines(stream):
+    """Yield a child stream's lines as text, skipping any longer than STREAM_LIMIT"""
+    partial = b""
+    overlong = False
     while True:
-        output = process.stdout.readline()
-        if output == '' and process.poll() is not None:
-            break
-        if output:
-            # Look for CASH transaction alerts
-            if "REAL-TIME CASH TRANSACTION DETECTED" in output:
-                alert_queue.put(("CASH_ALERT", output.strip()))
-            elif "Rate limited" in output or "HTTP 429" in output:
-                alert_queue.put(("RATE_LIMIT", output.strip()))
-            elif "Error" in output or "Failed" in output:
-                alert_queue.put(("ERROR", output.strip()))
+        chunk = await stream.read(READ_SIZE)
+        if not chunk:
+            if partial and not overlong:
+                yield partial.decode("utf-8", "replace").rstrip()
+            return
+        *lines, partial = (partial + chunk).split(b"\n")
+        for line in lines:
+            if not overlong:
+                yield line.decode("utf-8", "replace").rstrip()
+            overlong = False
+        if len(partial) > STREAM_LIMIT:
+            partial = b""
+            overlong = True
+
+
+def format_alert(record, last_throttle_notice):
+    """Terminal text for a real-time JSON-lines record, or None for records that aren't alerts"""
+    kind = record.get("type")
+    if kind == "match":
+        lines = [
+            "\n" + "=" * 60,
+            "🔥 REAL-TIME CASH TRANSACTION ALERT!",
+            "=" * 60,
+            f"  📅 Transaction Time: {record.get('timestamp')}",
+            f"  🔗 Txn Hash: {record.get('hash')}",
+            f"  👤 Sender: {record.get('sender')}",
+            f"  📋 Version: {record.get('version')}",
+            f"  🏷️  Tokens: {', '.join(record.get('tokens', []))}",
+        ]
+        if record.get("latency") is not None:
+            lines.append(f"  ⏱️  Detection Latency: {record['latency']:.2f}s")
+        lines.append("=" * 60 + "\n")
+        return "\n".join(lines)
+    elif kind == "rate_limit":
+        node = record.get("node")
+        now = record.get("time", time.time())
+        if now - last_throttle_notice.get(node, float("-inf")) < RATE_LIMIT_NOTICE_INTERVAL:
+            return None
+        last_throttle_notice[node] = now
+        return f"\n⚠️  RATE LIMIT WARNING: {node} returned HTTP 429, backing off to {record.get('rate')} req/s"
+    elif kind == "error":
+        return f"\n❌ REAL-TIME ERROR: {record.get('message')}"
+    return None
+
+
+async def pump_historical(process, terminal):
+    async for line in read_lines(process.stdout):
+        await terminal.line(line)
+
+
+async def pump_realtime(process, terminal, console_tail, last_throttle_notice):
+    async def alerts():
+        async for line in read_lines(process.stdout):
+            try:
+                record = json.loads(line)
+            except ValueError:
+                console_tail.append(line)
+                continue
+            text = format_alert(record, last_throttle_notice) if isinstance(record, dict) else None
+            if text is not None:
+                await terminal.alert(text)
+
+    async def console():
+        async for line in read_lines(process.stderr):
+            console_tail.append(line)
+
+    await asyncio.gather(alerts(), console())
+
+
+async def stop_process(process, name):
+    if process is None or process.returncode is not None:
+        return
+    try:
+        process.terminate()
+    except ProcessLookupError:
+        return
+    try:
+        await asyncio.wait_for(process.wait(), STOP_TIMEOUT)
+        print(f"✅ {name} stopped gracefully.")
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+        print(f"✅ {name} stopped.")
+
+
+async def sleep_unless(stopping, seconds):
+    """Sleep for `seconds`; True if `stopping` was set meanwhile"""
+    try:
+        await asyncio.wait_for(stopping.wait(), seconds)
+        return True
+    except asyncio.TimeoutError:
+        return False
+
+
+class RealtimeSupervisor:
+    """Keeps the real-time monitor running, restarting it with backoff when it exits"""
+
+    def __init__(self, terminal, stopping):
+        self.terminal = terminal
+        self.stopping = stopping
+        self.process = None
+        self.restarts = 0
+        self._last_throttle_notice = {}
+
+    async def run(self):
+        try:
+            await self._keep_running()
+        finally:
+            await stop_process(self.process, "Real-time monitor")
+
+    async def _keep_running(self):
+        delay = RESTART_DELAY
+        while not self.stopping.is_set():
+            console_tail = deque(maxlen=STDERR_TAIL_LINES)
+            started = time.monotonic()
+            self.process = await asyncio.create_subprocess_exec(
+                *REALTIME_COMMAND, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+            if self.restarts:
+                await self.terminal.alert(f"✅ Real-time monitor restarted (PID: {self.process.pid})")
+            else:
+                print(f"✅ Real-time monitor started in background (PID: {self.process.pid})")
+            await pump_realtime(self.process, self.terminal, console_tail, self._last_throttle_notice)
+            code = await self.process.wait()
+            if self.stopping.is_set():
+                return
+
+            if time.monotonic() - started >= STABLE_RUN:
+                delay = RESTART_DELAY
+            lines = [f"\n⚠️  Real-time monitor has stopped unexpectedly (exit code {code})!"]
+            lines += [f"   {line}" for line in console_tail]
+            lines.append(f"🔄 Restarting real-time monitor in {delay:.0f}s...")
+            await self.terminal.alert("\n".join(lines))
+            if await sleep_unless(self.stopping, delay):
+                return
+            delay = min(delay * 2, MAX_RESTART_DELAY)
+            self.restarts += 1
+
+
+async def supervise():
+    stopping = asyncio.Event()
+
+    def request_stop():
+        if not stopping.is_set():
+            print("\n🛑 Stopping both scripts...")
+        stopping.set()
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, request_stop)
+
+    terminal = Terminal()
+    printer = asyncio.create_task(terminal.run())
+
+    # Start historical scanner first
+    historical_process = await asyncio.create_subprocess_exec(
+        *HISTORICAL_COMMAND, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT)
+    print("✅ Historical scanner started (PID: {})".format(historical_process.pid))
+    historical = asyncio.create_task(pump_historical(historical_process, terminal))
+
+    # Start real-time monitor in background after a short delay
+    print("\n2️⃣  Starting real-time monitor in background...")
+    realtime = RealtimeSupervisor(terminal, stopping)
+    supervisor = None
+    if not await sleep_unless(stopping, REALTIME_START_DELAY):
+        supervisor = asyncio.create_task(realtime.run())
+
+    try:
+        # Run until the historical scan is done or we're asked to stop
+        stop_wait = asyncio.create_task(stopping.wait())
+        await asyncio.wait({historical, stop_wait}, return_when=asyncio.FIRST_COMPLETED)
+        stop_wait.cancel()
+        if historical.done():
+            await historical_process.wait()
+    finally:
+        stopping.set()
+        print("\n🛑 Cleaning up processes...")
+        await stop_process(historical_process, "Historical scanner")
+        await asyncio.gather(historical, return_exceptions=True)
+        if supervisor is not None:
+            supervisor.cancel()
+            await asyncio.gather(supervisor, return_exceptions=True)
+        printer.cancel()
+        await asyncio.gather(printer, return_exceptions=True)
+        terminal.drain()
+
 
 def main():
     print("🚀 CASH Token Scanner Launcher")
@@ -38,122 +263,15 @@ def main():
     print("📚 Historical scanner: Analyzes past transactions")
     print("⚡ Real-time monitor: Provides live CASH transaction alerts")
     print("=" * 60)
-    
-    # Set up signal handler for graceful shutdown
-    signal.signal(signal.SIGINT, signal_handler)
-    
-    # Queue for real-time alerts
-    alert_queue = queue.Queue()
-    
+
     print("\n1️⃣  Starting historical scanner...")
     print("📊 Historical scanner will start analyzing immediately.")
     print("📡 Real-time monitor will start in background shortly.")
     print("💡 Press Ctrl+C to stop both scripts.")
     print("=" * 60)
-    
-    # Start historical scanner first
-    historical_process = subprocess.Popen([
-        sys.executable, "historical_cash_scanner.py"
-    ], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1, universal_newlines=True)
-    
-    print("✅ Historical scanner started (PID: {})".format(historical_process.pid))
-    
-    # Start real-time monitor in background after a short delay
-    print("\n2️⃣  Starting real-time monitor in background...")
-    time.sleep(2)  # Brief delay to let historical scanner start
-    
-    realtime_process = subprocess.Popen([
-        sys.executable, "realtime_cash_monitor.py"
-    ], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1, universal_newlines=True)
-    
-    print("✅ Real-time monitor started in background (PID: {})".format(realtime_process.pid))
-    
-    # Start monitoring thread for real-time alerts
-    monitor_thread = threading.Thread(
-        target=monitor_realtime_output, 
-        args=(realtime_process, alert_queue),
-        daemon=True
-    )
-    monitor_thread.start()
-    
-    # Monitor both processes
-    historical_output = ""
-    last_alert_check = time.time()
-    
-    try:
-        while True:
-            # Check for real-time alerts
-            try:
-                while not alert_queue.empty():
-                    alert_type, alert_message = alert_queue.get_nowait()
-                    
-                    if alert_type == "CASH_ALERT":
-                        print("\n" + "=" * 60)
-                        print("🔥 REAL-TIME CASH TRANSACTION ALERT!")
-                        print("=" * 60)
-                        print(alert_message)
-                        print("=" * 60 + "\n")
-                    elif alert_type == "RATE_LIMIT":
-                        print(f"\n⚠️  RATE LIMIT WARNING: {alert_message}")
-                    elif alert_type == "ERROR":
-                        print(f"\n❌ REAL-TIME ERROR: {alert_message}")
-                        
-            except queue.Empty:
-                pass
-            
-            # Check historical scanner output
-            if historical_process.stdout:
-                historical_line = historical_process.stdout.readline()
-                if historical_line:
-                    print(historical_line.rstrip())
-                    historical_output += historical_line
-            
-            # Check if historical scanner is done
-            if historical_process.poll() is not None:
-                # Read any remaining output
-                if historical_process.stdout:
-                    remaining_output = historical_process.stdout.read()
-                    if remaining_output:
-                        print(remaining_output)
-                break
-            
-            # Check if real-time monitor is still running
-            if realtime_process.poll() is not None:
-                print("\n⚠️  Real-time monitor has stopped unexpectedly!")
-                break
-            
-            # Small delay to prevent busy waiting
-            time.sleep(0.1)
-            
-    except KeyboardInterrupt:
-        print("\n🛑 Stopping both scripts...")
-    
-    finally:
-        print("\n🛑 Cleaning up processes...")
-        
-        # Stop historical scanner
-        if historical_process.poll() is None:
-            historical_process.terminate()
-            try:
-                historical_process.wait(timeout=5)
-                print("✅ Historical scanner stopped gracefully.")
-            except subprocess.TimeoutExpired:
-                historical_process.kill()
-                historical_process.wait()
-                print("✅ Historical scanner stopped.")
-        
-        # Stop real-time monitor
-        if realtime_process.poll() is None:
-            realtime_process.terminate()
-            try:
-                realtime_process.wait(timeout=5)
-                print("✅ Real-time monitor stopped gracefully.")
-            except subprocess.TimeoutExpired:
-                realtime_process.kill()
-                realtime_process.wait()
-                print("✅ Real-time monitor stopped.")
-    
+
+    asyncio.run(supervise())
     print("\n🎯 Both scripts have been stopped.")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
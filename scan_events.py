@@ -0,0 +1,153 @@
+"""
+Typed events shared by the scanners when they run in one process.
+
+Scanners publish events to an EventStream instead of printing or having
+their text output parsed. Output sinks (see event_sink.py) are called
+synchronously for every event and buffer their own writes; async
+subscribers get their own queue of everything published after they
+subscribed.
+"""
+
+import asyncio
+
+HISTORICAL = "historical"
+REALTIME = "realtime"
+
+
+class ScanEvent:
+    """Base class for everything published on an EventStream"""
+
+    __slots__ = ()
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+
+class ScanStarted(ScanEvent):
+    """A scanner settled on the versions it covers (end_version is None for an open-ended tail)"""
+
+    __slots__ = ("source", "start_version", "end_version")
+
+    def __init__(self, source, start_version, end_version=None):
+        self.source = source
+        self.start_version = start_version
+        self.end_version = end_version
+
+
+class CashTransactionFound(ScanEvent):
+    """A CASH transaction; `record` is the scanner's cash_txn_info dict
+
+    `latency` is the realtime detection latency in seconds (block timestamp
+    to detection), None for historical finds. `analyzed` and `matches` are
+    the scanner's running totals.
+    """
+
+    __slots__ = ("source", "record", "latency", "analyzed", "matches")
+
+    def __init__(self, source, record, latency=None, analyzed=None, matches=None):
+        self.source = source
+        self.record = record
+        self.latency = latency
+        self.analyzed = analyzed
+        self.matches = matches
+
+
+class ScanProgress(ScanEvent):
+    """Periodic progress; `total` is None for the realtime tail
+
+    `batch_matches` counts matches since the previous progress event and
+    `detail` holds scanner-specific extras (head, lag, latency...).
+    """
+
+    __slots__ = ("source", "analyzed", "total", "matches", "batch_matches", "detail")
+
+    def __init__(self, source, analyzed, total, matches, batch_matches=0, detail=None):
+        self.source = source
+        self.analyzed = analyzed
+        self.total = total
+        self.matches = matches
+        self.batch_matches = batch_matches
+        self.detail = detail or {}
+
+
+class NodeThrottled(ScanEvent):
+    """A node answered HTTP 429; `rate` is its limiter's new request rate"""
+
+    __slots__ = ("node_url", "rate", "retry_after")
+
+    def __init__(self, node_url, rate, retry_after=None):
+        self.node_url = node_url
+        self.rate = rate
+        self.retry_after = retry_after
+
+
+class ScanError(ScanEvent):
+    """A scanner hit an error it recovered from (or gave up on)"""
+
+    __slots__ = ("source", "message")
+
+    def __init__(self, source, message):
+        self.source = source
+        self.message = message
+
+
+class AggregateSnapshot(ScanEvent):
+    """Rolling aggregates of a scanner's matches; `windows` holds one summary dict per window"""
+
+    __slots__ = ("source", "windows")
+
+    def __init__(self, source, windows):
+        self.source = source
+        self.windows = windows
+
+
+class ScanFinished(ScanEvent):
+    """A scanner stopped, with its final totals"""
+
+    __slots__ = ("source", "analyzed", "matches")
+
+    def __init__(self, source, analyzed, matches):
+        self.source = source
+        self.analyzed = analyzed
+        self.matches = matches
+
+
+class EventStream:
+    """Fan-out of scan events to output sinks and subscribers in one event loop"""
+
+    def __init__(self, sinks=()):
+        self.sinks = list(sinks)
+        self._subscribers = []
+        self.published = 0
+
+    def add_sink(self, sink):
+        """Attach an output sink: anything with emit(event), flush() and close()"""
+        self.sinks.append(sink)
+
+    def publish(self, event):
+        """Hand an event to every sink and subscriber; never blocks the publisher"""
+        self.published += 1
+        for sink in self.sinks:
+            sink.emit(event)
+        for queue in self._subscribers:
+            queue.put_nowait(event)
+
+    async def flush(self):
+        """Wait until every sink has written what it buffered so far"""
+        for sink in self.sinks:
+            await sink.flush()
+
+    async def close(self):
+        for sink in self.sinks:
+            await sink.close()
+
+    def subscribe(self):
+        """A queue that receives every event published from now on"""
+        queue = asyncio.Queue()
+        self._subscribers.append(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        if queue in self._subscribers:
+            self._subscribers.remove(queue)
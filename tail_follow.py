@@ -0,0 +1,211 @@
+"""
+Tail-follow engine for the realtime monitor.
+
+A background poller keeps track of the chain head, polling faster while
+new versions keep arriving and backing off when the chain is quiet. New
+versions are fetched as a pipeline of concurrent page-sized ranges while
+the poller keeps running, and yielded in version order. When the
+follower falls far behind the head it switches to catch-up mode and
+widens the pipeline until it is back at the head.
+"""
+
+import asyncio
+import time
+from collections import deque
+
+from metrics import QUEUE_DEPTH, REALTIME_BEHIND
+from transaction_fetcher import MAX_PAGE_SIZE, get_json, iter_transactions
+
+# Head polling (seconds)
+MIN_POLL_INTERVAL = 0.25  # Roughly one Aptos block
+MAX_POLL_INTERVAL = 10.0
+POLL_SPEEDUP = 0.5  # Interval multiplier when the head moved
+POLL_SLOWDOWN = 1.5  # Interval multiplier when it didn't
+
+# Fetch pipeline
+TAIL_WORKERS = 4  # Ranges in flight while following the head
+CATCH_UP_WORKERS = 16  # Ranges in flight while catching up
+CATCH_UP_THRESHOLD = 2000  # Versions behind the head that trigger catch-up mode
+RANGE_RETRIES = 3  # Re-fetches of a range whose newest versions aren't served yet
+RANGE_RETRY_DELAY = 0.5
+
+# Detection latency histogram bucket upper bounds (seconds)
+LATENCY_BUCKETS = (0.5, 1, 2, 3, 5, 10, 30, 60, 300)
+
+IN_FLIGHT_DEPTH = QUEUE_DEPTH.labels("realtime_ranges_in_flight")
+
+
+class LatencyHistogram:
+    """Fixed-bucket histogram of detection latencies in seconds"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        seconds = max(0.0, seconds)
+        index = 0
+        while index < len(self.buckets) and seconds > self.buckets[index]:
+            index += 1
+        self.counts[index] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, fraction):
+        """Upper bound of the bucket holding the given fraction of samples (None if empty)"""
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def summary(self):
+        """One-line p50/p99/max summary"""
+        if not self.count:
+            return "no samples"
+        return (f"p50 ≤{self.percentile(0.5):.2f}s, p99 ≤{self.percentile(0.99):.2f}s, "
+                f"max {self.max:.2f}s over {self.count} detections")
+
+    def lines(self):
+        """Per-bucket report lines"""
+        lines = []
+        labels = [f"≤{bound}s" for bound in self.buckets] + [f">{self.buckets[-1]}s"]
+        for label, count in zip(labels, self.counts):
+            if count:
+                share = count / self.count
+                lines.append(f"{label:>7} {count:6,}  {'█' * max(1, round(share * 30))} {share:.0%}")
+        return lines
+
+
+def detection_latency(txn, now=None):
+    """Seconds between a transaction's block timestamp and now"""
+    now = time.time() if now is None else now
+    return now - int(txn["timestamp"]) / 1000000
+
+
+class TailFollower:
+    """Follows a node's chain head and yields every new (version, txn) in order"""
+
+    def __init__(self, client, node_url, start_version, prefilter=None, workers=TAIL_WORKERS,
+                 catch_up_workers=CATCH_UP_WORKERS, catch_up_threshold=CATCH_UP_THRESHOLD, coverage=None, hedger=None):
+        self.client = client
+        self.node_url = node_url
+        self.prefilter = prefilter
+        self.coverage = coverage
+        self.hedger = hedger
+        self.workers = workers
+        self.catch_up_workers = catch_up_workers
+        self.catch_up_threshold = catch_up_threshold
+        self.head = start_version  # Latest version the node reported
+        self.last_yielded = start_version
+        self.poll_interval = MIN_POLL_INTERVAL
+        self.catching_up = False
+        self.polls = 0
+        self.poll_errors = 0
+        self.catch_ups = 0
+        self._next_dispatch = start_version + 1
+        self._head_moved = asyncio.Event()
+
+    @property
+    def behind(self):
+        """Versions between the last one yielded and the chain head"""
+        return self.head - self.last_yielded
+
+    async def poll_head(self):
+        """Fetch the node's ledger version, or None on failure"""
+        info = await get_json(self.client, f"{self.node_url}/v1")
+        try:
+            return int(info["ledger_version"])
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    async def _poll(self):
+        failing = False
+        while True:
+            head = await self.poll_head()
+            self.polls += 1
+            if head is None:
+                self.poll_errors += 1
+                if not failing:
+                    print(f"⚠️  Head poll failed on {self.node_url}; backing off")
+                failing = True
+                self.poll_interval = min(MAX_POLL_INTERVAL, self.poll_interval * POLL_SLOWDOWN)
+            elif head > self.head:
+                failing = False
+                self.head = head
+                self._head_moved.set()
+                self.poll_interval = max(MIN_POLL_INTERVAL, self.poll_interval * POLL_SPEEDUP)
+            else:
+                failing = False
+                self.poll_interval = min(MAX_POLL_INTERVAL, self.poll_interval * POLL_SLOWDOWN)
+            await asyncio.sleep(self.poll_interval)
+
+    async def _fetch_range(self, start_version, end_version):
+        for attempt in range(RANGE_RETRIES + 1):
+            batch = [item async for item in iter_transactions(self.client, self.node_url, start_version,
+                                                               end_version, prefilter=self.prefilter,
+                                                               hedger=self.hedger)]
+            if all(txn is not None for _, txn in batch) or attempt == RANGE_RETRIES:
+                return batch
+            # Load-balanced nodes can briefly lag the head they advertised
+            await asyncio.sleep(RANGE_RETRY_DELAY)
+
+    def _update_mode(self):
+        if not self.catching_up and self.behind > self.catch_up_threshold:
+            self.catching_up = True
+            self.catch_ups += 1
+            print(f"🏃 Catch-up mode: {self.behind:,} versions behind head, "
+                  f"widening the pipeline to {self.catch_up_workers} ranges")
+        elif self.catching_up and self.behind <= MAX_PAGE_SIZE:
+            self.catching_up = False
+            print(f"✅ Caught up with chain head at version {self.head:,}")
+
+    def _dispatch(self, in_flight):
+        self._update_mode()
+        limit = self.catch_up_workers if self.catching_up else self.workers
+        while len(in_flight) < limit and self._next_dispatch <= self.head:
+            range_end = min(self._next_dispatch + MAX_PAGE_SIZE - 1, self.head)
+            if self.coverage is not None:
+                # Everything from the tail's start up belongs to the tail; claiming
+                # just records it as covered
+                self.coverage.claim(self._next_dispatch, range_end)
+            in_flight.append(asyncio.create_task(self._fetch_range(self._next_dispatch, range_end)))
+            self._next_dispatch = range_end + 1
+        IN_FLIGHT_DEPTH.set(len(in_flight))
+        REALTIME_BEHIND.set(self.behind)
+
+    async def follow(self):
+        """Yield (version, txn) for every version after the start, forever
+
+        `txn` is None for a version that still couldn't be fetched after
+        RANGE_RETRIES attempts. With a CoverageTracker, every dispatched
+        range is recorded in it.
+        """
+        poller = asyncio.create_task(self._poll())
+        in_flight = deque()
+        try:
+            while True:
+                self._dispatch(in_flight)
+                if not in_flight:
+                    self._head_moved.clear()
+                    await self._head_moved.wait()
+                    continue
+                batch = await in_flight.popleft()
+                # Refill the pipeline before handing results to the caller
+                self._dispatch(in_flight)
+                for version, txn in batch:
+                    self.last_yielded = version
+                    yield version, txn
+        finally:
+            poller.cancel()
+            for task in in_flight:
+                task.cancel()
+            await asyncio.gather(poller, *in_flight, return_exceptions=True)
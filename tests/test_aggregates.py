@@ -0,0 +1,50 @@
+"""token_volumes on the coin and fungible asset event shapes mainnet emits"""
+
+import json
+
+from aggregates import WindowedAggregates, token_volumes
+from checkpoint import decode_match, encode_match
+from fake_aptos_node import FakeLedger
+from historical_cash_scanner import CASH_TOKEN_TYPE
+from match_records import build_cash_txn_info
+from watchlist import Watchlist
+
+WATCHLIST = Watchlist({"CASH": CASH_TOKEN_TYPE})
+WITHDRAW_TYPES = {"publisher": "0x1::coin::WithdrawEvent", "swap": "0x1::fungible_asset::Withdraw",
+                  "transfer": "0x1::coin::CoinWithdraw"}
+
+
+def matches_by_kind():
+    ledger = FakeLedger(head=3000, cash_density=0.05)
+    matches = {}
+    for version in ledger.cash_versions():
+        matches.setdefault(ledger.cash_kind(version), (version, ledger.transaction(version)))
+    assert set(matches) == set(WITHDRAW_TYPES)
+    return matches
+
+
+def withdrawn(txn, kind):
+    return sum(int(event["data"]["amount"]) for event in txn["events"] if event["type"] == WITHDRAW_TYPES[kind])
+
+
+def test_volume_comes_from_non_generic_withdraw_events():
+    for kind, (version, txn) in matches_by_kind().items():
+        assert CASH_TOKEN_TYPE not in str([event["type"] for event in txn["events"] if "Withdraw" in event["type"]])
+        info = build_cash_txn_info(version, txn, WATCHLIST.match(txn))
+        assert token_volumes(info, WATCHLIST) == {"CASH": withdrawn(txn, kind)}, kind
+
+
+def test_coins_that_arent_watched_add_no_volume():
+    other = Watchlist({"OTHER": "0x%064x::other::Other" % 0xbeef})
+    for version, txn in matches_by_kind().values():
+        assert token_volumes(build_cash_txn_info(version, txn, ["CASH"]), other) == {}
+
+
+def test_volume_survives_a_checkpoint_round_trip():
+    aggregates = WindowedAggregates(WATCHLIST, "historical")
+    expected = 0
+    for kind, (version, txn) in matches_by_kind().items():
+        info = build_cash_txn_info(version, txn, ["CASH"])
+        aggregates.add(decode_match(json.loads(json.dumps(encode_match(info)))))
+        expected += withdrawn(txn, kind)
+    assert aggregates.snapshot()[-1]["volume"] == {"CASH": expected}
@@ -0,0 +1,207 @@
+"""bcs.decode_page against hand-assembled pages of every transaction type
+
+The pages are built byte by byte here from the aptos-types layouts, not
+with bcs.py's own encoders, so the decoder is checked against an
+independent reading of the format.
+"""
+
+import pytest
+
+from bcs import BcsError, decode_page
+from historical_cash_scanner import CASH_TOKEN_TYPE
+from prefilter import Prefilter
+
+START = 5000
+
+
+def uleb(value):
+    out = bytearray()
+    while value >= 0x80:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def u64(value):
+    return value.to_bytes(8, "little")
+
+
+def addr(value):
+    return int(value, 16).to_bytes(32, "big")
+
+
+def blob(raw):
+    return uleb(len(raw)) + raw
+
+
+def string(text):
+    return blob(text.encode())
+
+
+def vec(items):
+    return uleb(len(items)) + b"".join(items)
+
+
+def some(raw):
+    return b"\x01" + raw
+
+
+NONE = b"\x00"
+HASH = blob(bytes(range(32)))
+SENDER = "0x" + "ab" * 32
+OTHER = "0x" + "cd" * 32
+DEX = "0x" + "d3" * 32
+CASH_ADDRESS, CASH_MODULE, CASH_NAME = CASH_TOKEN_TYPE.split("::")
+APT = "0x1::aptos_coin::AptosCoin"
+
+
+def struct(address, module, name, *type_args):
+    return uleb(7) + addr(address) + string(module) + string(name) + vec(list(type_args))
+
+
+CASH_TAG = struct(CASH_ADDRESS, CASH_MODULE, CASH_NAME)
+APT_TAG = struct("0x1", "aptos_coin", "AptosCoin")
+
+
+def info(status=uleb(0)):
+    """TransactionInfo::V0 with a checkpoint hash and no auxiliary info hash"""
+    return uleb(0) + u64(321) + status + HASH + HASH + HASH + some(HASH) + NONE
+
+
+def event_v1(address, type_tag, data=u64(100)):
+    return uleb(0) + u64(2) + addr(address) + u64(7) + type_tag + blob(data)
+
+
+def event_v2(type_tag, data=u64(100)):
+    return uleb(1) + type_tag + blob(data)
+
+
+def write_set(*entries):
+    return uleb(0) + vec(list(entries))
+
+
+def on_chain(version, transaction, status=uleb(0), events=(), changes=write_set()):
+    """TransactionOnChainData: version, transaction, info, events, accumulator root hash, write set"""
+    return u64(version) + transaction + info(status) + vec(list(events)) + HASH + changes
+
+
+def raw_user(sender, payload):
+    """SignedTransaction's RawTransaction: sender, sequence number, payload, gas, expiration, chain id"""
+    return uleb(0) + addr(sender) + u64(9) + payload + u64(2000) + u64(100) + u64(1700000600) + bytes([1])
+
+
+def ed25519_account():
+    return uleb(0) + blob(bytes(32)) + blob(bytes(64))
+
+
+def entry_function(address, module, function, *type_args):
+    return (addr(address) + string(module) + string(function) + vec(list(type_args))
+            + vec([blob(addr(SENDER)), blob(u64(5))]))
+
+
+BLOCK_FIELDS = (HASH + u64(3) + u64(44) + addr(OTHER) + blob(b"\xff\x01") + vec([(2).to_bytes(4, "little")])
+                + u64(1700000000000000))
+
+TRANSACTIONS = [
+    # BlockMetadata
+    (uleb(2) + BLOCK_FIELDS, [event_v1("0x1", struct("0x1", "block", "NewBlockEvent"))],
+     {"type": "block_metadata_transaction", "events": [{"type": "0x1::block::NewBlockEvent"}]}),
+    # BlockMetadataExt::V1 with randomness: RandMetadata (epoch, round), then the seed
+    (uleb(5) + uleb(1) + BLOCK_FIELDS + some(u64(3) + u64(44) + blob(bytes(32))),
+     [event_v1("0x1", struct("0x1", "block", "NewBlockEvent"))],
+     {"type": "block_metadata_transaction", "events": [{"type": "0x1::block::NewBlockEvent"}]}),
+    # BlockMetadataExt::V1 without randomness
+    (uleb(5) + uleb(1) + BLOCK_FIELDS + NONE, [],
+     {"type": "block_metadata_transaction", "events": []}),
+    # Multi-agent swap: entry function, Ed25519 sender, a MultiKey secondary signer
+    (raw_user(SENDER, uleb(2) + entry_function(DEX, "router", "swap_exact_input", CASH_TAG, APT_TAG))
+     + uleb(2) + ed25519_account() + vec([addr(OTHER)])
+     + vec([uleb(3) + vec([uleb(0) + blob(bytes(32)), uleb(1) + blob(bytes(65))]) + bytes([1])
+            + vec([uleb(0) + blob(bytes(64))]) + blob(b"\x80\x00\x00\x00")]),
+     [event_v2(struct(DEX, "swap", "SwapEvent", CASH_TAG, APT_TAG))],
+     {"type": "user_transaction", "sender": SENDER,
+      "payload": {"type": "entry_function_payload", "function": f"{DEX}::router::swap_exact_input",
+                  "type_arguments": [CASH_TOKEN_TYPE, APT]},
+      "events": [{"type": f"{DEX}::swap::SwapEvent<{CASH_TOKEN_TYPE}, {APT}>"}]}),
+    # StateCheckpoint
+    (uleb(3) + HASH, [], {"type": "state_checkpoint_transaction", "events": []}),
+    # Fee-payer script with a SingleKey sender, aborted in a module with abort info
+    (raw_user(OTHER, uleb(0) + blob(b"\xa1\x1c\xeb\x0b") + vec([CASH_TAG])
+              + vec([uleb(1) + u64(5), uleb(3) + addr(SENDER), uleb(4) + blob(b"memo"), uleb(9) + blob(u64(1))]))
+     + uleb(3) + uleb(2) + uleb(0) + blob(bytes(32)) + uleb(0) + blob(bytes(64)) + vec([]) + vec([])
+     + addr(SENDER) + ed25519_account(),
+     [event_v2(struct("0x1", "transaction_fee", "FeeStatement"))],
+     {"type": "user_transaction", "sender": OTHER,
+      "payload": {"type": "script_payload", "type_arguments": [CASH_TOKEN_TYPE]},
+      "events": [{"type": "0x1::transaction_fee::FeeStatement"}]}),
+    # ValidatorTransaction::DKGResult
+    (uleb(4) + uleb(0) + u64(3) + addr(OTHER) + blob(bytes(48)), [],
+     {"type": "validator_transaction", "events": []}),
+    # ValidatorTransaction::ObservedJWKUpdate
+    (uleb(4) + uleb(1) + string("https://accounts.google.com") + u64(2)
+     + vec([string("0x1::jwks::RSA_JWK") + blob(b"{}")]) + blob(b"\x07") + some(blob(bytes(96))), [],
+     {"type": "validator_transaction", "events": []}),
+    # TransactionPayload::Payload V1 with multisig address and nonce, single-key sender, failed execution
+    (raw_user(SENDER, uleb(4) + uleb(0) + uleb(1) + entry_function("0x1", "aptos_account", "transfer_coins", APT_TAG)
+              + uleb(0) + some(addr(OTHER)) + some(u64(77)))
+     + uleb(4) + uleb(2) + uleb(0) + blob(bytes(32)) + uleb(0) + blob(bytes(64)),
+     [event_v1(SENDER, struct("0x1", "coin", "WithdrawEvent"))],
+     {"type": "user_transaction", "sender": SENDER,
+      "payload": {"type": "entry_function_payload", "function": "0x1::aptos_account::transfer_coins",
+                  "type_arguments": [APT]},
+      "events": [{"type": "0x1::coin::WithdrawEvent"}]}),
+    # BlockEpilogue::V1 with a fee distribution
+    (uleb(6) + uleb(1) + HASH + uleb(0) + b"\x00\x01" + u64(500) + u64(9000) + uleb(0)
+     + vec([u64(1) + u64(10), u64(2) + u64(20)]), [],
+     {"type": "block_epilogue_transaction", "events": []}),
+]
+
+STATUSES = {
+    5: uleb(2) + uleb(0) + addr("0x1") + string("coin") + u64(65542) + some(string("EINSUFFICIENT_BALANCE")
+                                                                         + string("Not enough coins")),
+    8: uleb(3) + uleb(1) + (3).to_bytes(2, "little") + (12).to_bytes(2, "little"),
+}
+
+# Every StateKey and WriteOp variant, with both StateValueMetadata versions
+CHANGES = write_set(
+    uleb(0) + addr(SENDER) + blob(b"\x01resource") + uleb(1) + blob(b"value"),
+    uleb(1) + addr(OTHER) + blob(b"table key") + uleb(3) + blob(b"new") + uleb(1) + u64(1) + u64(2) + u64(3),
+    uleb(2) + blob(b"raw key") + uleb(5) + uleb(0) + u64(1) + u64(2),
+    uleb(0) + addr(OTHER) + blob(b"\x01gone") + uleb(2),
+)
+
+
+def page():
+    txns = [on_chain(START + i, transaction, STATUSES.get(i, uleb(0)), events, CHANGES if i == 3 else write_set())
+            for i, (transaction, events, _) in enumerate(TRANSACTIONS)]
+    return vec(txns)
+
+
+def test_decodes_every_transaction_type():
+    decoded = decode_page(page(), START)
+    expected = [dict(record, version=str(START + i)) for i, (_, _, record) in enumerate(TRANSACTIONS)]
+    assert decoded == expected
+
+
+def test_bcs_screen_picks_out_the_cash_transactions():
+    screened = Prefilter([CASH_TOKEN_TYPE]).screen_bcs_page(page(), START)
+    assert sorted(version for version, txn in screened.items() if txn is None) == [START + 3, START + 5]
+    assert len(screened) == len(TRANSACTIONS)
+
+
+def test_rejects_truncated_pages():
+    raw = page()
+    with pytest.raises(BcsError):
+        decode_page(raw[:-5], START)
+
+
+def test_rejects_pages_out_of_order():
+    with pytest.raises(BcsError):
+        decode_page(page(), START + 1)
+
+
+def test_rejects_unknown_variants():
+    unknown = vec([on_chain(START, uleb(9))])
+    with pytest.raises(BcsError, match="Unknown Transaction variant 9"):
+        decode_page(unknown, START)
@@ -0,0 +1,81 @@
+"""Discovery against the aiohttp stand-in node, checked against the full historical scan"""
+
+import asyncio
+
+import pytest
+
+from discovery_scanner import scan_discovered_cash_transactions
+from fake_aptos_node import CASH_PUBLISHER, FakeLedger, start_fake_node
+from historical_cash_scanner import CASH_TOKEN_TYPE, scan_historical_cash_transactions
+from node_client import NodeClient
+from watchlist import Watchlist
+
+HEAD = 3000
+
+
+def by_version(match):
+    return match["version"]
+
+
+async def run_both(ledger, tmp_path, watchlist=None, verify=False):
+    runner, node_url = await start_fake_node(ledger)
+    try:
+        async with NodeClient(encoding="json") as client:
+            discovered = await scan_discovered_cash_transactions(client, end_version=ledger.head, verify=verify,
+                                                                 store_path=None, watchlist=watchlist,
+                                                                 healthy_nodes=[node_url])
+            scanned = await scan_historical_cash_transactions(client, checkpoint_path=str(tmp_path / "checkpoint"),
+                                                              store_path=None, healthy_nodes=[node_url],
+                                                              watchlist=watchlist, index_path=None)
+    finally:
+        await runner.cleanup()
+    # Both scanners return cash_txn_info dicts; only the order they found them in differs
+    return sorted(discovered, key=by_version), sorted(scanned, key=by_version)
+
+
+@pytest.fixture(autouse=True)
+def scratch_directory(tmp_path, monkeypatch):
+    # The scanners keep caches (node ranking, block index) in the working directory
+    monkeypatch.chdir(tmp_path)
+
+
+def test_discovery_matches_full_scan_for_publisher_activity(tmp_path):
+    ledger = FakeLedger(head=HEAD, cash_density=0.01, third_party_share=0)
+    discovered, scanned = asyncio.run(run_both(ledger, tmp_path))
+    assert scanned
+    assert discovered == scanned
+
+
+def test_discovery_finds_exactly_the_publisher_subset(tmp_path):
+    ledger = FakeLedger(head=HEAD, cash_density=0.01)
+    discovered, scanned = asyncio.run(run_both(ledger, tmp_path))
+    publisher_versions = {version for version in ledger.cash_versions() if ledger.cash_kind(version) == "publisher"}
+    assert len(publisher_versions) < len(scanned)
+    assert discovered == [match for match in scanned if match["version"] in publisher_versions]
+    assert all(match["sender"] == CASH_PUBLISHER for match in discovered)
+
+
+def test_discovery_reports_the_coverage_gap(tmp_path, capsys):
+    ledger = FakeLedger(head=HEAD, cash_density=0.01)
+    discovered, scanned = asyncio.run(run_both(ledger, tmp_path, verify=True))
+    output = capsys.readouterr().out
+    missed = len(scanned) - len(discovered)
+    assert missed > 0
+    assert "⚠️  Coverage:" in output
+    assert f"❌ Verification mismatch: {missed} missed by discovery, 0 not in the walk" in output
+    assert "✅ Verified" not in output
+
+
+def test_discovery_uses_the_configured_watchlist(tmp_path):
+    ledger = FakeLedger(head=HEAD, cash_density=0.01, third_party_share=0)
+    watchlist = Watchlist({"DOLLAR": CASH_TOKEN_TYPE})
+    discovered, scanned = asyncio.run(run_both(ledger, tmp_path, watchlist=watchlist))
+    assert discovered == scanned
+    assert {tuple(match["tokens"]) for match in discovered} == {("DOLLAR",)}
+
+
+def test_discovery_ignores_unwatched_tokens(tmp_path):
+    ledger = FakeLedger(head=HEAD, cash_density=0.01, third_party_share=0)
+    watchlist = Watchlist({"OTHER": "0x%064x::other::OTHER" % 0xbeef})
+    discovered, scanned = asyncio.run(run_both(ledger, tmp_path, watchlist=watchlist))
+    assert discovered == scanned == []
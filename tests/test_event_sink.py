@@ -0,0 +1,40 @@
+"""Where BufferedSink writes its batches"""
+
+import asyncio
+import io
+import threading
+
+from event_sink import BufferedSink
+
+
+class ThreadRecordingSink(BufferedSink):
+    def __init__(self, stream, owns_stream):
+        super().__init__(stream, owns_stream)
+        self.threads = set()
+
+    def render(self, event, at):
+        self.threads.add(threading.get_ident())
+        return f"{event}\n"
+
+
+async def write_through(sink):
+    for i in range(5):
+        sink.emit(i)
+    await sink.close()
+    return threading.get_ident()
+
+
+def test_shared_streams_are_written_on_the_loop_thread():
+    sink = ThreadRecordingSink(io.StringIO(), owns_stream=False)
+    loop_thread = asyncio.run(write_through(sink))
+    assert sink.threads == {loop_thread}
+    assert sink.stream.getvalue() == "0\n1\n2\n3\n4\n"
+
+
+def test_owned_streams_are_written_from_a_worker_thread():
+    stream = io.StringIO()
+    stream.close = lambda: None  # Keep the text readable after the sink closes it
+    sink = ThreadRecordingSink(stream, owns_stream=True)
+    loop_thread = asyncio.run(write_through(sink))
+    assert loop_thread not in sink.threads
+    assert stream.getvalue() == "0\n1\n2\n3\n4\n"
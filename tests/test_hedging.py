@@ -0,0 +1,58 @@
+"""Hedged pages and lookups against a stalling aiohttp stand-in and a healthy one"""
+
+import asyncio
+import time
+
+from fake_aptos_node import FakeLedger, start_fake_node
+from hedging import DEFAULT_HEDGE_DELAY, LOOKUP, PAGE, Hedger
+from historical_cash_scanner import CASH_TOKEN_TYPE
+from metrics import HEDGED_REQUESTS
+from node_client import NodeClient
+from prefilter import Prefilter
+from transaction_fetcher import get_transaction, iter_transactions
+
+STALL = 3.0  # Seconds every transactions request to the stalled node hangs
+
+
+def hedges_won(kind):
+    return sum(child.value for labels, child in HEDGED_REQUESTS.children.items() if labels[1:] == (kind, "won"))
+
+
+async def fetch_with_stalled_primary(fetch):
+    ledger = FakeLedger(head=1000, cash_density=0.05)
+    stalled, stalled_node = await start_fake_node(ledger, stall_rate=1.0, stall=STALL)
+    healthy, healthy_node = await start_fake_node(ledger)
+    try:
+        async with NodeClient(encoding="json") as client:
+            hedger = Hedger([healthy_node])
+            started = time.perf_counter()
+            result = await fetch(client, stalled_node, hedger)
+            return result, time.perf_counter() - started, hedger
+    finally:
+        await asyncio.gather(stalled.cleanup(), healthy.cleanup())
+
+
+def test_stalled_page_is_answered_by_the_backup():
+    async def fetch(client, node_url, hedger):
+        return [item async for item in iter_transactions(client, node_url, 101, 200,
+                                                         prefilter=Prefilter([CASH_TOKEN_TYPE]), hedger=hedger)]
+
+    page_wins = hedges_won(PAGE)
+    batch, elapsed, hedger = asyncio.run(fetch_with_stalled_primary(fetch))
+    assert [version for version, _ in batch] == list(range(101, 201))
+    assert all(txn is not None for _, txn in batch)
+    assert elapsed < DEFAULT_HEDGE_DELAY + STALL / 2
+    assert (hedger.requests, hedger.sent, hedger.won) == (1, 1, 1)
+    assert hedges_won(PAGE) == page_wins + 1
+
+
+def test_stalled_lookup_is_answered_by_the_backup():
+    async def fetch(client, node_url, hedger):
+        return await get_transaction(client, node_url, 123, hedger=hedger)
+
+    lookup_wins = hedges_won(LOOKUP)
+    txn, elapsed, hedger = asyncio.run(fetch_with_stalled_primary(fetch))
+    assert txn["version"] == "123"
+    assert elapsed < DEFAULT_HEDGE_DELAY + STALL / 2
+    assert hedger.won == 1
+    assert hedges_won(LOOKUP) == lookup_wins + 1
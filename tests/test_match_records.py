@@ -0,0 +1,33 @@
+"""MatchLog reading every match back from its spill file"""
+
+from fake_aptos_node import FakeLedger
+from historical_cash_scanner import CASH_TOKEN_TYPE
+from match_records import MatchLog, build_cash_txn_info
+from watchlist import Watchlist
+
+
+def infos(count):
+    ledger = FakeLedger(head=20000, cash_density=0.01)
+    watchlist = Watchlist({"CASH": CASH_TOKEN_TYPE})
+    versions = ledger.cash_versions()[:count]
+    assert len(versions) == count
+    return [build_cash_txn_info(version, ledger.transaction(version), watchlist.match(ledger.transaction(version)))
+            for version in versions]
+
+
+def test_all_infos_returns_every_match_past_the_ring():
+    matches = infos(25)
+    log = MatchLog(capacity=5)
+    log.extend(matches)
+    try:
+        assert len(log.recent) == 5
+        assert log.all_infos() == matches
+    finally:
+        log.close()
+
+
+def test_all_infos_without_a_spill_is_just_the_ring():
+    matches = infos(8)
+    log = MatchLog(capacity=5, spill=False)
+    log.extend(matches)
+    assert [info["version"] for info in log.all_infos()] == [info["version"] for info in matches[-5:]]
@@ -0,0 +1,45 @@
+"""select_nodes with a cached ranking, against the aiohttp stand-in"""
+
+import asyncio
+
+from fake_aptos_node import FakeLedger, start_fake_node
+from node_client import NodeClient
+from node_probe import NodeRanking, ProbeResult, select_nodes
+
+DEAD_NODE = "http://127.0.0.1:9"  # Discard port: nothing listens there
+
+
+async def select_with_cache(tmp_path, cached_order, wait_for_all=False):
+    runner, live_node = await start_fake_node(FakeLedger(head=1000))
+    try:
+        ranking_path = str(tmp_path / "node_ranking.json")
+        urls = {"dead": DEAD_NODE, "live": live_node}
+        NodeRanking(ranking_path).save([ProbeResult(urls[name], 0.01 * (i + 1)) for i, name in enumerate(cached_order)])
+        async with NodeClient() as client:
+            selected = await select_nodes(client, list(urls.values()), wait_for_all, ranking_path)
+        return selected, live_node
+    finally:
+        await runner.cleanup()
+
+
+def test_cached_ranking_is_used_when_its_fastest_node_answers(tmp_path, capsys):
+    selected, live_node = asyncio.run(select_with_cache(tmp_path, ["live", "dead"]))
+    assert selected == [live_node]
+    assert "Using cached node ranking" in capsys.readouterr().out
+
+
+def test_dead_cached_nodes_are_left_out(tmp_path, capsys):
+    for cached_order in (["live", "dead"], ["dead", "live"]):
+        selected, live_node = asyncio.run(select_with_cache(tmp_path, cached_order, wait_for_all=True))
+        assert selected == [live_node]
+        out = capsys.readouterr().out
+        assert "Using cached node ranking" in out
+        assert f"left out: {DEAD_NODE}" in out
+
+
+def test_dead_cached_node_falls_back_to_probing(tmp_path, capsys):
+    selected, live_node = asyncio.run(select_with_cache(tmp_path, ["dead", "live"]))
+    assert selected == [live_node]
+    assert "aren't responding; probing every node" in capsys.readouterr().out
+    # The fresh probe replaces the stale ranking
+    assert NodeRanking(str(tmp_path / "node_ranking.json")).load([DEAD_NODE, live_node]) == [live_node]
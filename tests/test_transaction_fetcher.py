@@ -0,0 +1,46 @@
+"""fetch_raw's retries against the aiohttp stand-in"""
+
+import asyncio
+
+import transaction_fetcher
+from fake_aptos_node import FakeLedger, start_fake_node
+from metrics import NODE_REQUEST_FAILURES, NODE_RESPONSES
+from node_client import NodeClient, node_origin
+from transaction_fetcher import MAX_ERROR_RETRIES, get_transaction_raw
+
+DEAD_NODE = "http://127.0.0.1:9"  # Discard port: nothing listens there
+
+
+async def fetch(node_url=None, **faults):
+    runner, live_node = await start_fake_node(FakeLedger(head=1000), **faults)
+    try:
+        async with NodeClient() as client:
+            raw = await get_transaction_raw(client, node_url or live_node, 42)
+        return raw, runner.app["stats"], live_node
+    finally:
+        await runner.cleanup()
+
+
+def test_server_errors_are_retried_then_given_up(monkeypatch):
+    monkeypatch.setattr(transaction_fetcher, "ERROR_RETRY_DELAY", 0)
+    raw, stats, node_url = asyncio.run(fetch(error_rate=1.0))
+    assert raw is None
+    assert stats["errors"] == MAX_ERROR_RETRIES + 1
+    assert NODE_RESPONSES.labels(node_origin(node_url), "500").value >= MAX_ERROR_RETRIES + 1
+
+
+def test_flaky_node_is_retried_until_it_answers(monkeypatch):
+    monkeypatch.setattr(transaction_fetcher, "ERROR_RETRY_DELAY", 0)
+    # The stand-in's seeded faults fail the first request and let the second through
+    raw, stats, _ = asyncio.run(fetch(error_rate=0.5, seed=3))
+    assert raw is not None
+    assert stats["errors"] == 1
+
+
+def test_connection_errors_are_retried_and_counted(monkeypatch):
+    monkeypatch.setattr(transaction_fetcher, "ERROR_RETRY_DELAY", 0)
+    failures = NODE_REQUEST_FAILURES.labels(node_origin(DEAD_NODE), "error")
+    before = failures.value
+    raw, _, _ = asyncio.run(fetch(DEAD_NODE))
+    assert raw is None
+    assert failures.value - before == MAX_ERROR_RETRIES + 1
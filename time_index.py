@@ -0,0 +1,219 @@
+"""
+Timestamp-to-version resolution for time-window scans.
+
+Aptos blocks have monotonic timestamps, so the first version at or after
+a point in time can be found by searching block heights with
+/v1/blocks/by_height. Every block looked at becomes an anchor in a sparse
+BlockIndex that is saved to disk. Later lookups start from the nearest
+known anchors on either side, so repeating or narrowing a time window
+costs only a handful of requests.
+"""
+
+import bisect
+import json
+import os
+import re
+from datetime import datetime, timedelta
+
+from transaction_fetcher import get_json
+
+BLOCK_INDEX_PATH = "block_index.json"
+MAX_ANCHORS = 20000  # Oldest-added anchors beyond this are dropped on save
+
+DURATION_UNITS = {"s": "seconds", "m": "minutes", "h": "hours", "d": "days", "w": "weeks"}
+
+
+def parse_duration(text):
+    """'90m', '24h', '7d'... as a timedelta"""
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([smhdw])\s*", text.lower())
+    if not match:
+        raise ValueError(f"Invalid duration {text!r} (expected e.g. 90m, 24h, 7d)")
+    return timedelta(**{DURATION_UNITS[match.group(2)]: float(match.group(1))})
+
+
+def parse_time(text):
+    """An ISO date or date-time ('2024-05-01', '2024-05-01T12:00') in local time"""
+    try:
+        return datetime.fromisoformat(text)
+    except ValueError:
+        raise ValueError(f"Invalid date {text!r} (expected e.g. 2024-05-01 or 2024-05-01T12:00)")
+
+
+def parse_time_window(since=None, start=None, end=None, now=None):
+    """(start, end) datetimes for --since / --from / --to; end is None for "up to now"
+
+    Returns None when no window was asked for.
+    """
+    if since is None and start is None:
+        if end is not None:
+            raise ValueError("--to needs --from or --since")
+        return None
+    now = now or datetime.now()
+    start_time = now - parse_duration(since) if since is not None else parse_time(start)
+    end_time = parse_time(end) if end is not None else None
+    if end_time is not None and end_time <= start_time:
+        raise ValueError("The time window ends before it starts")
+    return start_time, end_time
+
+
+def to_micros(moment):
+    return round(moment.timestamp() * 1000000)
+
+
+class BlockAnchor:
+    """One block's height, timestamp and version range"""
+
+    __slots__ = ("height", "timestamp_us", "first_version", "last_version")
+
+    def __init__(self, height, timestamp_us, first_version, last_version):
+        self.height = height
+        self.timestamp_us = timestamp_us
+        self.first_version = first_version
+        self.last_version = last_version
+
+    @classmethod
+    def from_block(cls, block):
+        return cls(int(block["block_height"]), int(block["block_timestamp"]), int(block["first_version"]),
+                   int(block["last_version"]))
+
+
+class BlockIndex:
+    """Sparse, persistent set of block anchors, sorted by height"""
+
+    def __init__(self, path=BLOCK_INDEX_PATH):
+        self.path = path
+        self._heights = []
+        self._anchors = []
+        self._dirty = False
+        if path and os.path.exists(path):
+            try:
+                with open(path) as f:
+                    for row in json.load(f):
+                        self.add(BlockAnchor(*row))
+            except (OSError, ValueError, TypeError):
+                print(f"⚠️  Ignoring unreadable block index: {path}")
+            self._dirty = False
+
+    def __len__(self):
+        return len(self._anchors)
+
+    def add(self, anchor):
+        index = bisect.bisect_left(self._heights, anchor.height)
+        if index < len(self._heights) and self._heights[index] == anchor.height:
+            return
+        self._heights.insert(index, anchor.height)
+        self._anchors.insert(index, anchor)
+        self._dirty = True
+
+    def get(self, height):
+        index = bisect.bisect_left(self._heights, height)
+        if index < len(self._heights) and self._heights[index] == height:
+            return self._anchors[index]
+        return None
+
+    def bracket(self, timestamp_us, low, high):
+        """The tightest known anchors with low ≤ before < timestamp ≤ after ≤ high (by height)"""
+        before, after = low, high
+        # Block timestamps grow with height, so the anchors are sorted by timestamp too
+        index = bisect.bisect_left([anchor.timestamp_us for anchor in self._anchors], timestamp_us)
+        if index > 0 and self._anchors[index - 1].height > before.height:
+            before = self._anchors[index - 1]
+        if index < len(self._anchors) and self._anchors[index].height < after.height:
+            after = self._anchors[index]
+        return before, after
+
+    def save(self):
+        """Atomically rewrite the index file, if anything was added"""
+        if not self.path or not self._dirty:
+            return
+        anchors = self._anchors[-MAX_ANCHORS:] if len(self._anchors) > MAX_ANCHORS else self._anchors
+        rows = [[a.height, a.timestamp_us, a.first_version, a.last_version] for a in anchors]
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(rows, f, separators=(",", ":"))
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+        except OSError as e:
+            print(f"⚠️  Could not save block index to {self.path}: {e}")
+
+
+class TimeResolver:
+    """Maps timestamps to ledger versions on one node, using and growing a BlockIndex"""
+
+    def __init__(self, client, node_url, index=None):
+        self.client = client
+        self.node_url = node_url
+        self.index = index if index is not None else BlockIndex()
+        self.requests = 0
+
+    async def _block(self, path):
+        self.requests += 1
+        block = await get_json(self.client, f"{self.node_url}/v1/blocks/{path}",
+                               params={"with_transactions": "false"})
+        if not block or "block_height" not in block:
+            raise Exception(f"Could not fetch block {path}")
+        anchor = BlockAnchor.from_block(block)
+        self.index.add(anchor)
+        return anchor
+
+    async def block_by_height(self, height):
+        return self.index.get(height) or await self._block(f"by_height/{height}")
+
+    async def block_by_version(self, version):
+        """The block containing `version`"""
+        return await self._block(f"by_version/{version}")
+
+    async def chain_bounds(self):
+        """(oldest, newest) block anchors the node can serve"""
+        self.requests += 1
+        info = await get_json(self.client, f"{self.node_url}/v1")
+        if not info or "block_height" not in info:
+            raise Exception("Could not fetch ledger info")
+        oldest = await self.block_by_height(int(info.get("oldest_block_height", 0)))
+        # The head block is always new, so it comes straight from its version
+        newest = await self.block_by_version(int(info["ledger_version"]))
+        return oldest, newest
+
+    async def version_at(self, timestamp_us, bounds=None):
+        """First version whose block timestamp is at or after `timestamp_us`
+
+        Returns the oldest available version for a timestamp before it, and
+        the version after the head for one in the future.
+        """
+        oldest, newest = bounds or await self.chain_bounds()
+        if timestamp_us <= oldest.timestamp_us:
+            return oldest.first_version
+        if timestamp_us > newest.timestamp_us:
+            return newest.last_version + 1
+
+        before, after = self.index.bracket(timestamp_us, oldest, newest)
+        step = 0
+        while after.height - before.height > 1:
+            span = after.height - before.height
+            if step % 2 == 0 and after.timestamp_us > before.timestamp_us:
+                # Interpolate: block times are roughly even over short spans...
+                fraction = (timestamp_us - before.timestamp_us) / (after.timestamp_us - before.timestamp_us)
+                height = before.height + int(fraction * span)
+            else:
+                # ...but bisect every other step so bursty stretches still converge
+                height = before.height + span // 2
+            height = min(max(height, before.height + 1), after.height - 1)
+            anchor = await self.block_by_height(height)
+            if anchor.timestamp_us < timestamp_us:
+                before = anchor
+            else:
+                after = anchor
+            step += 1
+        return after.first_version
+
+    async def version_range(self, start_time, end_time=None):
+        """(start_version, end_version) covering [start_time, end_time); end_time None means the head"""
+        bounds = await self.chain_bounds()
+        start_version = await self.version_at(to_micros(start_time), bounds)
+        if end_time is None:
+            end_version = bounds[1].last_version
+        else:
+            end_version = await self.version_at(to_micros(end_time), bounds) - 1
+        self.index.save()
+        return start_version, end_version
@@ -0,0 +1,251 @@
+"""
+Transaction fetching for the CASH scanners: single-version lookups and
+range-paged reads from the /v1/transactions listing endpoint.
+
+Responses are handled as raw bytes until the last moment, so a Prefilter
+can skip decoding transactions that never mention a watched token.
+
+Every response may come gzip-compressed. When the client prefers BCS, pages
+are asked for as application/x-bcs and screened straight from the binary;
+the few candidates are then fetched one by one as JSON for classification.
+Nodes that don't serve BCS, or pages that don't decode, fall back to JSON.
+
+Pages and lookups can be given a Hedger (see hedging.py), which races a
+slow request against a backup node.
+"""
+
+import asyncio
+
+import aiohttp
+
+from bcs import BCS_CONTENT_TYPE, BcsError
+from hedging import PAGE
+from metrics import PAGE_BYTES, VERSIONS_FETCHED
+from prefilter import decode_transaction, loads, split_page
+
+# Aptos fullnodes cap /v1/transactions pages at 100 by default
+MAX_PAGE_SIZE = 100
+
+# Times a throttled (HTTP 429) request is retried; the node's rate limiter
+# decides how long to wait in between
+MAX_THROTTLE_RETRIES = 5
+
+# Times a request that failed outright (HTTP 5xx, timeout, dropped connection)
+# is retried, after ERROR_RETRY_DELAY seconds doubling each time; the node's
+# rate limiter also eases off (and the failure is counted) in NodeClient.get
+MAX_ERROR_RETRIES = 2
+ERROR_RETRY_DELAY = 0.5
+
+FETCHED_FROM_NETWORK = VERSIONS_FETCHED.labels("network")
+FETCHED_FROM_STORE = VERSIONS_FETCHED.labels("store")
+JSON_PAGE_BYTES = PAGE_BYTES.labels("json")
+BCS_PAGE_BYTES = PAGE_BYTES.labels("bcs")
+
+BCS_HEADERS = {"Accept": BCS_CONTENT_TYPE}
+
+
+async def fetch_raw(client, url, params=None, headers=None):
+    """GET a node URL and return (raw body bytes, content type), or (None, None) on any failure
+
+    Throttled requests are retried once the rate limiter allows; 5xx
+    responses and transport errors are retried with backoff.
+    """
+    throttled = 0
+    errors = 0
+    while True:
+        try:
+            async with client.get(url, params=params, headers=headers) as response:
+                if response.status == 200:
+                    return await response.read(), response.content_type
+                elif response.status == 429:
+                    # The rate limiter has backed off; try again
+                    throttled += 1
+                    if throttled > MAX_THROTTLE_RETRIES:
+                        return None, None
+                    continue
+                elif response.status < 500:
+                    return None, None
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            pass
+        except Exception:
+            return None, None
+
+        errors += 1
+        if errors > MAX_ERROR_RETRIES:
+            return None, None
+        await asyncio.sleep(ERROR_RETRY_DELAY * 2 ** (errors - 1))
+
+
+async def get_raw(client, url, params=None):
+    """GET a node URL and return the raw body bytes, or None on any failure"""
+    raw, content_type = await fetch_raw(client, url, params)
+    return raw
+
+
+async def get_json(client, url, params=None):
+    """GET a node URL and return the decoded JSON body, or None on any failure"""
+    raw = await get_raw(client, url, params)
+    if raw is None:
+        return None
+    try:
+        return loads(raw)
+    except ValueError:
+        return None
+
+
+async def get_transaction_raw(client, node_url, version, hedger=None):
+    """Get a specific transaction's raw JSON bytes, from the local store if it has it
+
+    With a `hedger`, a slow lookup is also sent to a backup node.
+    """
+    if client.store is not None:
+        raw = client.store.get(version)
+        if raw is not None:
+            FETCHED_FROM_STORE.inc()
+            return raw
+
+    async def get_from(node):
+        return await get_raw(client, f"{node}/v1/transactions/by_version/{version}")
+
+    if hedger is not None:
+        raw = await hedger.fetch(get_from, node_url)
+    else:
+        raw = await get_from(node_url)
+    if raw is not None:
+        FETCHED_FROM_NETWORK.inc()
+        if client.store is not None:
+            client.store.put(version, raw)
+    return raw
+
+
+async def get_transaction(client, node_url, version, prefilter=None, hedger=None):
+    """Get a specific transaction by version"""
+    try:
+        return decode_transaction(await get_transaction_raw(client, node_url, version, hedger), version, prefilter)
+    except ValueError:
+        return None
+
+
+async def get_transactions_raw(client, node_url, start_version, limit, bcs=False):
+    """Get a page of up to `limit` transactions starting at `start_version`, as (raw bytes, content type)
+
+    With `bcs` the page is asked for as BCS; a node that doesn't serve it
+    answers with JSON instead.
+    """
+    params = {"start": str(start_version), "limit": str(limit)}
+    raw, content_type = await fetch_raw(client, f"{node_url}/v1/transactions", params,
+                                        BCS_HEADERS if bcs else None)
+    if raw is not None:
+        (BCS_PAGE_BYTES if content_type == BCS_CONTENT_TYPE else JSON_PAGE_BYTES).inc(len(raw))
+    return raw, content_type
+
+
+async def iter_transactions(client, node_url, start_version, end_version, page_size=MAX_PAGE_SIZE,
+                            prefilter=None, classifier=None, hedger=None):
+    """Yield (version, txn) for every version in [start_version, end_version], in order
+
+    Versions already in the client's local store are served from disk.
+    The rest come from range pages; versions missing from a page are
+    looked up one by one with get_transaction. `txn` is None when a version
+    could not be fetched at all. With a `prefilter`, transactions that
+    never mention a watched token are yielded as undecoded stand-ins, and
+    pages may come as BCS (see the module docstring); BCS pages aren't
+    written to the store. With a ClassifierPool as `classifier`, pages are
+    decoded and classified in its worker processes instead. With a
+    `hedger`, slow pages and lookups are raced against a backup node.
+    """
+    store = client.store
+    next_version = start_version
+    while next_version <= end_version:
+        limit = min(page_size, end_version - next_version + 1)
+
+        if store is not None:
+            cached = store.get_range(next_version, next_version + limit - 1)
+            while next_version in cached:
+                FETCHED_FROM_STORE.inc()
+                yield next_version, decode_transaction(cached.pop(next_version), next_version, prefilter)
+                next_version += 1
+            if next_version > end_version:
+                break
+            # Only fetch up to the next version the store already has
+            limit = min(end_version - next_version + 1, page_size)
+            if cached:
+                limit = min(limit, min(cached) - next_version)
+
+        async def get_page(node):
+            # BCS pages can only be screened against a watchlist, so they need a prefilter
+            bcs = prefilter is not None and client.accepts_bcs(node)
+            raw, content_type = await get_transactions_raw(client, node, next_version, limit, bcs)
+            return None if raw is None else (node, bcs, raw, content_type)
+
+        page = await hedger.fetch(get_page, node_url, PAGE) if hedger is not None else await get_page(node_url)
+        # A hedged page may have come from the backup, whose BCS support is its own
+        page_node, bcs, raw_page, content_type = page or (node_url, False, None, None)
+
+        page_txns = {}
+        decoded = None
+        if content_type == BCS_CONTENT_TYPE:
+            try:
+                screened = None
+                if classifier is not None:
+                    screened = await classifier.screen_bcs_page(raw_page, next_version)
+                if screened is None:
+                    screened = prefilter.screen_bcs_page(raw_page, next_version)
+            except BcsError as e:
+                # Ask for this page again as JSON
+                client.bcs_failed(page_node, e)
+                raw_page, content_type = await get_transactions_raw(client, page_node, next_version, limit)
+            else:
+                # Candidates are left out, so they're fetched one by one as JSON below
+                decoded = {version: txn for version, txn in screened.items() if next_version <= version <= end_version}
+                page_txns = {version: txn for version, txn in decoded.items() if txn is not None}
+        elif bcs and raw_page is not None:
+            client.bcs_unsupported(page_node)
+
+        if raw_page is not None and decoded is None:
+            if classifier is not None:
+                # Split, decoded and classified in a worker process; only the matches come back
+                decoded = await classifier.decode_page(raw_page, next_version, end_version)
+            if decoded is None or store is not None:
+                # The store needs every transaction's raw bytes either way
+                try:
+                    items = split_page(raw_page, next_version)
+                except ValueError:
+                    items = []
+                for version, raw in items:
+                    if next_version <= version <= end_version:
+                        page_txns[version] = raw
+                if decoded is None and prefilter is not None and page_txns:
+                    decoded = prefilter.decode_page(raw_page, page_txns.items())
+            else:
+                page_txns = decoded
+
+        # Every version the page covered, candidates included
+        page_versions = decoded if decoded is not None else page_txns
+        if not page_versions:
+            # Page failed or came back empty - make progress one version at a time
+            yield next_version, await get_transaction(client, node_url, next_version, prefilter, hedger)
+            next_version += 1
+            continue
+
+        FETCHED_FROM_NETWORK.inc(len(page_txns))
+        if store is not None and content_type != BCS_CONTENT_TYPE:
+            store.put_many(page_txns.items())
+
+        last_version = max(page_versions)
+        if len(page_versions) < limit and last_version - next_version + 1 == len(page_versions):
+            # A short, gap-free page means the node caps pages below what we asked for
+            page_size = len(page_versions)
+
+        for version in range(next_version, last_version + 1):
+            raw = page_txns.get(version)
+            if raw is None:
+                # Hole in the page - fall back to a single-version lookup
+                txn = await get_transaction(client, node_url, version, prefilter, hedger)
+            elif decoded is not None:
+                txn = decoded[version]
+            else:
+                txn = decode_transaction(raw, version)
+            yield version, txn
+
+        next_version = last_version + 1
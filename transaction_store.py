@@ -0,0 +1,144 @@
+"""
+Local on-disk transaction store, keyed by ledger version.
+
+Transactions at a given version never change, so once fetched they are
+kept in SQLite (zlib-compressed JSON) and served from disk on later scans.
+The store is capped in size and evicts the least recently used versions.
+It deals in raw JSON bytes so callers can prefilter before decoding.
+"""
+
+import sqlite3
+import time
+import zlib
+
+from aggregates import coin_store_changes
+from prefilter import dumps, loads
+
+STORE_PATH = "transactions.sqlite"
+STORE_MAX_BYTES = 2 * 1024 ** 3  # Compressed bytes kept on disk before eviction
+EVICT_TO_FRACTION = 0.9  # Evict down to this fraction of the cap
+STORE_SLIM = False  # Keep only the fields classification and reporting need
+
+
+def slim_transaction(txn):
+    """Keep just the fields is_cash_related_transaction and the reports read"""
+    payload = txn.get("payload") or {}
+    return {
+        "type": txn.get("type"),
+        "version": txn.get("version"),
+        "hash": txn.get("hash"),
+        "sender": txn.get("sender"),
+        "timestamp": txn.get("timestamp"),
+        "events": [{"type": event.get("type", ""), "guid": event.get("guid"), "data": event.get("data")}
+                   for event in txn.get("events", [])],
+        # The coin stores tell which coin each withdraw/deposit event moved
+        "changes": coin_store_changes(txn),
+        "payload": {
+            "function": payload.get("function", ""),
+            "type_arguments": payload.get("type_arguments", []),
+        } if payload else {},
+    }
+
+
+class TransactionStore:
+    """Version-keyed SQLite cache of transactions with LRU eviction"""
+
+    def __init__(self, path=STORE_PATH, max_bytes=STORE_MAX_BYTES, slim=STORE_SLIM):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.slim = slim
+        self.hits = 0
+        self.misses = 0
+        self._db = sqlite3.connect(path)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS transactions ("
+            "version INTEGER PRIMARY KEY, data BLOB NOT NULL, "
+            "size INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS transactions_lru ON transactions (last_access)")
+        self._db.commit()
+        self._bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM transactions").fetchone()[0]
+
+    def get(self, version):
+        """Get a stored transaction's raw JSON bytes, or None if it isn't stored"""
+        row = self._db.execute("SELECT data FROM transactions WHERE version = ?", (version,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._db.execute("UPDATE transactions SET last_access = ? WHERE version = ?", (time.time(), version))
+        self._db.commit()
+        return zlib.decompress(row[0])
+
+    def get_range(self, start_version, end_version):
+        """Get every stored transaction in [start_version, end_version] as {version: raw_bytes}"""
+        rows = self._db.execute(
+            "SELECT version, data FROM transactions WHERE version BETWEEN ? AND ?",
+            (start_version, end_version),
+        ).fetchall()
+        self.hits += len(rows)
+        self.misses += (end_version - start_version + 1) - len(rows)
+        if rows:
+            self._db.execute(
+                "UPDATE transactions SET last_access = ? WHERE version BETWEEN ? AND ?",
+                (time.time(), start_version, end_version),
+            )
+            self._db.commit()
+        return {version: zlib.decompress(data) for version, data in rows}
+
+    def put_many(self, items):
+        """Write (version, raw_bytes) pairs through to disk"""
+        now = time.time()
+        rows = []
+        for version, raw in items:
+            if self.slim:
+                # Slim mode has to decode to drop fields; full mode stores the node's bytes as-is
+                raw = dumps(slim_transaction(loads(raw)))
+            data = zlib.compress(raw)
+            rows.append((version, data, len(data), now))
+        if not rows:
+            return
+        # Replacing an existing version must not count its bytes twice
+        placeholders = ",".join("?" * len(rows))
+        replaced = self._db.execute(
+            f"SELECT COALESCE(SUM(size), 0) FROM transactions WHERE version IN ({placeholders})",
+            [row[0] for row in rows],
+        ).fetchone()[0]
+        self._db.executemany("INSERT OR REPLACE INTO transactions VALUES (?, ?, ?, ?)", rows)
+        self._db.commit()
+        self._bytes += sum(row[2] for row in rows) - replaced
+        if self._bytes > self.max_bytes:
+            self._evict()
+
+    def put(self, version, raw):
+        """Write one transaction's raw bytes through to disk"""
+        self.put_many([(version, raw)])
+
+    def size_bytes(self):
+        """Compressed bytes currently stored"""
+        return self._bytes
+
+    def close(self):
+        """Close the database"""
+        self._db.close()
+
+    def _evict(self):
+        """Drop least recently used versions until under the size target"""
+        target = self.max_bytes * EVICT_TO_FRACTION
+        while self._bytes > target:
+            rows = self._db.execute(
+                "SELECT version, size FROM transactions ORDER BY last_access LIMIT 1000"
+            ).fetchall()
+            if not rows:
+                self._bytes = 0
+                break
+            evict = []
+            for version, size in rows:
+                evict.append((version,))
+                self._bytes -= size
+                if self._bytes <= target:
+                    break
+            self._db.executemany("DELETE FROM transactions WHERE version = ?", evict)
+            self._db.commit()
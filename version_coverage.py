@@ -0,0 +1,81 @@
+"""
+Shared coverage tracking so the historical backfill and the live tail
+never fetch the same version twice.
+
+The tracker is an interval set of claimed versions. A scanner claims a
+range before fetching it and only fetches the pieces nobody claimed
+first. The live tail owns every version from its hand-off point up, and
+the backfill is clamped to stop right below it.
+"""
+
+import bisect
+
+
+class CoverageTracker:
+    """Interval set of versions claimed by the scanners sharing one process"""
+
+    def __init__(self):
+        self._starts = []  # Sorted starts of disjoint, non-adjacent intervals
+        self._ends = []
+        self.tail_start = None  # First version owned by the live tail, once it has started
+
+    def claim(self, start_version, end_version):
+        """Claim [start_version, end_version]; returns the sub-ranges that weren't already claimed"""
+        if end_version < start_version:
+            return []
+        unclaimed = []
+        next_version = start_version
+        index = bisect.bisect_right(self._starts, start_version) - 1
+        if index >= 0 and self._ends[index] >= start_version:
+            next_version = self._ends[index] + 1
+        index += 1
+        while index < len(self._starts) and self._starts[index] <= end_version:
+            if self._starts[index] > next_version:
+                unclaimed.append((next_version, self._starts[index] - 1))
+            next_version = max(next_version, self._ends[index] + 1)
+            index += 1
+        if next_version <= end_version:
+            unclaimed.append((next_version, end_version))
+        self._add(start_version, end_version)
+        return unclaimed
+
+    def _add(self, start_version, end_version):
+        # Merge with every interval that overlaps or touches the new one
+        low = bisect.bisect_left(self._ends, start_version - 1)
+        high = bisect.bisect_right(self._starts, end_version + 1)
+        if low < high:
+            start_version = min(start_version, self._starts[low])
+            end_version = max(end_version, self._ends[high - 1])
+        self._starts[low:high] = [start_version]
+        self._ends[low:high] = [end_version]
+
+    def is_claimed(self, version):
+        index = bisect.bisect_right(self._starts, version) - 1
+        return index >= 0 and self._ends[index] >= version
+
+    def claimed_count(self):
+        return sum(end - start + 1 for start, end in zip(self._starts, self._ends))
+
+    def ranges(self):
+        """Claimed [start, end] ranges, sorted"""
+        return [[start, end] for start, end in zip(self._starts, self._ends)]
+
+    def start_tail(self, head_version):
+        """Hand the chain tip to the live tail; returns the first version the tail must process
+
+        If a backfill has already claimed versions, the tail starts right
+        after the last of them, whether that is below the head (nothing is
+        left uncovered in between) or above it (nothing is fetched twice).
+        Otherwise it starts after the current head.
+        """
+        tail_start = head_version + 1
+        if self._ends:
+            tail_start = self._ends[-1] + 1
+        self.tail_start = tail_start
+        return tail_start
+
+    def backfill_end(self, end_version):
+        """Last version a backfill should cover: right below the live tail's start, once it has one"""
+        if self.tail_start is None:
+            return end_version
+        return self.tail_start - 1
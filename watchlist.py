@@ -0,0 +1,217 @@
+"""
+Configurable watchlist of token and pool type tags, matched in one pass.
+
+Every watched type tag is compiled into a single trie-factored regex, so a
+transaction's event types, function and type arguments are each searched
+once however many tokens are watched, and every match maps straight back
+to the labels it belongs to. The raw prefilter uses a trie too, anchored
+on the "::" after each address. A watchlist file is either JSON ({"LABEL": "type_tag", ...}) or
+one "LABEL type_tag" pair per line, with # comments.
+"""
+
+import hashlib
+import json
+import re
+
+# Addresses inside type tags, as 0x-prefixed hex
+_ADDRESS = re.compile(r"\b0x([0-9a-fA-F]+)")
+
+# The coin the framework pairs with the fungible asset at 0xa; every other
+# pairing lives at a named object of 0xa, seeded with the coin's type name
+APTOS_COIN = "0x1::aptos_coin::AptosCoin"
+FUNGIBLE_ASSET_ADDRESS = 0xa
+OBJECT_FROM_SEED_SCHEME = b"\xfe"
+
+
+def normalize_type_tag(tag):
+    """Write every address in a type tag the way the node API does
+
+    Special addresses (0x0-0xf) are short, everything else is 64 hex digits.
+    """
+    def address(match):
+        value = int(match.group(1), 16)
+        return f"0x{value:x}" if value < 16 else f"0x{value:064x}"
+
+    return _ADDRESS.sub(address, tag.strip())
+
+
+def address_key(address):
+    """An address in one spelling whatever its leading zeros ("0x" + short hex), or None if it isn't one"""
+    try:
+        return f"0x{int(address, 16):x}"
+    except (TypeError, ValueError):
+        return None
+
+
+def paired_metadata_address(tag):
+    """Address of the fungible asset metadata the framework pairs with coin type `tag`
+
+    Accounts migrated to fungible assets hold their coins in FungibleStores
+    that point at this address rather than naming the coin type.
+    """
+    tag = normalize_type_tag(tag)
+    if tag == APTOS_COIN:
+        return address_key(hex(FUNGIBLE_ASSET_ADDRESS))
+    # type_info::type_name writes addresses short
+    type_name = _ADDRESS.sub(lambda match: address_key(match.group(0)), tag)
+    seed = FUNGIBLE_ASSET_ADDRESS.to_bytes(32, "big") + type_name.encode() + OBJECT_FROM_SEED_SCHEME
+    return address_key(hashlib.sha3_256(seed).hexdigest())
+
+
+def trie_pattern(strings):
+    """Regex source matching any of `strings`, factored into a prefix trie
+
+    Alternatives that share a prefix are only compared once, so the search
+    cost grows with the trie's depth rather than the number of strings.
+    Longer strings win over their own prefixes.
+    """
+    trie = {}
+    for string in strings:
+        node = trie
+        for char in string:
+            node = node.setdefault(char, {})
+        node[""] = True
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        if len(branches) == 1 and "" not in node:
+            return branches[0]
+        return "(?:" + "|".join(branches) + ")" + ("?" if "" in node else "")
+
+    return build(trie)
+
+
+def compile_raw_search(tags):
+    """A function telling whether raw bytes contain any of the `tags` (bytes), in one regex pass
+
+    Every hash and address in a response starts with "0x", so a trie
+    starting at the address would be tried all over every page. Instead the
+    regex is anchored on the "::module::Struct..." part of the tags, which
+    is far rarer, and the address right before a hit is checked afterwards.
+    """
+    addresses = {}  # "::module::Struct..." -> addresses in front of it
+    for tag in tags:
+        address, sep, rest = tag.partition(b"::")
+        addresses.setdefault(sep + rest, set()).add(address)
+    # The regex prefers the longest suffix, so a hit also has to check the suffixes it starts with
+    candidates = {rest: [address for other in addresses if rest.startswith(other) for address in addresses[other]]
+                  for rest in addresses}
+    search = re.compile(trie_pattern([rest.decode() for rest in addresses]).encode()).search
+
+    def contains_any(raw):
+        match = search(raw)
+        while match is not None:
+            start = match.start()
+            for address in candidates[match.group()]:
+                if raw[start - len(address):start] == address:
+                    return True
+            match = search(raw, start + 1)
+        return False
+
+    return contains_any
+
+
+class Watchlist:
+    """Labelled type tags to watch, e.g. {"CASH": "0x61ed...::CASH::CASH"}"""
+
+    def __init__(self, tokens):
+        self.tokens = {}  # label -> normalized type tag
+        for label, tag in dict(tokens).items():
+            if "::" not in tag:
+                raise ValueError(f"Invalid type tag for {label}: {tag!r} (expected 0xADDRESS::module::Struct)")
+            self.tokens[label] = normalize_type_tag(tag)
+        if not self.tokens:
+            raise ValueError("The watchlist is empty")
+        self.labels = list(self.tokens)
+        self.tags = sorted(set(self.tokens.values()))
+        # A tag that contains another watched tag matches both: resolve that once here,
+        # not per transaction
+        self._labels_by_tag = {tag: frozenset(label for label, watched in self.tokens.items() if watched in tag)
+                               for tag in self.tags}
+        self._pattern = re.compile(trie_pattern(self.tags))
+        self._labels_by_metadata = {}
+        for label, tag in self.tokens.items():
+            self._labels_by_metadata.setdefault(paired_metadata_address(tag), set()).add(label)
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def describe(self):
+        return ", ".join(self.labels)
+
+    def mentions(self, text):
+        """Whether `text` mentions any watched tag"""
+        return self._pattern.search(text) is not None
+
+    def tokens_in(self, text):
+        """Labels of the watched tags `text` mentions, as a set"""
+        labels = set()
+        for tag in self._pattern.findall(text):
+            labels |= self._labels_by_tag[tag]
+        return labels
+
+    def coin_labels(self, coin):
+        """Labels watching a coin type, or the coin paired with a fungible asset metadata address"""
+        if "::" in coin:
+            return self.tokens_in(normalize_type_tag(coin))
+        return set(self._labels_by_metadata.get(address_key(coin), ()))
+
+    def match(self, txn):
+        """Labels of every watched token a user transaction mentions, in watchlist order ([] for none)"""
+        if not txn or txn.get("type") != "user_transaction":
+            return []
+        found = []
+        findall = self._pattern.findall
+        for event in txn.get("events", ()):
+            found += findall(event.get("type", ""))
+        payload = txn.get("payload")
+        if payload:
+            found += findall(payload.get("function", ""))
+            for arg in payload.get("type_arguments", ()):
+                found += findall(arg)
+        if not found:
+            return []
+        labels = set()
+        for tag in found:
+            labels |= self._labels_by_tag[tag]
+        return [label for label in self.labels if label in labels]
+
+
+def load_watchlist_file(path):
+    """{label: type_tag} from a JSON object or "LABEL type_tag" lines"""
+    with open(path) as f:
+        text = f.read()
+    if text.lstrip().startswith("{"):
+        tokens = json.loads(text)
+        if not all(isinstance(tag, str) for tag in tokens.values()):
+            raise ValueError(f"{path}: every watchlist entry must map a label to a type tag")
+        return tokens
+    tokens = {}
+    for number, line in enumerate(text.splitlines(), 1):
+        line = line.split("#", 1)[0].strip()
+        if not line:
+            continue
+        parts = line.split()
+        if len(parts) != 2:
+            raise ValueError(f"{path}:{number}: expected 'LABEL type_tag', got {line!r}")
+        tokens[parts[0]] = parts[1]
+    return tokens
+
+
+def parse_token(text):
+    """'LABEL=type_tag' from the command line as (label, type_tag)"""
+    label, sep, tag = text.partition("=")
+    if not sep or not label.strip() or "::" not in tag:
+        raise ValueError(f"Invalid token {text!r} (expected LABEL=0xADDRESS::module::Struct)")
+    return label.strip(), tag.strip()
+
+
+def build_watchlist(default, path=None, tokens=()):
+    """The watchlist for a run: `path` replaces the `default` {label: tag}, `tokens` are added on top"""
+    watched = load_watchlist_file(path) if path else dict(default)
+    for text in tokens:
+        label, tag = parse_token(text)
+        watched[label] = tag
+    return Watchlist(watched)